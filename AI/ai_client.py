@@ -3,9 +3,18 @@ AI客户端模块
 封装与AI API的交互逻辑
 """
 
+import re
 import requests
 import json
+import threading
 import traceback
+from contextlib import contextmanager
+
+
+# 当前线程正在执行的任务名，用于按任务统计提示词缓存命中
+_task_local = threading.local()
+# 错误信息中单独出现的 n（如 'n' is not supported、Invalid value for n），表示接口不支持 n 参数
+_N_PARAM_ERROR = re.compile(r"(?<![A-Za-z0-9_])[\"'`]?n[\"'`]?(?![A-Za-z0-9_])")
 
 
 class AIClient:
@@ -25,6 +34,75 @@ class AIClient:
         self.api_base = api_base
         self.model = model
         self.timeout = timeout
+        # 按任务累计的 Token 用量 {任务名: {"calls", "prompt_tokens", "cache_hit_tokens", "reported_prompt_tokens"}}
+        self.usage_stats = {}
+        self._stats_lock = threading.Lock()
+        # 不支持 n 参数（一次返回多个候选）的接口 {(api_base, model), ...}
+        self._n_unsupported = set()
+
+    @contextmanager
+    def task(self, name):
+        """标记当前线程中的请求所属任务（可嵌套，退出时恢复外层任务）"""
+        previous = getattr(_task_local, "name", None)
+        _task_local.name = name
+        try:
+            yield
+        finally:
+            _task_local.name = previous
+
+    @staticmethod
+    def parse_cache_hit_tokens(usage):
+        """
+        解析接口返回的提示词缓存命中 Token 数
+        DeepSeek：usage.prompt_cache_hit_tokens；OpenAI：usage.prompt_tokens_details.cached_tokens
+        Returns:
+            命中 Token 数；接口未返回缓存信息时为 None
+        """
+        hit = usage.get("prompt_cache_hit_tokens")
+        if hit is None:
+            hit = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        return hit
+
+    def _record_usage(self, usage):
+        """累计本次请求的用量并打印缓存命中率"""
+        task = getattr(_task_local, "name", None) or "其他"
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        hit = self.parse_cache_hit_tokens(usage)
+        with self._stats_lock:
+            stats = self.usage_stats.setdefault(task, {"calls": 0, "prompt_tokens": 0, "cache_hit_tokens": 0, "reported_prompt_tokens": 0})
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            if hit is not None:
+                stats["cache_hit_tokens"] += hit
+                stats["reported_prompt_tokens"] += prompt_tokens
+            total_rate = stats["cache_hit_tokens"] / stats["reported_prompt_tokens"] if stats["reported_prompt_tokens"] else 0.0
+        if hit is not None:
+            rate = hit / prompt_tokens if prompt_tokens else 0.0
+            print(f"  - 缓存命中Token数: {hit}（{rate:.0%}）")
+            print(f"[信息] 提示词缓存命中率（{task}）：本次 {rate:.0%}，累计 {total_rate:.0%}（{stats['calls']} 次请求）")
+
+    def usage_report(self):
+        """
+        各任务的提示词缓存命中情况
+        Returns:
+            [(任务名, 请求数, 输入Token, 命中Token, 命中率或 None), ...]，按输入Token降序
+        """
+        with self._stats_lock:
+            rows = []
+            for task, stats in self.usage_stats.items():
+                rate = stats["cache_hit_tokens"] / stats["reported_prompt_tokens"] if stats["reported_prompt_tokens"] else None
+                rows.append((task, stats["calls"], stats["prompt_tokens"], stats["cache_hit_tokens"], rate))
+        return sorted(rows, key=lambda row: -row[2])
+
+    def log_usage_report(self):
+        """打印本次运行各任务的提示词缓存命中情况"""
+        rows = self.usage_report()
+        if not rows:
+            return
+        print("[信息] 本次运行各任务的提示词缓存命中情况：")
+        for task, calls, prompt_tokens, hit, rate in rows:
+            rate_text = f"{rate:.0%}" if rate is not None else "接口未返回"
+            print(f"  - {task}：{calls} 次请求，输入 {prompt_tokens} Tokens，命中 {hit} Tokens（{rate_text}）")
     
 
     def generate_content(self, system_prompt, user_prompt, temperature, max_tokens):
@@ -126,6 +204,7 @@ class AIClient:
                             print(f"  - 输入Token数: {prompt_tokens}")
                             print(f"  - 输出Token数: {completion_tokens} (限制: {max_tokens})")
                             print(f"  - 总Token数: {total_tokens}")
+                            self._record_usage(usage)
                             if completion_tokens >= max_tokens * 0.9:
                                 print(f"[警告] 输出Token数接近限制，可能被截断！")
                         
@@ -176,6 +255,64 @@ class AIClient:
             traceback.print_exc()
             return f"❌ 生成方法异常: {str(e)}"
     
+    def generate_choices(self, system_prompt, user_prompt, temperature, max_tokens, n):
+        """
+        使用 n 参数一次请求多个候选结果（输入只计费一次）
+        接口不支持 n 参数（报错或只返回一个结果）时记住该接口，之后直接返回空列表，由调用方改为并行请求
+        
+        返回:
+            [候选文本, ...]（可能少于 n 个）；请求失败时为 [以 ❌ 开头的错误信息]
+        """
+        key = (self.api_base, self.model)
+        if n <= 1 or key in self._n_unsupported:
+            return []
+        try:
+            url = f"{self.api_base.rstrip('/')}/chat/completions"
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}"
+            }
+            data = {
+                "model": self.model,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "n": n,
+                "stream": False
+            }
+            print(f"[调试] 请求 {n} 个候选结果（n 参数），使用模型: {self.model}")
+            response = requests.post(url, headers=headers, data=json.dumps(data), timeout=self.timeout)
+            print(f"[调试] API响应状态码: {response.status_code}")
+            if response.status_code in (400, 422):
+                # 只有错误信息指向 n 参数时才记为不支持；上下文超长等其他错误交由并行请求重试并报告
+                if _N_PARAM_ERROR.search(response.text or ""):
+                    print(f"[信息] 接口不支持 n 参数，改为并行请求: {response.text[:200]}")
+                    self._n_unsupported.add(key)
+                else:
+                    print(f"[警告] 多候选请求被拒绝，改为并行请求: {response.text[:200]}")
+                return []
+            if response.status_code != 200:
+                return [f"❌ API请求失败 (状态码: {response.status_code})\n响应内容: {response.text[:200]}"]
+            result = response.json()
+            if "usage" in result:
+                self._record_usage(result["usage"])
+            choices = [(choice.get("message") or {}).get("content") or "" for choice in result.get("choices", [])]
+            if len(choices) < n:
+                print(f"[信息] 接口只返回了 {len(choices)}/{n} 个候选，之后改为并行请求")
+                self._n_unsupported.add(key)
+            choices = [text.strip() for text in choices if text.strip()]
+            return choices
+        except requests.exceptions.Timeout:
+            print("[错误] 请求超时")
+            return ["❌ 请求超时，请稍后重试"]
+        except Exception as e:
+            print(f"[错误] generate_choices 方法异常: {type(e).__name__}: {str(e)}")
+            traceback.print_exc()
+            return [f"❌ 网络请求错误: {str(e)}"]
+
     def update_config(self, api_key=None, api_base=None, model=None, timeout=None):
         """
         更新API配置
@@ -0,0 +1,185 @@
+"""
+上下文装配模块
+提示词由若干候选段落组成（设定、前情摘要、已有正文……），每段有优先级与估算的 Token 数。
+装配器在目标预算内为每一段选择一种形式——完整、替代的简短形式、截断、或省略——
+使保留下来的优先级总和最大（分组背包），并记录每一段的取舍，便于解释提示词为何是现在的样子。
+
+必需段落（任务说明、输出格式等）不会被省略；若连必需段落的最短形式都超出预算，则按最短形式输出并提示超出。
+"""
+
+
+# 截断形式：保留比例与价值折扣
+TRUNCATE_LEVELS = ((0.5, 0.6), (0.25, 0.35))
+# 背包计算的 Token 粒度上限（预算被划分为至多这么多个单位）
+MAX_BUDGET_UNITS = 400
+
+
+class Section:
+    """提示词中的一个候选段落"""
+
+    def __init__(self, key, text, priority=50, required=False, header="", alternatives=None, truncate=None):
+        """
+        Args:
+            key: 段落标识（用于取舍说明）
+            text: 段落正文
+            priority: 优先级，越大越重要
+            required: 是否不可省略
+            header: 段落标题（如“【相关设定】”），截断时保留
+            alternatives: 替代的简短形式 [(正文, 价值比例), ...]，如用最近一章摘要代替前三章摘要
+            truncate: 允许截断时保留的一端："head" 保留开头，"tail" 保留结尾；None 表示不可截断
+        """
+        self.key = key
+        self.text = text or ""
+        self.priority = priority
+        self.required = required
+        self.header = header
+        self.alternatives = alternatives or []
+        self.truncate = truncate
+
+    def render(self, body):
+        return f"{self.header}\n{body}" if self.header else body
+
+    def truncated(self, ratio):
+        """保留正文的 ratio 比例，并标注省略"""
+        keep = max(1, int(len(self.text) * ratio))
+        if self.truncate == "tail":
+            return "……（前文略）" + self.text[-keep:]
+        return self.text[:keep] + "……（后文略）"
+
+    def forms(self):
+        """
+        该段落可选的全部形式
+        Returns:
+            [(动作说明, 渲染文本, 价值), ...]；可省略时包含 ("省略", "", 0)
+        """
+        forms = [("完整", self.render(self.text), float(self.priority))]
+        for i, (alt_text, weight) in enumerate(self.alternatives):
+            forms.append((f"替代形式{i + 1}", self.render(alt_text), self.priority * weight))
+        if self.truncate and self.text:
+            for ratio, weight in TRUNCATE_LEVELS:
+                forms.append((f"截断至{int(ratio * 100)}%", self.render(self.truncated(ratio)), self.priority * weight))
+        if not self.required:
+            forms.append(("省略", "", 0.0))
+        return forms
+
+
+class PackResult:
+    """装配结果"""
+
+    def __init__(self, task, budget, parts, decisions, tokens):
+        self.task = task
+        self.budget = budget
+        self.parts = parts
+        # [(段落标识, 动作说明, 完整 Token, 实际 Token), ...]
+        self.decisions = decisions
+        self.tokens = tokens
+
+    @property
+    def text(self):
+        return "\n\n".join(self.parts)
+
+    @property
+    def changed(self):
+        return any(action != "完整" for _, action, _, _ in self.decisions)
+
+    def explain(self):
+        """取舍说明，如：约 5200/6000 Tokens；前序摘要 截断至50%（1800→900）"""
+        notes = [f"{key} {action}（{full}→{used}）" for key, action, full, used in self.decisions if action != "完整"]
+        head = f"约 {self.tokens}/{self.budget} Tokens"
+        if self.tokens > self.budget:
+            head += "（必需内容已超出预算）"
+        return head + ("；" + "；".join(notes) if notes else "；全部段落完整保留")
+
+
+def pack(sections, budget, estimate, task=""):
+    """
+    在预算内为各段落选择形式
+    Args:
+        sections: [Section, ...]（按输出顺序）
+        budget: 目标 Token 预算
+        estimate: Token 估算函数
+        task: 任务名（用于说明）
+    Returns:
+        PackResult
+    """
+    sections = [s for s in sections if s.text or s.required]
+    options = []
+    for section in sections:
+        forms = []
+        for action, text, value in section.forms():
+            forms.append((action, text, value, estimate(text) if text else 0))
+        options.append(forms)
+
+    full_tokens = [forms[0][3] for forms in options]
+    if sum(full_tokens) <= budget:
+        choice = [0] * len(sections)
+    else:
+        choice = _knapsack(options, budget)
+    chosen = [list(forms[idx][:2]) + [forms[idx][3]] for forms, idx in zip(options, choice)]
+
+    # 截断档位是离散的，剩余预算按优先级从高到低放宽被截断的段落
+    remaining = budget - sum(tokens for _, _, tokens in chosen)
+    for i in sorted(range(len(sections)), key=lambda i: -sections[i].priority):
+        action, _, tokens = chosen[i]
+        if remaining <= 0 or not action.startswith("截断"):
+            continue
+        section = sections[i]
+        ratio = min(1.0, (tokens + remaining) / max(1, full_tokens[i])) * 0.98
+        text = section.render(section.truncated(ratio))
+        new_tokens = estimate(text)
+        if tokens < new_tokens <= tokens + remaining:
+            chosen[i] = [f"截断至{int(ratio * 100)}%", text, new_tokens]
+            remaining -= new_tokens - tokens
+
+    parts, decisions, total = [], [], 0
+    for section, (action, text, tokens), full in zip(sections, chosen, full_tokens):
+        decisions.append((section.key, action, full, tokens))
+        if text:
+            parts.append(text)
+            total += tokens
+    return PackResult(task, budget, parts, decisions, total)
+
+
+def _knapsack(options, budget):
+    """
+    分组背包：每组（段落）恰选一种形式，总 Token 不超过预算时价值最大
+    必需段落无法全部放入时，退化为各段取最省 Token 的形式
+    Returns:
+        各段落选中的形式下标
+    """
+    unit = max(1, -(-budget // MAX_BUDGET_UNITS))
+    capacity = budget // unit
+    costs = [[-(-form[3] // unit) for form in forms] for forms in options]
+
+    NEG = float("-inf")
+    best = [0.0] + [NEG] * capacity
+    picks = []
+    for forms, form_costs in zip(options, costs):
+        new_best = [NEG] * (capacity + 1)
+        pick = [-1] * (capacity + 1)
+        for used in range(capacity + 1):
+            if best[used] == NEG:
+                continue
+            for i, (form, cost) in enumerate(zip(forms, form_costs)):
+                total = used + cost
+                if total > capacity:
+                    continue
+                value = best[used] + form[2]
+                # 同等价值时偏向排在前面的（更完整的）形式
+                if value > new_best[total]:
+                    new_best[total] = value
+                    pick[total] = i
+        picks.append(pick)
+        best = new_best
+
+    end = max(range(capacity + 1), key=lambda c: (best[c], -c))
+    if best[end] == NEG:
+        return [min(range(len(forms)), key=lambda i: forms[i][3]) for forms in options]
+
+    choice = [0] * len(options)
+    used = end
+    for g in range(len(options) - 1, -1, -1):
+        i = picks[g][used]
+        choice[g] = i
+        used -= costs[g][i]
+    return choice
@@ -4,10 +4,22 @@
 """
 import re
 import datetime
+from AI.context_packer import Section, pack
 
 class PromptBuilder:
     """提示词构建器类"""
 
+    # 用户提示词的目标 Token 预算，超出时由上下文装配器取舍（见 AI/context_packer.py）
+    CONTEXT_TOKEN_BUDGET = 12000
+
+    # 缓存友好布局：接口会对重复的提示词前缀打折（如 DeepSeek、OpenAI 的上下文缓存），
+    # 开启后系统提示词不再包含章节字数，各提示词中稳定的内容（设定、任务说明、输出格式）排在前面，
+    # 本章才有的内容排在后面。由 config.ini 的 [APP] cache_friendly_prompts 控制。
+    CACHE_FRIENDLY_LAYOUT = False
+    # 缓存友好布局下正文创作提示词的段落顺序（越靠前越稳定）
+    USER_PROMPT_CACHE_ORDER = ("相关设定", "前序章节背景", "前一章创作提示", "相关人物关系", "未回收伏笔",
+                               "相关旧章回顾", "本章剧情策划", "后续章节剧情参考", "本章前文摘要", "当前章节已有内容", "创作要求")
+
     @staticmethod
     def build_system_prompt(novel_type, writing_style, word_count=4000):
         """
@@ -29,10 +41,44 @@ class PromptBuilder:
     3. 严格按照【当前章节创作提示】写作小说内容
     4. 注意与前后章节的连贯性，做好承上启下
     5. 请直接输出正文内容，不要包含标题或任何说明性文字
-    6. 每个章节字数在{word_count}字左右
     """
+        if not PromptBuilder.CACHE_FRIENDLY_LAYOUT:
+            system_prompt += f"6. 每个章节字数在{word_count}字左右\n    "
         return system_prompt
 
+    @staticmethod
+    def append_word_count(user_prompt, word_count):
+        """缓存友好布局下，字数要求附在用户提示词末尾（系统提示词保持不变）"""
+        if not PromptBuilder.CACHE_FRIENDLY_LAYOUT:
+            return user_prompt
+        return f"{user_prompt}\n\n【字数要求】本章字数在{word_count}字左右。"
+
+    @staticmethod
+    def estimate_tokens(text):
+        """
+        粗略估算文本的 Token 数（无需分词器）
+        中日韩字符约 0.6 Token/字，其余字符约 4 字符/Token
+        """
+        if not text:
+            return 0
+        text = str(text)
+        cjk = len(re.findall(r'[\u3000-\u9fff\uff00-\uffef]', text))
+        return int(cjk * 0.6 + (len(text) - cjk) / 4) + 1
+
+    @staticmethod
+    def _pack(task, sections, budget=None, cache_order=None):
+        """
+        按预算装配各段落；有段落被截断、替换或省略时打印取舍说明
+        cache_order: 缓存友好布局下的段落顺序（段落标识列表），未列出的段落保持原顺序排在其后
+        """
+        if PromptBuilder.CACHE_FRIENDLY_LAYOUT and cache_order:
+            rank = {key: i for i, key in enumerate(cache_order)}
+            sections = sorted(sections, key=lambda section: rank.get(section.key, len(rank)))
+        result = pack(sections, budget or PromptBuilder.CONTEXT_TOKEN_BUDGET, PromptBuilder.estimate_tokens, task)
+        if result.changed or result.tokens > result.budget:
+            print(f"[调试] 上下文装配（{task}）：{result.explain()}")
+        return result.text
+
     @staticmethod
     def _strip_chapter_prefix(title_text):
         """移除如 '第12章' 前缀，保留纯标题"""
@@ -133,7 +179,27 @@ class PromptBuilder:
         return "\n".join(lines).strip()
 
     @staticmethod
-    def build_user_prompt(instruction, chapter_list=None, current_index=None, settings="", chapter_title="", current_chapter_content="", chapter_plan=None):
+    def build_prompt_card_prompt(kind_label, name, text, max_chars):
+        """
+        将一条设定资料提炼为精简的提示词卡片
+        """
+        return PromptBuilder._pack("提示词卡片", [
+            Section("任务", f"【任务：提炼{kind_label}卡片】\n\n以下是条目【{name}】的原始资料，请提炼为不超过{max_chars}字的卡片，供写作模型创作时参考。", required=True),
+            Section("原始资料", text, required=True, header="【原始资料】：", truncate="head"),
+            Section("指令", "【处理指令】\n1. 只保留影响正文创作的事实：身份、外貌、性格、能力、规则、关键关系与禁忌。\n2. 删除写作思路、备忘、修改记录等面向作者的内容。\n3. 使用简洁的短句，不要编造原文没有的信息。\n\n请直接输出卡片内容，不要输出条目名与标题。", required=True),
+        ])
+
+    @staticmethod
+    def _open_hooks_section(open_hooks):
+        """尚未回收的伏笔段落，预算不足时保留最近埋下的；没有伏笔时返回 None"""
+        if not open_hooks:
+            return None
+        lines = [f"- 第{num}章埋下：{hook}" for num, hook in open_hooks]
+        return Section("未回收伏笔", "\n".join(lines), priority=45, truncate="tail",
+                       header="【尚未回收的伏笔（可视剧情需要呼应或回收，不必全部处理）】")
+
+    @staticmethod
+    def build_user_prompt(instruction, chapter_list=None, current_index=None, settings="", chapter_title="", current_chapter_content="", chapter_plan=None, recalled_chapters=None, relations=None, open_hooks=None, earlier_summary="", budget=None):
         """
         构建用户提示词
         
@@ -145,20 +211,25 @@ class PromptBuilder:
             chapter_title (str, optional): 当前章节标题
             current_chapter_content (str, optional): 当前章节已有的内容（用于续写）
             chapter_plan (dict, optional): 章节策划信息（高潮、钩子、场景）
+            recalled_chapters (list, optional): 需要额外回顾的旧章节索引（本章涉及的人物/设定上次出场的章节）
+            relations (str, optional): 本章涉及人物的当前关系（来自关系图）；提供时不再附加前三章的关系变动
+            open_hooks (list, optional): 尚未回收的伏笔 [(埋下的章节序号, 钩子), ...]
+            earlier_summary (str, optional): 本章较早部分的摘要（续写长章节时）；提供时 current_chapter_content 只是结尾原文
+            budget (int, optional): Token 预算，默认 CONTEXT_TOKEN_BUDGET
             
         Returns:
             str: 格式化后的用户提示词
         """
-        parts = []
+        sections = []
         
         # 1. 设定信息（如果有）
         if settings:
-            parts.append(f"【相关设定】\n{settings}")
+            sections.append(Section("相关设定", settings, priority=60, header="【相关设定】", truncate="head"))
         
         # 2. 前一章的创作提示
         prev_prompt = PromptBuilder.get_previous_chapter_prompt(chapter_list, current_index)
         if prev_prompt:
-            parts.append(f"【前一章创作提示】\n{prev_prompt}")
+            sections.append(Section("前一章创作提示", prev_prompt, priority=40, header="【前一章创作提示】", truncate="head"))
         
         # 3. 章节策划（高潮、钩子、概述）
         if chapter_plan or instruction:
@@ -171,11 +242,11 @@ class PromptBuilder:
                 plan_str += f"- 内容概述：\n{instruction}\n"
                 
             if plan_str:
-                parts.append(f"【本章剧情策划】\n{plan_str.strip()}")
+                sections.append(Section("本章剧情策划", plan_str.strip(), required=True, header="【本章剧情策划】"))
 
-        # 5. 前三章摘要 (增强上下文)
+        # 5. 前三章摘要 (增强上下文)；预算不足时只保留最近一章
         if chapter_list and current_index is not None and current_index > 0:
-            sum_parts = []
+            chapter_blocks = []
             cur_start = max(0, current_index - 3)
             for i in range(cur_start, current_index):
                 ch = chapter_list[i]
@@ -183,24 +254,55 @@ class PromptBuilder:
                 # 优先使用精炼摘要，无摘要则使用原概述
                 ch_sum = ch.get('summary', '').strip() or ch.get('prompt', '').strip()
                 if ch_sum:
-                    sum_parts.append(f"- {ch_title}剧情: {ch_sum}")
+                    block = f"- {ch_title}剧情: {ch_sum}"
                     
                     # 仅附加本章后的关系快照（状态已累加至档案，此处移除以去重）
-                    ch_rel = ch.get('char_relations', '').strip()
+                    ch_rel = ch.get('char_relations', '').strip() if relations is None else ""
                     if ch_rel:
-                        sum_parts.append(f"  * 角色关系变动: {ch_rel}")
+                        block += f"\n  * 角色关系变动: {ch_rel}"
+                    chapter_blocks.append(block)
             
-            if sum_parts:
-                parts.append("【前序章节背景（剧情、状态及关系回顾）】\n" + "\n".join(sum_parts))
+            if chapter_blocks:
+                alternatives = [(chapter_blocks[-1], 0.6)] if len(chapter_blocks) > 1 else []
+                sections.append(Section("前序章节背景", "\n".join(chapter_blocks), priority=70,
+                                        header="【前序章节背景（剧情、状态及关系回顾）】",
+                                        alternatives=alternatives, truncate="tail"))
+
+        # 5.1 本章涉及人物的当前关系
+        if relations:
+            sections.append(Section("相关人物关系", relations, priority=50, header="【相关人物关系】", truncate="head"))
+
+        # 5.2 尚未回收的伏笔
+        hooks_section = PromptBuilder._open_hooks_section(open_hooks)
+        if hooks_section:
+            sections.append(hooks_section)
 
-        # 6. 当前章节已有内容（续写时）
+        # 5.3 相关旧章回顾（本章涉及、但近几章未出场的人物/设定）
+        if chapter_list and recalled_chapters:
+            recall_parts = []
+            for i in recalled_chapters:
+                ch = chapter_list[i]
+                ch_sum = ch.get('summary', '').strip() or ch.get('prompt', '').strip()
+                if ch_sum:
+                    recall_parts.append(f"- {PromptBuilder._format_chapter_display(i + 1, ch.get('title', ''))}剧情: {ch_sum}")
+            if recall_parts:
+                sections.append(Section("相关旧章回顾", "\n".join(recall_parts), priority=35,
+                                        header="【相关旧章回顾（本章涉及人物/设定的上次出场）】", truncate="head"))
+
+        # 6. 当前章节已有内容（续写时）：不可省略，预算不足时保留结尾
+        #    长章节续写时较早部分以摘要代替，只保留结尾原文
+        if earlier_summary:
+            sections.append(Section("本章前文摘要", earlier_summary, priority=85, required=True,
+                                    header="【本章前文摘要（较早部分的剧情梗概）】：", truncate="tail"))
         if current_chapter_content:
-            parts.append(f"【当前章节已有内容】：\n{current_chapter_content}")
+            content_header = "【当前章节已有内容（结尾部分原文，请紧接其后续写）】：" if earlier_summary else "【当前章节已有内容】："
+            sections.append(Section("当前章节已有内容", current_chapter_content, priority=90, required=True,
+                                    header=content_header, truncate="tail"))
         
         # 7. 后一章的内容提示
         next_prompt = PromptBuilder.get_next_chapter_prompt(chapter_list, current_index)
         if next_prompt:
-            parts.append(f"【后续章节剧情参考】：\n{next_prompt}")
+            sections.append(Section("后续章节剧情参考", next_prompt, priority=30, header="【后续章节剧情参考】：", truncate="head"))
         
         # 8. 总结指令
         reference_parts = []
@@ -210,14 +312,15 @@ class PromptBuilder:
         
         if reference_parts:
             ref_str = "、".join(reference_parts)
-            parts.append(f"请根据上述{ref_str}以及前三章的剧情回顾，创作本章节内容。要求情节跌宕起伏，逻辑自洽，注意与前文紧密承接。")
+            closing = f"请根据上述{ref_str}以及前三章的剧情回顾，创作本章节内容。要求情节跌宕起伏，逻辑自洽，注意与前文紧密承接。"
         else:
-            parts.append("请创作本章节内容。注意与前三章剧情回顾保持连贯，为后续章节做好铺垫。")
+            closing = "请创作本章节内容。注意与前三章剧情回顾保持连贯，为后续章节做好铺垫。"
+        sections.append(Section("创作要求", closing, required=True))
         
-        return "\n\n".join(parts)
+        return PromptBuilder._pack("正文创作", sections, budget, PromptBuilder.USER_PROMPT_CACHE_ORDER)
 
     @staticmethod
-    def build_outline_prompt(chapter_title, chapter_list=None, current_index=None, settings=""):
+    def build_outline_prompt(chapter_title, chapter_list=None, current_index=None, settings="", open_hooks=None, budget=None):
         """
         构建生成章节大纲/概述的提示词
         
@@ -226,18 +329,20 @@ class PromptBuilder:
             chapter_list (list, optional): 已有章节列表
             current_index (int, optional): 当前章节索引
             settings (str, optional): 相关设定
+            open_hooks (list, optional): 尚未回收的伏笔 [(埋下的章节序号, 钩子), ...]
+            budget (int, optional): Token 预算，默认 CONTEXT_TOKEN_BUDGET
             
         Returns:
             str: 格式化后的提示词
         """
-        parts = []
+        sections = []
         
         if settings:
-            parts.append(f"【背景设定】\n{settings}")
+            sections.append(Section("背景设定", settings, priority=60, header="【背景设定】", truncate="head"))
             
-        # 提供前三章的摘要作为上下文
+        # 提供前三章的摘要作为上下文；预算不足时只保留最近一章
         if chapter_list and current_index is not None and current_index > 0:
-            context_parts = ["【前序章节剧情回顾（最近3章）】"]
+            context_parts = []
             start = max(0, current_index - 3)
             for i in range(start, current_index):
                 ch = chapter_list[i]
@@ -245,13 +350,46 @@ class PromptBuilder:
                 # 优先使用本章摘要
                 summary = ch.get('summary', '').strip() or ch.get('prompt', '（无概述）')
                 context_parts.append(f"- {title}: {summary}")
-            parts.append("\n".join(context_parts))
+            alternatives = [(context_parts[-1], 0.6)] if len(context_parts) > 1 else []
+            sections.append(Section("前序章节剧情回顾", "\n".join(context_parts), priority=70,
+                                    header="【前序章节剧情回顾（最近3章）】", alternatives=alternatives, truncate="tail"))
 
-        parts.append(f"【当前任务】\n请为新章节构思详细的剧情大纲。要求：\n1. 情节与前文高度连贯且符合逻辑。\n2. 充满戏剧张力，能吸引读者。")
-        
-        parts.append("请按以下格式输出（严格按此标签分隔）：\n【章节标题】：（一个吸引人的标题）\n【内容概述】：（在这里详细写本章发生的故事）\n【章节高潮】：（本章最精彩的一幕）\n【章节钩子】：（本章结尾留下的悬念）")
+        hooks_section = PromptBuilder._open_hooks_section(open_hooks)
+        if hooks_section:
+            sections.append(hooks_section)
+
+        sections.append(Section("任务与格式", f"【当前任务】\n请为新章节构思详细的剧情大纲。要求：\n1. 情节与前文高度连贯且符合逻辑。\n2. 充满戏剧张力，能吸引读者。"
+                                "\n\n请按以下格式输出（严格按此标签分隔）：\n【章节标题】：（一个吸引人的标题）\n【内容概述】：（在这里详细写本章发生的故事）\n【章节高潮】：（本章最精彩的一幕）\n【章节钩子】：（本章结尾留下的悬念）", required=True))
         
-        return "\n\n".join(parts)
+        return PromptBuilder._pack("章节大纲", sections, budget)
+
+    # 章节大纲的输出标签 {字段: 标签}
+    OUTLINE_TAGS = {"title": "章节标题", "summary": "内容概述", "climax": "章节高潮", "hook": "章节钩子"}
+
+    @staticmethod
+    def parse_outline(text):
+        """
+        解析 build_outline_prompt 的输出
+        Returns:
+            {"title", "summary", "climax", "hook"}，缺失的标签为空字符串
+        """
+        def extract(tag, content):
+            pattern = rf"【{tag}】：?(.*?)(?=【|$)"
+            match = re.search(pattern, content, re.DOTALL)
+            return match.group(1).strip() if match else ""
+
+        return {field: extract(tag, text or "") for field, tag in PromptBuilder.OUTLINE_TAGS.items()}
+
+    @staticmethod
+    def build_opening_prompt(base_prompt, word_count):
+        """
+        候选开头：在整章提示词之后要求只写本章开头（各候选共用同一前缀）
+        """
+        return PromptBuilder._pack("候选开头", [
+            Section("整章上下文", base_prompt, required=True),
+            Section("开头任务", f"【你的任务：只创作本章开头】\n请写出本章开头约{word_count}字：交代场景、引出本章的核心事件，在自然的段落处停下，留待后续续写。不要写到本章高潮，也不要收尾。\n\n请直接输出正文，不要输出标题或任何说明。", required=True),
+        ], budget=PromptBuilder.estimate_tokens(base_prompt) + PromptBuilder.CONTEXT_TOKEN_BUDGET)
+
     @staticmethod
     def build_modification_prompt(content, instruction, settings=""):
         """
@@ -265,71 +403,234 @@ class PromptBuilder:
         Returns:
             str: 格式化后的提示词
         """
-        parts = []
+        sections = []
         if settings:
-            parts.append(f"【参考设定】\n{settings}")
+            sections.append(Section("参考设定", settings, priority=60, header="【参考设定】", truncate="head"))
             
-        parts.append(f"【原正文内容】\n{content}")
-        parts.append(f"【整体修改要求】\n{instruction if instruction else '按照文中内联指令进行局部微调或全文润色'}")
+        # 正文需要完整输出，不可截断
+        sections.append(Section("原正文内容", content, required=True, header="【原正文内容】"))
+        sections.append(Section("整体修改要求", instruction if instruction else '按照文中内联指令进行局部微调或全文润色', required=True, header="【整体修改要求】"))
         
-        parts.append("【处理指令】\n1. 如果正文中包含形如 【修改建议】 或 [[建议]] 的标记，请将该标记及其对应的片段按照建议进行重写。\n2. 保持原有的人设和叙事逻辑。\n3. 直接输出修改或润色后的完整正文内容。\n4. 输出中严禁保留任何原有的指令标记或说明性括号。")
+        sections.append(Section("处理指令", "【处理指令】\n1. 如果正文中包含形如 【修改建议】 或 [[建议]] 的标记，请将该标记及其对应的片段按照建议进行重写。\n2. 保持原有的人设和叙事逻辑。\n3. 直接输出修改或润色后的完整正文内容。\n4. 输出中严禁保留任何原有的指令标记或说明性括号。", required=True))
         
-        return "\n\n".join(parts)
+        return PromptBuilder._pack("正文修改", sections)
 
     @staticmethod
     def build_chapter_summary_prompt(content):
         """
         第一步：根据正文生成本章摘要
         """
-        parts = ["【创作定稿任务：本章摘要生成】"]
-        parts.append(f"请根据以下本章正文内容，生成一段精准、详尽的章节摘要（约200-400字），要求覆盖章节的核心剧情、转折和重要细节，以便作为后续创作的上下文参考。")
-        parts.append(f"【本章正文素材】：\n{content}")
-        parts.append("直接输出摘要内容即可，无需额外说明。")
-        return "\n\n".join(parts)
+        return PromptBuilder._pack("本章摘要", [
+            Section("任务", "【创作定稿任务：本章摘要生成】\n\n请根据以下本章正文内容，生成一段精准、详尽的章节摘要（约200-400字），要求覆盖章节的核心剧情、转折和重要细节，以便作为后续创作的上下文参考。", required=True),
+            Section("本章正文素材", content, required=True, header="【本章正文素材】："),
+            Section("输出要求", "直接输出摘要内容即可，无需额外说明。", required=True),
+        ], cache_order=("任务", "输出要求"))
+
+    @staticmethod
+    def build_continuation_summary_prompt(old_summary, new_text, max_chars):
+        """
+        续写长章节时维护本章前文摘要：将新移出结尾窗口的正文并入已有摘要
+        Args:
+            old_summary: 已有的前文摘要（首次生成时为空）
+            new_text: 需要并入摘要的正文
+            max_chars: 摘要字数上限
+        """
+        sections = [Section("任务", f"【续写辅助任务：本章前文摘要】\n\n本章正文较长，续写时只会附上结尾部分原文，更早的部分以摘要代替。请生成不超过{max_chars}字的前文摘要。", required=True)]
+        if old_summary:
+            sections.append(Section("已有摘要", old_summary, required=True, header="【已有的前文摘要】："))
+        sections.append(Section("新增正文", new_text, required=True, header="【需要并入摘要的正文】：" if old_summary else "【本章前文】：", truncate="tail"))
+        sections.append(Section("处理指令", "【处理指令】\n1. 按时间顺序概括剧情进展，保留人物当前所在、正在进行的事件、未说完的对话与悬而未决的冲突。\n2. 保留对续写衔接有用的细节（称呼、道具、伤势、约定等），删除景物描写与重复内容。\n3. 已有摘要中的信息若仍有效请保留，与新增正文冲突时以新增正文为准。\n\n请直接输出摘要内容，不要输出标题或说明。", required=True))
+        return PromptBuilder._pack("前文摘要", sections, cache_order=("任务", "处理指令"))
+
+    # 场景计划中每个场景的标记
+    SCENE_MARKER = "【场景{num}】"
+
+    @staticmethod
+    def build_scene_plan_prompt(instruction, chapter_plan, scene_count, word_count):
+        """
+        分场景并行创作第一步：将本章概述拆分为依次衔接的场景计划
+        """
+        plan_lines = [f"- 内容概述：\n{instruction}"] if instruction else []
+        if chapter_plan and chapter_plan.get("climax"): plan_lines.append(f"- 本章高潮：{chapter_plan['climax']}")
+        if chapter_plan and chapter_plan.get("hook"): plan_lines.append(f"- 本章钩子：{chapter_plan['hook']}")
+        markers = "\n".join(PromptBuilder.SCENE_MARKER.format(num=i + 1) + "（该场景的地点、出场人物、发生的事，以及场景结束时的状态）" for i in range(scene_count))
+        return PromptBuilder._pack("场景计划", [
+            Section("任务", f"【创作辅助任务：拆分场景】\n\n本章约{word_count}字，将由多位作者分场景同时创作。请把本章剧情拆分为{scene_count}个依次衔接的场景。", required=True),
+            Section("本章剧情策划", "\n".join(plan_lines), required=True, header="【本章剧情策划】"),
+            Section("输出格式", f"【输出格式（极其重要）】\n每个场景一行，以场景标记开头，不要输出其他任何内容：\n{markers}\n\n要求：场景之间按时间顺序衔接，每个场景写明结束时的状态，便于下一场景接续；高潮与钩子放在合适的场景中。", required=True),
+        ], cache_order=("任务", "输出格式"))
+
+    @staticmethod
+    def parse_scene_plan(text):
+        """
+        解析场景计划（亦用于章节的 scenes 字段）
+        Returns:
+            [场景描述, ...]；格式不符时为空列表
+        """
+        if not text or text.startswith("❌"):
+            return []
+        pattern = re.compile(r"【\s*场景\s*(\d+)\s*】\s*(.*?)(?=【\s*场景\s*\d+\s*】|\Z)", re.S)
+        scenes = [match.group(2).strip() for match in pattern.finditer(text)]
+        return [scene for scene in scenes if scene]
+
+    @staticmethod
+    def format_scene_plan(scenes):
+        """场景计划写回章节 scenes 字段的格式（与 parse_scene_plan 对应）"""
+        return "\n".join(PromptBuilder.SCENE_MARKER.format(num=i + 1) + scene for i, scene in enumerate(scenes))
+
+    @staticmethod
+    def build_scene_prompt(base_prompt, scenes, index, word_count):
+        """
+        分场景并行创作第二步：在整章共享的上下文之后，说明本场景的分工与衔接
+        各场景的请求共用同一前缀（整章上下文与场景计划），便于接口复用提示词缓存
+        Args:
+            base_prompt: 整章的用户提示词（build_user_prompt 的结果）
+            scenes: 场景计划
+            index: 本场景下标（从0开始）
+            word_count: 本场景字数
+        """
+        plan = "\n".join(PromptBuilder.SCENE_MARKER.format(num=i + 1) + scene for i, scene in enumerate(scenes))
+        if index == 0:
+            start = "本场景是本章开头，请按本章的开篇方式写起，注意承接前一章的结尾。"
+        else:
+            start = f"本场景紧接【场景{index}】之后，从其结束时的状态直接写起，不要复述上一场景的内容。"
+        if index == len(scenes) - 1:
+            end = "本场景是本章结尾，请落在本章钩子上收束。"
+        else:
+            end = f"写到本场景结束时的状态即停止，不要写【场景{index + 2}】的内容，也不要写总结性的收尾。"
+        return PromptBuilder._pack("场景创作", [
+            Section("整章上下文", base_prompt, required=True),
+            Section("场景计划", plan, required=True, header="【本章场景计划（各场景由不同作者同时创作）】"),
+            Section("本场景任务", f"【你的任务：只创作【场景{index + 1}】】\n{scenes[index]}\n\n- {start}\n- {end}\n- 本场景字数在{word_count}字左右。\n\n请直接输出本场景正文，不要输出场景标记、标题或任何说明。", required=True),
+        ], budget=PromptBuilder.estimate_tokens(base_prompt) + PromptBuilder.CONTEXT_TOKEN_BUDGET)
+
+    @staticmethod
+    def build_scene_stitch_prompt(prev_tail, next_head):
+        """
+        分场景并行创作第三步：润色相邻场景的衔接处，只改写下一场景的开头段落
+        """
+        return PromptBuilder._pack("场景衔接", [
+            Section("任务", "【创作辅助任务：润色场景衔接】\n\n以下两段分别是上一场景的结尾和下一场景的开头，由不同作者写成。请改写【下一场景开头】，使其与上一场景自然衔接。", required=True),
+            Section("处理指令", "【处理指令】\n1. 删除与上一场景重复的交代、复述和重新登场的描写。\n2. 补足必要的过渡（时间、地点或视角的转换），保持人物状态前后一致。\n3. 保留原段落的剧情与信息，篇幅与原段落相近。\n\n请直接输出改写后的下一场景开头，不要输出上一场景的内容或任何说明。", required=True),
+            Section("上一场景结尾", prev_tail, required=True, header="【上一场景结尾】："),
+            Section("下一场景开头", next_head, required=True, header="【下一场景开头】："),
+        ], cache_order=("任务", "处理指令"))
+
+    # 合并摘要请求中每章结果的分隔标记
+    PACKED_SUMMARY_MARKER = "===第{num}章摘要==="
+
+    @staticmethod
+    def build_packed_chapter_summary_prompt(chapters):
+        """
+        合并请求：一次为多个章节分别生成摘要
+        Args:
+            chapters: [(章节序号(从1开始), 正文), ...]
+        """
+        # 合并请求的章节数已按预算规划（见 BackfillService.pack_targets），各章正文均不可截断
+        sections = [Section("任务", f"【创作定稿任务：多章节摘要生成】\n\n以下共有 {len(chapters)} 个章节的正文，请为每一章【分别】生成一段精准、详尽的章节摘要（约200-400字），要求覆盖该章的核心剧情、转折和重要细节。各章摘要互相独立，不要混入其他章节的内容。", required=True)]
+        for num, content in chapters:
+            sections.append(Section(f"第{num}章正文", f"<<<第{num}章正文开始>>>\n{content}\n<<<第{num}章正文结束>>>", required=True))
+        markers = "\n".join(PromptBuilder.PACKED_SUMMARY_MARKER.format(num=num) + "\n（该章摘要）" for num, _ in chapters)
+        sections.append(Section("输出格式", f"【输出格式（极其重要）】\n严格按以下格式逐章输出，每章以分隔行开头，不要输出其他任何内容：\n{markers}", required=True))
+        return PromptBuilder._pack("多章节摘要", sections)
+
+    @staticmethod
+    def parse_packed_chapter_summaries(text, chapter_nums, min_length=20):
+        """
+        解析合并请求的返回结果
+        Args:
+            text: AI 返回文本
+            chapter_nums: 请求中包含的章节序号列表
+            min_length: 摘要最短字数，过短视为解析失败
+        Returns:
+            {章节序号: 摘要}，只包含通过校验的章节
+        """
+        results = {}
+        if not text or text.startswith("❌"):
+            return results
+        pattern = re.compile(r"===\s*第\s*(\d+)\s*章摘要\s*===\s*(.*?)(?====\s*第\s*\d+\s*章摘要\s*===|\Z)", re.S)
+        wanted = set(chapter_nums)
+        for match in pattern.finditer(text):
+            num = int(match.group(1))
+            summary = match.group(2).strip()
+            # 校验：属于本次请求、未重复、长度合理、未残留正文分隔标记
+            if num not in wanted or num in results:
+                continue
+            if len(summary) < min_length or "<<<" in summary:
+                continue
+            results[num] = summary
+        return results
 
     @staticmethod
     def build_global_summary_update_prompt(old_global, chapter_summary):
         """
-        第二步：合并旧全局摘要和新本章摘要，生成新的全局摘要
+        第二步：将本章摘要合并进全局摘要的最新分段
+        """
+        return PromptBuilder._pack("全局摘要", [
+            Section("任务", "【创作定稿任务：更新全局摘要】\n\n全局摘要按章节分段保存，你现在的任务是更新其中最新的一段剧情梗概（更早的分段已冻结，无需处理）。", required=True),
+            Section("已有摘要", old_global or '（暂无）', required=True, header="【最新一段的已有摘要】：", truncate="tail"),
+            Section("本章摘要", chapter_summary, required=True, header="【本章新增摘要内容】："),
+            Section("处理指令", "【处理指令】\n1. 请将本章新增的摘要内容合并到已有摘要中，形成这一段完整的、最新的剧情梗概。\n2. 保持叙事连贯性，精炼语言。\n\n请直接输出更新后的本段摘要，不要输出分段标题。", required=True),
+        ], cache_order=("任务", "处理指令"))
+
+    @staticmethod
+    def build_global_summary_compact_prompt(segments_text, max_chars):
+        """
+        将全局摘要中最旧的若干分段压缩合并为一段
         """
-        parts = ["【创作定稿任务：更新全局摘要】"]
-        parts.append("你现在的任务是更新整部小说的全文提要（全局摘要）。")
-        parts.append(f"【之前的全局摘要】：\n{old_global or '（暂无）'}")
-        parts.append(f"【本章新增摘要内容】：\n{chapter_summary}")
-        parts.append("【处理指令】\n1. 请将本章新增的摘要内容合并到原有的全局摘要中，形成一个完整的、最新的全书剧情梗概。\n2. 保持叙事连贯性，精炼语言。")
-        parts.append("请直接输出更新后的完整全局摘要。")
-        return "\n\n".join(parts)
+        return PromptBuilder._pack("压缩早期摘要", [
+            Section("任务", f"【创作定稿任务：压缩早期剧情摘要】\n\n以下是小说早期章节的分段剧情摘要，请将它们合并压缩为一段连贯的剧情梗概，不超过{max_chars}字。", required=True),
+            Section("待压缩的分段摘要", segments_text, required=True, header="【待压缩的分段摘要】："),
+            Section("处理指令", "【处理指令】\n1. 保留主线剧情、关键转折、重要人物的命运变化与未解决的伏笔。\n2. 删除次要细节与重复描述。\n\n请直接输出压缩后的摘要，不要输出分段标题。", required=True),
+        ])
 
     @staticmethod
     def build_char_status_update_prompt(old_status, chapter_summary, chapter_num):
         """
         第三步：增量更新人物经历日志（AI 输出简化格式：@角色名#变动内容）
         """
-        parts = ["【创作定稿任务：提炼人物经历变动】"]
-        parts.append("任务：根据本章剧情精华，提炼各角色的关键经历变动。")
-        parts.append(f"【参考历史经历】：\n{old_status or '（暂无）'}")
-        parts.append(f"【本章剧情精华】：\n{chapter_summary}")
-        parts.append(f"【当前章节】：第{chapter_num}章")
-        parts.append("【输出解析格式（极其重要）】\n"
+        return PromptBuilder._pack("人物动态", [
+            Section("任务", "【创作定稿任务：提炼人物经历变动】\n\n任务：根据本章剧情精华，提炼各角色的关键经历变动。", required=True),
+            Section("参考历史经历", old_status or '（暂无）', priority=60, header="【参考历史经历】：", truncate="tail"),
+            Section("本章剧情精华", chapter_summary, required=True, header="【本章剧情精华】："),
+            Section("当前章节", f"【当前章节】：第{chapter_num}章", required=True),
+            Section("输出格式", "【输出解析格式（极其重要）】\n"
                      "1. 【一章一人一条】：每名角色在本章只能有且仅有一行输出。严禁为同一角色生成多行记录。\n"
                      "2. 【全景汇总】：请用简洁的语言在一个记录块中汇总该角色在本章的所有关键点，多个事件用分号（；）隔开。\n"
                      "3. 【禁止合并人名】：严禁将多个角色名字合并在 @ 后面（如：@杨帆和李媛媛# 是错误的）。\n"
                      "4. 【格式】：@角色名#经历汇总描述\n"
                      "5. 【正确示例】：@杨帆#进入英华高中开始寄宿生活；在篮球场展现出色素质；英语摸底考不及格但有进步，接受李媛媛一对一补习。\n"
-                     "6. 注意：描述中不要再包含 @ 符号，也不要包含章节号。")
-        parts.append("请直接输出由 <RECORDS> 标签包裹的、每人只有一行的记录列表。")
-        return "\n\n".join(parts)
+                     "6. 注意：描述中不要再包含 @ 符号，也不要包含章节号。"
+                     "\n\n请直接输出由 <RECORDS> 标签包裹的、每人只有一行的记录列表。", required=True),
+        ], cache_order=("任务", "输出格式"))
+
+    @staticmethod
+    def build_character_history_compact_prompt(name, history_text, max_chars):
+        """
+        将某角色一段时期内的逐章经历归纳为阶段摘要
+        """
+        return PromptBuilder._pack("人物阶段经历", [
+            Section("任务", f"【创作定稿任务：归纳人物阶段经历】\n\n以下是角色【{name}】在若干章节中的逐章经历，请归纳为一段不超过{max_chars}字的阶段经历摘要。", required=True),
+            Section("逐章经历", history_text, required=True, header="【逐章经历】："),
+            Section("处理指令", "【处理指令】\n1. 保留身份、能力、伤病、立场与人际关系的变化，以及仍未了结的事件。\n2. 按时间顺序叙述，删除重复与琐碎细节。\n3. 不要输出章节号。\n\n请直接输出阶段经历摘要。", required=True),
+        ], cache_order=("处理指令",))
 
     @staticmethod
     def build_char_relations_update_prompt(old_relations, chapter_summary, chapter_num):
         """
-        第四步：增量更新人物关系演变
+        第四步：提取本章人物关系变动（AI 只输出增量：@角色A|角色B#关系类型#简述，由关系图服务合并）
         """
-        parts = ["【创作定稿任务：更新人物关系网络】"]
-        parts.append("任务：维护人物间的关系动态（恩怨、情感、派系）。")
-        parts.append(f"【原有关系网络】：\n{old_relations or '（暂无）'}")
-        parts.append(f"【本章剧情精华】：\n{chapter_summary}")
-        parts.append(f"【当前章节】：第{chapter_num}章")
-        parts.append("【关键指令】\n1. 仅提取本章产生的核心关系变动（如敌友转折、重要邂逅）。\n2. **强制要求**：本章的新增记录必须【极简且短小】。\n3. 严格遵循格式：第{chapter_num}章：[简短描述]。\n4. 保持历史记录不变，仅在末尾做增量补充。")
-        parts.append("请直接输出更新后的完整人物关系网络。")
-        return "\n\n".join(parts)
+        return PromptBuilder._pack("人物关系", [
+            Section("任务", "【创作定稿任务：提取人物关系变动】\n\n任务：维护人物间的关系动态（恩怨、情感、派系），只记录本章发生的变化。", required=True),
+            Section("现有关系", old_relations or '（暂无）', priority=60, header="【本章相关人物的现有关系】：", truncate="head"),
+            Section("本章剧情精华", chapter_summary, required=True, header="【本章剧情精华】："),
+            Section("当前章节", f"【当前章节】：第{chapter_num}章", required=True),
+            Section("输出格式", "【输出解析格式（极其重要）】\n"
+                     "1. 仅输出本章新建立或发生变化的关系（如敌友转折、重要邂逅），现有关系未变化的不要重复输出。\n"
+                     "2. 【格式】：@角色A|角色B#关系类型#简述，每行一对角色。\n"
+                     "3. 关系类型用2-6字概括（如：同学、师徒、恋人、宿敌），简述不超过20字。\n"
+                     "4. 两人关系已经结束、不再值得记录时，关系类型写“解除”。\n"
+                     "5. 【正确示例】：@杨帆|李媛媛#补习搭档#李媛媛答应为杨帆补习英语\n"
+                     "6. 本章没有关系变化时，输出空的标签。"
+                     "\n\n请直接输出由 <RELATIONS> 标签包裹的关系变动列表。", required=True),
+        ], cache_order=("任务", "输出格式"))
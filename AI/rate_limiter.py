@@ -0,0 +1,70 @@
+"""
+请求限流模块
+限制并发的 AI 请求数与每分钟请求数，供批量任务在多个线程间共享
+"""
+
+import time
+import threading
+
+
+class RateLimiter:
+    """请求限流器：并发上限 + 每分钟请求数上限（请求之间按最小间隔发出）"""
+
+    def __init__(self, requests_per_minute=30, max_concurrency=4):
+        """
+        初始化限流器
+
+        参数:
+            requests_per_minute: 每分钟最多发出的请求数，0 表示不限
+            max_concurrency: 同时进行中的请求数上限
+        """
+        self.min_interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._semaphore = threading.Semaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self):
+        """占用一个请求名额，必要时等待"""
+        self._semaphore.acquire()
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def release(self):
+        """释放请求名额"""
+        self._semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def call(self, ai_client, system_prompt, user_prompt, temperature, max_tokens, retries=2, cancel_event=None):
+        """
+        在限流下调用 AI 接口；遇到限流(429)、超时或网络错误时指数退避重试
+
+        返回:
+            生成的文本，失败时返回以 ❌ 开头的错误信息
+        """
+        result = ""
+        for attempt in range(retries + 1):
+            if cancel_event is not None and cancel_event.is_set():
+                return "❌ 已取消"
+            with self:
+                result = ai_client.generate_content(system_prompt, user_prompt, temperature, max_tokens)
+            if not result.startswith("❌"):
+                return result
+            retryable = "429" in result or "超时" in result or "网络请求错误" in result
+            if not retryable or attempt == retries:
+                break
+            delay = 2 ** (attempt + 1)
+            print(f"[警告] 请求失败，{delay} 秒后重试（第{attempt + 1}次）: {result[:60]}")
+            time.sleep(delay)
+        return result
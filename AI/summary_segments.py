@@ -0,0 +1,146 @@
+"""
+分段全局摘要模块
+全局摘要由若干段组成，每段以“〔第a-b章〕”标题行开头：
+
+    〔第1-10章〕
+    ……（已冻结）
+    〔第11-14章〕
+    ……（最新段，仍在更新）
+
+每次定稿只让 AI 改写最新一段（输入 = 最新段 + 本章摘要），
+最新段超过字数或章节数上限后冻结并开启新段；
+冻结段总字数超过预算时，将最旧的两段压缩合并为一段。
+因此单章定稿的 Token 消耗有上界，不随全书长度线性增长。
+"""
+
+import re
+from AI.prompt_builder import PromptBuilder
+
+
+# 最新段的字数上限，超过后冻结
+SEGMENT_MAX_CHARS = 1200
+# 最新段最多覆盖的章节数
+SEGMENT_MAX_CHAPTERS = 10
+# 冻结段的总字数预算，超过后压缩最旧的两段
+FROZEN_BUDGET_CHARS = 4000
+
+_HEADER_PATTERN = re.compile(r"^〔(.+?)〕\s*$")
+_RANGE_PATTERN = re.compile(r"^第(\d+)-(\d+)章$")
+
+GLOBAL_SYSTEM_PROMPT = "你是一位定稿专家，负责合并剧情摘要。"
+COMPACT_SYSTEM_PROMPT = "你是一位资深小说编辑，负责精简压缩剧情梗概。"
+
+
+def parse_segments(text):
+    """
+    解析分段全局摘要
+    Returns:
+        [{"label": 标题, "start": 起始章或None, "end": 结束章或None, "text": 正文}, ...]
+        不含分段标题的旧版全局摘要返回单个无标题段（label 为空）
+    """
+    segments = []
+    current = None
+    for line in (text or "").splitlines():
+        match = _HEADER_PATTERN.match(line.strip())
+        if match:
+            label = match.group(1).strip()
+            range_match = _RANGE_PATTERN.match(label)
+            current = {
+                "label": label,
+                "start": int(range_match.group(1)) if range_match else None,
+                "end": int(range_match.group(2)) if range_match else None,
+                "lines": [],
+            }
+            segments.append(current)
+            continue
+        if current is None:
+            current = {"label": "", "start": None, "end": None, "lines": []}
+            segments.append(current)
+        current["lines"].append(line)
+    for segment in segments:
+        segment["text"] = "\n".join(segment.pop("lines")).strip()
+    return [s for s in segments if s["text"] or s["label"]]
+
+
+def render_segments(segments):
+    """将分段拼接为全局摘要文本"""
+    blocks = []
+    for segment in segments:
+        label = segment.get("label") or _range_label(segment.get("start"), segment.get("end"))
+        blocks.append(f"〔{label}〕\n{segment['text'].strip()}" if label else segment["text"].strip())
+    return "\n\n".join(blocks).strip()
+
+
+def _range_label(start, end):
+    if start is None or end is None:
+        return ""
+    return f"第{start}-{end}章"
+
+
+def split_for_update(old_global, chapter_num):
+    """
+    将旧全局摘要拆分为“冻结段列表”和“本次需要改写的最新段”
+    Returns:
+        (冻结段列表, 最新段 或 None)
+    """
+    segments = parse_segments(old_global)
+    if not segments:
+        return [], None
+    frozen, last = segments[:-1], segments[-1]
+
+    if not last["label"]:
+        # 旧版（未分段）全局摘要：过长时整体冻结为前情段，否则继续作为最新段更新
+        if len(last["text"]) > SEGMENT_MAX_CHARS:
+            label = _range_label(1, chapter_num - 1) if chapter_num > 1 else "前情提要"
+            frozen.append({"label": label, "start": 1 if chapter_num > 1 else None,
+                           "end": chapter_num - 1 if chapter_num > 1 else None, "text": last["text"]})
+            return frozen, None
+        # 旧版全局摘要覆盖此前所有章节，起始章为第1章，分段标题才能如实反映覆盖范围
+        return frozen, {"label": "", "start": 1, "end": chapter_num - 1, "text": last["text"]}
+
+    covered = (last["end"] - last["start"] + 1) if last["start"] is not None and last["end"] is not None else SEGMENT_MAX_CHAPTERS
+    if len(last["text"]) > SEGMENT_MAX_CHARS or covered >= SEGMENT_MAX_CHAPTERS or last["start"] is None:
+        frozen.append(last)
+        return frozen, None
+    return frozen, last
+
+
+def update_global_summary(generate, old_global, chapter_summary, chapter_num):
+    """
+    分段更新全局摘要
+    Args:
+        generate: 调用函数 f(步骤名, system_prompt, user_prompt, temperature, max_tokens) -> 文本
+        old_global: 上一章的全局摘要
+        chapter_summary: 本章摘要
+        chapter_num: 本章序号（从1开始）
+    Returns:
+        新的全局摘要；失败时返回以 ❌ 开头的错误信息
+    """
+    frozen, open_segment = split_for_update(old_global, chapter_num)
+    open_text = open_segment["text"] if open_segment else ""
+    start = open_segment["start"] if open_segment and open_segment["start"] is not None else chapter_num
+
+    prompt = PromptBuilder.build_global_summary_update_prompt(open_text, chapter_summary)
+    new_text = generate("global_summary", GLOBAL_SYSTEM_PROMPT, prompt, 0.3, 2000)
+    if new_text.startswith("❌"):
+        return new_text
+    segments = frozen + [{"label": "", "start": start, "end": chapter_num, "text": new_text.strip()}]
+
+    # 冻结段超出预算时，压缩最旧的两段（每章最多一次，输入大小有上界）
+    frozen_chars = sum(len(s["text"]) for s in segments[:-1])
+    if frozen_chars > FROZEN_BUDGET_CHARS and len(segments) >= 3:
+        first, second = segments[0], segments[1]
+        compact_prompt = PromptBuilder.build_global_summary_compact_prompt(
+            render_segments([first, second]), SEGMENT_MAX_CHARS
+        )
+        merged = generate("global_summary_compact", COMPACT_SYSTEM_PROMPT, compact_prompt, 0.3, 2000)
+        if not merged.startswith("❌"):
+            start_num = first["start"] if first["start"] is not None else 1
+            end_num = second["end"] if second["end"] is not None else start_num
+            segments = [{"label": _range_label(start_num, end_num), "start": start_num, "end": end_num,
+                         "text": merged.strip()}] + segments[2:]
+        else:
+            # 压缩失败不影响本章更新，下次定稿时再尝试
+            print(f"[警告] 全局摘要压缩失败，保留原分段: {merged[:60]}")
+
+    return render_segments(segments)
@@ -43,6 +43,7 @@ def create_chapter_generate_page(app, parent):
     tk.Button(mgmt_btns, text="✏️ 标题", command=app.rename_selected_chapter, cursor="hand2").pack(side=tk.LEFT, padx=(10, 0))
     tk.Button(mgmt_btns, text="🗑️ 删除", command=app.delete_selected_chapter, cursor="hand2").pack(side=tk.LEFT, padx=(10, 0))
     tk.Button(mgmt_btns, text="📤 导出全文", command=app.novel_service.export_novel_text, cursor="hand2", bg="#f8f9fa").pack(side=tk.RIGHT)
+    tk.Button(mgmt_btns, text="📂 导入TXT", command=app.novel_service.import_novel_text, cursor="hand2", bg="#f8f9fa").pack(side=tk.RIGHT, padx=(0, 10))
 
     # 右侧：策划详情容器
     right_panel = tk.Frame(parent)
@@ -127,6 +128,16 @@ def create_chapter_generate_page(app, parent):
         fg="white",
         height=1,
         cursor="hand2"
+    ).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 5))
+    
+    tk.Button(
+        outline_btn_container,
+        text="🎲 多候选构思",
+        command=lambda: app.generation_service.generate_outline(candidates=True),
+        font=("Microsoft YaHei", 9, "bold"),
+        bg="#f8f9fa",
+        height=1,
+        cursor="hand2"
     ).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
 
     # ==================== Tab 2: 章节摘要 ====================
@@ -192,6 +203,28 @@ def create_chapter_generate_page(app, parent):
         fg="white",
         height=2,
         cursor="hand2"
+    ).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 5))
+
+    tk.Button(
+        summary_btn_container,
+        text="🔄 刷新过期摘要",
+        command=app.novel_service.refresh_stale_summaries,
+        font=("Microsoft YaHei", 10, "bold"),
+        bg="#d9822b",
+        fg="white",
+        height=2,
+        cursor="hand2"
+    ).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 5))
+
+    tk.Button(
+        summary_btn_container,
+        text="📚 批量补全摘要",
+        command=app.backfill_service.open_dialog,
+        font=("Microsoft YaHei", 10, "bold"),
+        bg="#6c757d",
+        fg="white",
+        height=2,
+        cursor="hand2"
     ).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
 
     # 初始化变量
@@ -108,6 +108,18 @@ def create_content_generate_page(app, parent):
     )
     app.generate_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 2))
     
+    # 1.1 候选开头：生成多个开头并排比较，采用后可接着续写
+    app.opening_candidates_btn = tk.Button(
+        btns_frame,
+        text="🎲 候选开头",
+        command=lambda: app.generation_service.generate_content(candidates=True),
+        font=("Microsoft YaHei", 10),
+        bg="#f8f9fa",
+        relief=tk.RAISED,
+        height=1
+    )
+    app.opening_candidates_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(2, 2))
+    
     # 2. 修改按钮 (新增)
     app.modify_content_btn = tk.Button(
         btns_frame,
@@ -157,7 +169,19 @@ def create_content_generate_page(app, parent):
         relief=tk.RAISED,
         height=1
     )
-    app.export_chapter_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(2, 0))
+    app.export_chapter_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(2, 2))
+
+    # 6. 历史版本
+    app.version_history_btn = tk.Button(
+        btns_frame,
+        text="🕘 历史版本",
+        command=app.novel_service.show_version_history,
+        font=("Microsoft YaHei", 10),
+        bg="#f8f9fa",
+        relief=tk.RAISED,
+        height=1
+    )
+    app.version_history_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(2, 0))
     
     # 字数统计
     app.word_count_label = tk.Label(
@@ -49,7 +49,13 @@ def create_novel_profile_page(app, parent):
     #    - 要编辑某个设定：点击文字使其变色 → 点击"编辑"按钮
     #    - 要删除某个设定：点击文字使其变色 → 点击"删除"按钮
     #    - 要在生成时使用某些设定：勾选对应的复选框
-    # 
+    #
+    def _hover_text(details, name):
+        """悬浮提示：出场统计（来自提及索引）+ 条目内容"""
+        content = details.get(name, "")
+        stats = app.mention_index_service.describe(name) if hasattr(app, "mention_index_service") else ""
+        return f"{stats}\n\n{content}" if stats else content
+
     class ScrollCheckList:
         def __init__(self, parent_frame, on_hover_content):
             self.vars = {}  # name -> BooleanVar (复选框状态)
@@ -463,7 +469,7 @@ def create_novel_profile_page(app, parent):
     left_list_container.grid(row=0, column=0, sticky=tk.NSEW)
     left_list_container.columnconfigure(0, weight=1)
     left_list_container.rowconfigure(0, weight=1)
-    app.novel_setting_checks = ScrollCheckList(left_list_container, lambda n: app.novel_setting_details.get(n, ""))
+    app.novel_setting_checks = ScrollCheckList(left_list_container, lambda n: _hover_text(app.novel_setting_details, n))
 
     def persist_item_to_ini(section: str, name: str, content: str):
         try:
@@ -512,7 +518,7 @@ def create_novel_profile_page(app, parent):
     right_list_container.grid(row=0, column=0, sticky=tk.NSEW)
     right_list_container.columnconfigure(0, weight=1)
     right_list_container.rowconfigure(0, weight=1)
-    app.character_setting_checks = ScrollCheckList(right_list_container, lambda n: app.character_setting_details.get(n, ""))
+    app.character_setting_checks = ScrollCheckList(right_list_container, lambda n: _hover_text(app.character_setting_details, n))
 
     def create_character_setting_item():
         res = create_character_dialog("创建人物设定")
@@ -528,6 +534,7 @@ def create_novel_profile_page(app, parent):
     right_btns.grid(row=1, column=0, sticky=tk.E, pady=(8, 0))
     tk.Button(right_btns, text="删除", command=lambda: delete_selected_items("CHARACTERS", "right"), cursor="hand2").pack(side=tk.RIGHT, padx=(6,0))
     tk.Button(right_btns, text="编辑", command=lambda: edit_selected_item("CHARACTERS", "right", "编辑人物"), cursor="hand2").pack(side=tk.RIGHT, padx=(6,0))
+    tk.Button(right_btns, text="经历", command=lambda: edit_character_events(), cursor="hand2").pack(side=tk.RIGHT, padx=(6,0))
     tk.Button(right_btns, text="＋ 创建", command=create_character_setting_item, cursor="hand2").pack(side=tk.RIGHT)
 
     def delete_from_ini(section: str, name: str):
@@ -580,6 +587,9 @@ def create_novel_profile_page(app, parent):
                 if selected_name in app.character_setting_checked:
                     del app.character_setting_checked[selected_name]
                 delete_selection_entry("CHARACTERS_SELECTED", selected_name)
+                # 人物经历随角色一并删除
+                if ok and hasattr(app, "character_event_service"):
+                    app.character_event_service.delete(selected_name)
             
             # 重建界面
             if side == "left":
@@ -646,6 +656,9 @@ def create_novel_profile_page(app, parent):
                 if old_name in app.character_setting_checked:
                     del app.character_setting_checked[old_name]
                 app.character_setting_checked[new_name] = checked
+                # 人物经历随角色改名迁移
+                if hasattr(app, "character_event_service"):
+                    app.character_event_service.rename(old_name, new_name)
                 app.character_setting_checks.rebuild(app.character_setting_details, app.character_setting_checked)
                 delete_selection_entry("CHARACTERS_SELECTED", old_name)
                 update_selection_entry("CHARACTERS_SELECTED", new_name, checked)
@@ -654,5 +667,49 @@ def create_novel_profile_page(app, parent):
         except Exception as e:
             messagebox.showerror("错误", f"编辑失败: {str(e)}", parent=parent)
 
+    def edit_character_events():
+        """查看与编辑所选人物的经历（定稿时提炼，保存在 character_events.jsonl）"""
+        try:
+            name = app.character_setting_checks.get_selected()
+            if not name:
+                messagebox.showwarning("提示", "请先点击选择要查看经历的人物（文字会变色）。", parent=parent)
+                return
+            events = app.character_event_service
+
+            win = tk.Toplevel(parent)
+            win.title(f"人物经历 - {name}")
+            win.transient(parent)
+            win.grab_set()
+            app.ui_helper.center_window(win, 640, 520)
+
+            body = tk.Frame(win, padx=20, pady=15)
+            body.pack(fill=tk.BOTH, expand=True)
+
+            periods = events.periods(name)
+            if periods:
+                tk.Label(body, text="前期经历（已归纳的阶段摘要，只读）：", font=("Microsoft YaHei", 10)).pack(anchor=tk.W)
+                periods_text = scrolledtext.ScrolledText(body, font=("Microsoft YaHei", 10), height=5, wrap=tk.WORD)
+                periods_text.insert("1.0", "\n".join(f"第{p['start']}-{p['end']}章：{p['summary']}" for p in periods))
+                periods_text.config(state=tk.DISABLED)
+                periods_text.pack(fill=tk.X, pady=(0, 10))
+
+            tk.Label(body, text="逐章经历（每行一章，格式：第N章：经历；经历）：", font=("Microsoft YaHei", 10)).pack(anchor=tk.W)
+            events_text = scrolledtext.ScrolledText(body, font=("Microsoft YaHei", 10), height=14, wrap=tk.WORD)
+            events_text.insert("1.0", events.format_events(events.since(name, 0)))
+            events_text.pack(fill=tk.BOTH, expand=True)
+
+            def on_ok():
+                invalid = events.replace_from_text(name, events_text.get("1.0", tk.END))
+                if invalid:
+                    messagebox.showwarning("提示", "以下行不符合“第N章：经历”格式，未保存：\n" + "\n".join(invalid[:10]), parent=win)
+                win.destroy()
+
+            footer = tk.Frame(win, padx=20, pady=10)
+            footer.pack(fill=tk.X, side=tk.BOTTOM)
+            tk.Button(footer, text="保存", command=on_ok, bg="#28a745", fg="white", cursor="hand2", width=10).pack(side=tk.RIGHT, padx=5)
+            tk.Button(footer, text="取消", command=win.destroy, cursor="hand2", width=10).pack(side=tk.RIGHT, padx=5)
+        except Exception as e:
+            messagebox.showerror("错误", f"打开人物经历失败: {str(e)}", parent=parent)
+
     # 悬浮提示功能已集成在 ScrollCheckList 内部的 _bind_tooltip
 
@@ -15,6 +15,7 @@ import traceback
 import sys
 import re
 import math
+import multiprocessing
 
 # UI模块
 from UI.ai_settings import create_ai_settings_page as external_create_ai_settings_page
@@ -25,9 +26,25 @@ from UI.content_generate import create_content_generate_page as external_create_
 
 # 业务模块
 from AI.ai_client import AIClient
+from AI.prompt_builder import PromptBuilder
 from services.config_manager import ConfigManager
 from services.novel_service import NovelService
 from services.generation_service import GenerationService
+from services.version_service import VersionService
+from services.journal_service import JournalService
+from services.snapshot_service import SnapshotService
+from services.backfill_service import BackfillService
+from services.step_cache_service import StepCacheService
+from services.staleness_service import StalenessService
+from services.character_event_service import CharacterEventService
+from services.prompt_card_service import PromptCardService
+from services.mention_index_service import MentionIndexService
+from services.relation_graph_service import RelationGraphService
+from services.hook_ledger_service import HookLedgerService
+from services.setting_rank_service import SettingRankService
+from services.continuation_service import ContinuationService
+from services.scene_draft_service import SceneDraftService
+from services.candidate_service import CandidateService
 from UI.ui_helper import UIHelper
 
 # 读取配置文件
@@ -54,6 +71,11 @@ DEFAULT_MAX_TOKENS = config['max_tokens']
 DEFAULT_TIMEOUT = config.get('timeout', 300)
 CURRENT_API = config['current_api']
 AVAILABLE_APIS = config['available_apis']
+PromptBuilder.CACHE_FRIENDLY_LAYOUT = config.get('cache_friendly_prompts', False)
+SceneDraftService.ENABLED = config.get('scene_parallel_drafting', False)
+CandidateService.DEFAULT_COUNT = config.get('candidate_count', 3)
+# 编辑器快照写入恢复日志的间隔（毫秒）
+JOURNAL_SNAPSHOT_INTERVAL_MS = 30000
 
 
 
@@ -82,6 +104,19 @@ class NovelGeneratorApp:
         
         # 初始化业务服务
         self.novel_service = NovelService(self)
+        self.version_service = VersionService(self)
+        self.journal_service = JournalService(self)
+        self.step_cache_service = StepCacheService(self)
+        self.staleness_service = StalenessService(self)
+        self.character_event_service = CharacterEventService(self)
+        self.prompt_card_service = PromptCardService(self)
+        self.mention_index_service = MentionIndexService(self)
+        self.relation_graph_service = RelationGraphService(self)
+        self.hook_ledger_service = HookLedgerService(self)
+        self.setting_rank_service = SettingRankService(self)
+        self.continuation_service = ContinuationService(self)
+        self.scene_draft_service = SceneDraftService(self)
+        self.candidate_service = CandidateService(self)
         
         default_config = {
             'api_key': DEEPSEEK_API_KEY,
@@ -89,6 +124,7 @@ class NovelGeneratorApp:
             'model': DEEPSEEK_MODEL
         }
         self.generation_service = GenerationService(self, default_config)
+        self.backfill_service = BackfillService(self)
         
         # 初始化UI辅助工具
         self.ui_helper = UIHelper(self)
@@ -98,6 +134,9 @@ class NovelGeneratorApp:
         
         # 设置窗口关闭协议
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        
+        # 定期将未保存的编辑器内容写入恢复日志
+        self.root.after(JOURNAL_SNAPSHOT_INTERVAL_MS, self._journal_editor_snapshot)
 
         # 尝试自动加载上次打开的小说
         try:
@@ -365,6 +404,21 @@ class NovelGeneratorApp:
         """读取 novel.ini 并填充界面，文件选择器仅限 *.ini"""
         self.novel_service.load_novel_config(file_path)
     
+    def offer_journal_recovery(self):
+        """检查恢复日志，提示恢复上次异常退出前未保存的内容"""
+        self.novel_service.offer_journal_recovery()
+    
+    def _journal_editor_snapshot(self):
+        """定时任务：当前章节有未保存更改时，将编辑器正文写入恢复日志"""
+        try:
+            if getattr(self, "current_chapter_index", None) is not None and self.has_unsaved_changes():
+                content = self.content_text.get("1.0", tk.END).strip()
+                self.journal_service.record_editor_snapshot(self.current_chapter_index, content)
+        except Exception as e:
+            print(f"[警告] 写入编辑器快照失败: {e}")
+        finally:
+            self.root.after(JOURNAL_SNAPSHOT_INTERVAL_MS, self._journal_editor_snapshot)
+    
     def preserve_chapter_selection(self):
         """保持章节列表的选中状态，防止在编辑文本时丢失"""
         try:
@@ -405,7 +459,13 @@ class NovelGeneratorApp:
                                 return  # 阻止关闭
                     # 如果选择"否"，直接退出，不保存
             
+            # 正常退出：未保存的内容已保存或被用户放弃，下次启动无需提示恢复
+            self.journal_service.truncate()
+            # 等待保存时在后台写出的快照
+            SnapshotService.wait_for_background_save()
+            
             # 关闭程序
+            self.ai_client.log_usage_report()
             self.root.destroy()
         except Exception as e:
             print(f"[错误] 关闭程序时发生错误: {e}")
@@ -434,6 +494,8 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包为 EXE 后，EPUB 导出的进程池需要此调用
+    multiprocessing.freeze_support()
     # 确保错误输出到控制台
     try:
         main()
@@ -0,0 +1,544 @@
+"""
+批量补全摘要服务
+为导入或旧版本升级后缺少 summary / global_summary / char_status / char_relations 的章节批量补全定稿信息：
+    1. 并行阶段：在限流下并发生成各章的本章摘要（各章互不依赖）；
+       篇幅较短的章节按 Token 预算合并到同一请求中，解析失败的章节再单独重发
+    2. 串行阶段：按章节顺序依次更新全局摘要、人物动态、人物关系（依赖上一章结果，
+       同一章的三项更新互不依赖，可并发发出）
+每个 AI 结果都会立即追加到检查点文件，中断后再次运行可从断点继续，不会重复付费调用。
+
+检查点文件：<小说目录>/backfill.checkpoint，每行一条 JSON 记录：
+    {"chapter": 索引, "hash": 正文哈希, "summary": "..."}
+    {"chapter": 索引, "hash": 正文哈希, "global_summary": "...", "char_status": "...", "char_relations": "..."}
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import tkinter as tk
+from tkinter import ttk, messagebox
+from AI.prompt_builder import PromptBuilder
+from AI.rate_limiter import RateLimiter
+from AI.summary_segments import update_global_summary
+
+
+CHECKPOINT_FILENAME = "backfill.checkpoint"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_MINUTE = 30
+# 每补全多少章写一次 novel.ini
+PERSIST_EVERY = 10
+# 合并摘要请求：单个请求的正文 Token 预算、最多章节数、每章预留的输出 Token
+PACK_TOKEN_BUDGET = 6000
+PACK_MAX_CHAPTERS = 8
+PACK_OUTPUT_TOKENS_PER_CHAPTER = 600
+# 估算用的平均输出 Token 数
+EST_SUMMARY_TOKENS = 300
+EST_GLOBAL_TOKENS = 800
+EST_STATUS_TOKENS = 300
+EST_RELATIONS_TOKENS = 800
+
+SUMMARY_SYSTEM_PROMPT = "你是一位专业的小说编辑，请精准提炼章节核心剧情。"
+STATUS_SYSTEM_PROMPT = "你是一个严谨的档案员，负责记录角色状态变迁。"
+RELATIONS_SYSTEM_PROMPT = "你是一个关系分析师，负责梳理人物情感纠葛。"
+
+
+class BackfillCancelled(Exception):
+    """批量补全被用户取消"""
+
+
+class BackfillService:
+    """批量补全摘要服务类"""
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._lock = threading.Lock()
+        self._running = False
+
+    # ==================== 检查点 ====================
+
+    def _checkpoint_path(self):
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        return os.path.join(novel_dir, CHECKPOINT_FILENAME) if novel_dir else ""
+
+    @staticmethod
+    def _content_hash(content):
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def _append_checkpoint(self, record):
+        path = self._checkpoint_path()
+        if not path:
+            return
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _read_checkpoint(self):
+        path = self._checkpoint_path()
+        if not path or not os.path.exists(path):
+            return []
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 中断时最后一行可能不完整
+                    continue
+        return records
+
+    def _clear_checkpoint(self):
+        path = self._checkpoint_path()
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            print(f"[警告] 删除补全检查点失败: {e}")
+
+    def resume_from_checkpoint(self):
+        """
+        将检查点中仍然有效（正文未变化）的结果写回章节列表
+        Returns:
+            恢复的记录数
+        """
+        applied = 0
+        for record in self._read_checkpoint():
+            idx = record.get("chapter")
+            if not isinstance(idx, int) or not (0 <= idx < len(self.app.chapter_list)):
+                continue
+            chapter = self.app.chapter_list[idx]
+            if self._content_hash(chapter.get("content", "") or "") != record.get("hash"):
+                continue
+            if "summary" in record and not (chapter.get("summary", "") or "").strip():
+                chapter["summary"] = record["summary"]
+                self.app.staleness_service.mark_summary_fresh(idx, record.get("hash"))
+                applied += 1
+            if "global_summary" in record and not self._chain_done(chapter):
+                self._apply_chain_result(idx, record)
+                applied += 1
+        if applied:
+            print(f"[信息] 已从补全检查点恢复 {applied} 条结果")
+        return applied
+
+    # ==================== 规划与估算 ====================
+
+    @staticmethod
+    def _chain_done(chapter):
+        return all((chapter.get(key, "") or "").strip() for key in ("global_summary", "char_status", "char_relations"))
+
+    def plan(self, start, end):
+        """
+        统计指定范围内需要补全的章节
+        Returns:
+            (需要生成本章摘要的索引列表, 需要串行更新的索引列表)
+        """
+        summary_targets, chain_targets = [], []
+        for idx in range(start, end + 1):
+            chapter = self.app.chapter_list[idx]
+            if not (chapter.get("content", "") or "").strip():
+                continue
+            if not (chapter.get("summary", "") or "").strip():
+                summary_targets.append(idx)
+            if not self._chain_done(chapter):
+                chain_targets.append(idx)
+        return summary_targets, chain_targets
+
+    @staticmethod
+    def pack_targets(targets, contents):
+        """
+        将待摘要章节按顺序分组：短章节合并到同一请求，直到达到 Token 预算或章节数上限；
+        超过预算一半的长章节单独成组
+        Args:
+            targets: 章节索引列表
+            contents: {索引: 正文}
+        Returns:
+            [[索引, ...], ...]
+        """
+        groups = []
+        current, current_tokens = [], 0
+        for idx in targets:
+            tokens = PromptBuilder.estimate_tokens(contents[idx])
+            if tokens > PACK_TOKEN_BUDGET // 2:
+                groups.append([idx])
+                continue
+            if current and (current_tokens + tokens > PACK_TOKEN_BUDGET or len(current) >= PACK_MAX_CHAPTERS):
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(idx)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def estimate(self, start, end, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, packed=True):
+        """
+        预估调用次数、Token 消耗与最短耗时
+        Returns:
+            dict(summary_calls, chain_calls, input_tokens, output_tokens, minutes)
+        """
+        summary_targets, chain_targets = self.plan(start, end)
+        contents = {idx: self.app.chapter_list[idx].get("content", "") for idx in summary_targets}
+        groups = self.pack_targets(summary_targets, contents) if packed else [[idx] for idx in summary_targets]
+        input_tokens = 0
+        for group in groups:
+            if len(group) == 1:
+                prompt = PromptBuilder.build_chapter_summary_prompt(contents[group[0]])
+            else:
+                prompt = PromptBuilder.build_packed_chapter_summary_prompt([(idx + 1, contents[idx]) for idx in group])
+            input_tokens += PromptBuilder.estimate_tokens(prompt) + PromptBuilder.estimate_tokens(SUMMARY_SYSTEM_PROMPT)
+        chain_template = (PromptBuilder.estimate_tokens(PromptBuilder.build_global_summary_update_prompt("", ""))
+                          + PromptBuilder.estimate_tokens(PromptBuilder.build_char_status_update_prompt("", "", 1))
+                          + PromptBuilder.estimate_tokens(PromptBuilder.build_char_relations_update_prompt("", "", 1)))
+        for idx in chain_targets:
+            summary = self.app.chapter_list[idx].get("summary", "")
+            summary_tokens = PromptBuilder.estimate_tokens(summary) if summary else EST_SUMMARY_TOKENS
+            # 三项更新各自携带上一章的结果与本章摘要
+            input_tokens += chain_template + summary_tokens * 3 + EST_GLOBAL_TOKENS + EST_STATUS_TOKENS + EST_RELATIONS_TOKENS
+        output_tokens = (len(summary_targets) * EST_SUMMARY_TOKENS
+                         + len(chain_targets) * (EST_GLOBAL_TOKENS + EST_STATUS_TOKENS + EST_RELATIONS_TOKENS))
+        calls = len(groups) + len(chain_targets) * 3
+        minutes = calls / requests_per_minute if requests_per_minute else 0
+        return {
+            "summary_calls": len(groups),
+            "chain_calls": len(chain_targets) * 3,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "minutes": minutes,
+        }
+
+    # ==================== 界面 ====================
+
+    def open_dialog(self):
+        """打开批量补全对话框：选择范围与限流参数，显示预估消耗"""
+        try:
+            if not self.app.chapter_list or not getattr(self.app, "current_novel_dir", ""):
+                messagebox.showwarning("提示", "请先打开一部包含章节的小说。")
+                return
+            if self._running:
+                messagebox.showinfo("提示", "批量补全任务正在进行中。")
+                return
+
+            restored = self.resume_from_checkpoint()
+            if restored:
+                self.app.novel_service._persist_chapters_to_novel()
+
+            total = len(self.app.chapter_list)
+            dialog = tk.Toplevel(self.app.root)
+            dialog.title("批量补全章节摘要")
+            dialog.transient(self.app.root)
+            dialog.grab_set()
+            self.app.ui_helper.center_window(dialog, 460, 350)
+
+            frame = tk.Frame(dialog, padx=20, pady=15)
+            frame.pack(fill=tk.BOTH, expand=True)
+
+            tk.Label(frame, text="章节范围：", font=("Microsoft YaHei", 10)).grid(row=0, column=0, sticky=tk.W, pady=5)
+            start_var = tk.IntVar(value=1)
+            end_var = tk.IntVar(value=total)
+            tk.Spinbox(frame, from_=1, to=total, textvariable=start_var, width=6).grid(row=0, column=1, sticky=tk.W)
+            tk.Label(frame, text="至").grid(row=0, column=2, padx=5)
+            tk.Spinbox(frame, from_=1, to=total, textvariable=end_var, width=6).grid(row=0, column=3, sticky=tk.W)
+
+            tk.Label(frame, text="并发请求数：", font=("Microsoft YaHei", 10)).grid(row=1, column=0, sticky=tk.W, pady=5)
+            concurrency_var = tk.IntVar(value=DEFAULT_CONCURRENCY)
+            tk.Spinbox(frame, from_=1, to=16, textvariable=concurrency_var, width=6).grid(row=1, column=1, sticky=tk.W)
+
+            tk.Label(frame, text="每分钟请求上限：", font=("Microsoft YaHei", 10)).grid(row=2, column=0, sticky=tk.W, pady=5)
+            rpm_var = tk.IntVar(value=DEFAULT_REQUESTS_PER_MINUTE)
+            tk.Spinbox(frame, from_=1, to=600, textvariable=rpm_var, width=6).grid(row=2, column=1, sticky=tk.W)
+
+            packed_var = tk.BooleanVar(value=True)
+            tk.Checkbutton(frame, text="合并短章节为一次请求（减少请求次数）", variable=packed_var).grid(row=3, column=0, columnspan=4, sticky=tk.W, pady=5)
+
+            estimate_label = tk.Label(frame, text="", font=("Microsoft YaHei", 9), fg="#555", justify=tk.LEFT)
+            estimate_label.grid(row=4, column=0, columnspan=4, sticky=tk.W, pady=(10, 0))
+
+            def read_params():
+                try:
+                    start, end = int(start_var.get()), int(end_var.get())
+                    concurrency, rpm = int(concurrency_var.get()), int(rpm_var.get())
+                except (tk.TclError, ValueError):
+                    return None
+                if not (1 <= start <= end <= total) or concurrency < 1 or rpm < 1:
+                    return None
+                return start - 1, end - 1, concurrency, rpm, packed_var.get()
+
+            def refresh_estimate():
+                params = read_params()
+                if not params:
+                    estimate_label.config(text="参数无效，请检查章节范围与限流设置。")
+                    return
+                est = self.estimate(params[0], params[1], params[3], params[4])
+                estimate_label.config(text=(
+                    f"需生成本章摘要：{est['summary_calls']} 次请求（并行）\n"
+                    f"需串行更新全局摘要/人物动态/关系：{est['chain_calls']} 次请求\n"
+                    f"预估消耗：输入约 {est['input_tokens']:,} Token，输出约 {est['output_tokens']:,} Token\n"
+                    f"按限流计算至少需要约 {est['minutes']:.1f} 分钟"
+                ))
+
+            def on_start():
+                params = read_params()
+                if not params:
+                    messagebox.showwarning("提示", "参数无效，请检查章节范围与限流设置。", parent=dialog)
+                    return
+                dialog.destroy()
+                self.start_backfill(*params)
+
+            btns = tk.Frame(dialog, padx=20, pady=10)
+            btns.pack(fill=tk.X, side=tk.BOTTOM)
+            tk.Button(btns, text="取消", command=dialog.destroy, cursor="hand2").pack(side=tk.RIGHT, padx=5)
+            tk.Button(btns, text="开始补全", command=on_start, bg="#28a745", fg="white", cursor="hand2").pack(side=tk.RIGHT, padx=5)
+            tk.Button(btns, text="重新估算", command=refresh_estimate, cursor="hand2").pack(side=tk.LEFT, padx=5)
+            refresh_estimate()
+        except Exception as e:
+            traceback.print_exc()
+            messagebox.showerror("错误", f"打开批量补全失败: {str(e)}")
+
+    # ==================== 执行 ====================
+
+    def start_backfill(self, start, end, concurrency=DEFAULT_CONCURRENCY, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, packed=True):
+        """
+        启动批量补全（在界面线程调用）
+        Args:
+            start, end: 章节索引范围，均包含
+            concurrency: 并发请求数
+            requests_per_minute: 每分钟请求上限
+            packed: 是否将短章节合并为一次摘要请求
+        """
+        summary_targets, chain_targets = self.plan(start, end)
+        if not summary_targets and not chain_targets:
+            messagebox.showinfo("提示", "所选范围内的章节摘要均已完整，无需补全。")
+            return
+
+        self.app.generation_service._update_ai_config()
+
+        # 在界面线程中取好工作线程需要的数据，避免跨线程读取章节列表
+        chapter_list = self.app.chapter_list
+        contents = {idx: chapter_list[idx].get("content", "") or "" for idx in range(start, end + 1)}
+        summaries = {idx: (chapter_list[idx].get("summary", "") or "").strip() for idx in range(start, end + 1)}
+        existing_chain = {
+            idx: {key: (chapter_list[idx].get(key, "") or "").strip() for key in ("global_summary", "char_status", "char_relations")}
+            for idx in range(start, end + 1)
+        }
+        prev_state = {"global_summary": "", "char_status": "", "char_relations": ""}
+        if start > 0:
+            prev = chapter_list[start - 1]
+            prev_state = {key: (prev.get(key, "") or "").strip() for key in prev_state}
+        if not prev_state["global_summary"] and hasattr(self.app, "novel_outline_text"):
+            prev_state["global_summary"] = self.app.novel_outline_text.get("1.0", tk.END).strip()
+
+        groups = self.pack_targets(summary_targets, contents) if packed else [[idx] for idx in summary_targets]
+        limiter = RateLimiter(requests_per_minute, concurrency)
+        cancel_event = threading.Event()
+        stats = {"calls": 0, "total": len(groups) + len(chain_targets) * 3, "tokens": 0,
+                 "started": time.monotonic(), "pending_persist": 0}
+
+        dialog = tk.Toplevel(self.app.root)
+        dialog.title("批量补全章节摘要")
+        dialog.transient(self.app.root)
+        dialog.resizable(False, False)
+        self.app.ui_helper.center_window(dialog, 460, 180)
+        status_label = tk.Label(dialog, text="准备中...", font=("Microsoft YaHei", 10))
+        status_label.pack(pady=(15, 5))
+        progress = ttk.Progressbar(dialog, length=400, mode="determinate", maximum=max(stats["total"], 1))
+        progress.pack(pady=5)
+        speed_label = tk.Label(dialog, text="", font=("Microsoft YaHei", 9), fg="#555")
+        speed_label.pack()
+        tk.Button(dialog, text="停止", command=cancel_event.set, cursor="hand2", width=10).pack(pady=10)
+        dialog.protocol("WM_DELETE_WINDOW", cancel_event.set)
+
+        def on_call_done(text, label):
+            """统计吞吐量并刷新进度（工作线程调用）"""
+            with self._lock:
+                stats["calls"] += 1
+                stats["tokens"] += PromptBuilder.estimate_tokens(text)
+                calls, tokens, total_calls = stats["calls"], stats["tokens"], stats["total"]
+            elapsed = max(time.monotonic() - stats["started"], 0.001)
+            rate = calls / elapsed * 60
+            remaining = (total_calls - calls) / rate * 60 if rate else 0
+
+            def update():
+                if dialog.winfo_exists():
+                    progress["maximum"] = max(total_calls, 1)
+                    progress["value"] = calls
+                    status_label.config(text=f"{label}（{calls}/{total_calls}）")
+                    speed_label.config(text=f"速度 {rate:.1f} 次/分钟 · 已输出约 {tokens:,} Token · 预计剩余 {int(remaining // 60)}分{int(remaining % 60)}秒")
+            self.app.root.after(0, update)
+
+        def apply_summary(idx, summary):
+            if 0 <= idx < len(self.app.chapter_list):
+                self.app.chapter_list[idx]["summary"] = summary
+                self.app.staleness_service.mark_summary_fresh(idx, self._content_hash(contents[idx]))
+                self._schedule_persist(stats)
+
+        def apply_chain(idx, record):
+            if 0 <= idx < len(self.app.chapter_list):
+                self._apply_chain_result(idx, record)
+                self._schedule_persist(stats)
+
+        def finish(message, is_error=False):
+            self._running = False
+            self.app.novel_service._persist_chapters_to_novel()
+            self.app.character_event_service.flush()
+            self.app.character_event_service.start_compaction()
+            self.app.novel_service.refresh_chapter_listbox()
+            if dialog.winfo_exists():
+                dialog.destroy()
+            if is_error:
+                messagebox.showerror("批量补全", message)
+            else:
+                messagebox.showinfo("批量补全", message)
+
+        def limited_generate(system_prompt, user_prompt, temperature, max_tokens):
+            return limiter.call(self.app.ai_client, system_prompt, user_prompt, temperature, max_tokens, cancel_event=cancel_event)
+
+        def call_ai(step, system_prompt, user_prompt, max_tokens, label, extra_calls=0):
+            if cancel_event.is_set():
+                raise BackfillCancelled()
+            if extra_calls:
+                with self._lock:
+                    stats["total"] += extra_calls
+            # 与手动定稿共用步骤缓存，相同输入不重复请求
+            result = self.app.step_cache_service.cached_generate(step, system_prompt, user_prompt, 0.3, max_tokens, limited_generate)
+            if cancel_event.is_set():
+                raise BackfillCancelled()
+            on_call_done(result, label)
+            return result
+
+        def backfill_thread():
+            pool = ThreadPoolExecutor(max_workers=limiter.max_concurrency)
+            try:
+                # --- 并行阶段：本章摘要 ---
+                def summarize_one(idx, extra_calls=0):
+                    prompt = PromptBuilder.build_chapter_summary_prompt(contents[idx])
+                    return call_ai("summary", SUMMARY_SYSTEM_PROMPT, prompt, 1000, f"正在生成第{idx+1}章摘要", extra_calls)
+
+                def summarize_group(group):
+                    """返回 [(索引, 摘要或错误信息), ...]"""
+                    if len(group) == 1:
+                        return [(group[0], summarize_one(group[0]))]
+                    prompt = PromptBuilder.build_packed_chapter_summary_prompt([(idx + 1, contents[idx]) for idx in group])
+                    text = call_ai("packed_summary", SUMMARY_SYSTEM_PROMPT, prompt, PACK_OUTPUT_TOKENS_PER_CHAPTER * len(group),
+                                   f"正在生成第{group[0]+1}-{group[-1]+1}章摘要（合并请求）")
+                    parsed = PromptBuilder.parse_packed_chapter_summaries(text, [idx + 1 for idx in group])
+                    results = []
+                    for idx in group:
+                        if idx + 1 in parsed:
+                            results.append((idx, parsed[idx + 1]))
+                        else:
+                            # 该章节的分段缺失或未通过校验，单独重发
+                            print(f"[警告] 合并摘要中第{idx+1}章解析失败，单独重新请求")
+                            results.append((idx, summarize_one(idx, extra_calls=1)))
+                    return results
+
+                failed = []
+                futures = [pool.submit(summarize_group, group) for group in groups]
+                for future in as_completed(futures):
+                    for idx, summary in future.result():
+                        if summary.startswith("❌"):
+                            failed.append(idx)
+                            continue
+                        summary = summary.strip()
+                        summaries[idx] = summary
+                        self._append_checkpoint({"chapter": idx, "hash": self._content_hash(contents[idx]), "summary": summary})
+                        self.app.root.after(0, lambda i=idx, s=summary: apply_summary(i, s))
+
+                # --- 串行阶段：全局摘要 / 人物动态 / 人物关系 ---
+                state = dict(prev_state)
+                chained = 0
+                for idx in range(start, end + 1):
+                    if not contents[idx].strip():
+                        continue
+                    if idx not in chain_targets:
+                        state = dict(existing_chain[idx])
+                        continue
+                    summary = summaries.get(idx, "")
+                    if not summary:
+                        self.app.root.after(0, lambda i=idx: finish(
+                            f"第{i+1}章缺少本章摘要，串行更新已在此停止（已完成 {chained} 章）。\n再次运行可从断点继续。", True))
+                        return
+
+                    num = idx + 1
+                    def generate_global(step, system_prompt, user_prompt, temperature, max_tokens, num=num):
+                        # 分段压缩是额外的一次请求
+                        extra = 1 if step == "global_summary_compact" else 0
+                        return call_ai(step, system_prompt, user_prompt, max_tokens, f"正在更新第{num}章全局摘要", extra)
+
+                    f_global = pool.submit(update_global_summary, generate_global, state["global_summary"], summary, num)
+                    f_status = pool.submit(call_ai, "char_status", STATUS_SYSTEM_PROMPT,
+                                           PromptBuilder.build_char_status_update_prompt(state["char_status"], summary, num),
+                                           1500, f"正在更新第{num}章人物动态")
+                    # 关系只查询本章出场人物相关的边；关系图尚无记录时沿用上一章的关系文本
+                    old_relations = self.app.relation_graph_service.context_for(summary, num, state["char_relations"])
+                    f_relations = pool.submit(call_ai, "char_relations", RELATIONS_SYSTEM_PROMPT,
+                                              PromptBuilder.build_char_relations_update_prompt(old_relations, summary, num),
+                                              1500, f"正在更新第{num}章人物关系")
+                    results = [f_global.result(), f_status.result(), f_relations.result()]
+                    for res in results:
+                        if res.startswith("❌"):
+                            self.app.root.after(0, lambda i=idx, r=res: finish(
+                                f"第{i+1}章更新失败，已停止（已完成 {chained} 章）：\n{r}\n\n再次运行可从断点继续。", True))
+                            return
+
+                    # 下一章组织关系上下文前先写入本章的关系变动
+                    self.app.relation_graph_service.apply_chapter(num, results[2])
+                    state = {
+                        "global_summary": results[0].strip(),
+                        "char_status": results[1].strip(),
+                        "char_relations": results[2].strip(),
+                    }
+                    record = dict(state, chapter=idx, hash=self._content_hash(contents[idx]))
+                    self._append_checkpoint(record)
+                    self.app.root.after(0, lambda i=idx, r=record: apply_chain(i, r))
+                    chained += 1
+
+                message = f"✅ 批量补全完成：生成本章摘要 {len(summary_targets) - len(failed)} 章，串行更新 {chained} 章。"
+                if failed:
+                    message += f"\n\n以下章节摘要生成失败：{', '.join(str(i + 1) for i in sorted(failed))}"
+                else:
+                    self._clear_checkpoint()
+                self.app.root.after(0, lambda: finish(message))
+            except BackfillCancelled:
+                self.app.root.after(0, lambda: finish("已停止批量补全，已完成的结果已保存，再次运行可从断点继续。"))
+            except Exception as e:
+                traceback.print_exc()
+                err = str(e)
+                self.app.root.after(0, lambda: finish(f"批量补全过程中发生错误：{err}", True))
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        self._running = True
+        threading.Thread(target=backfill_thread, daemon=True).start()
+
+    def _apply_chain_result(self, idx, record):
+        """写入串行阶段的结果，并将人物动态写入人物经历、人物关系变动写入关系图"""
+        chapter = self.app.chapter_list[idx]
+        chapter["global_summary"] = record.get("global_summary", "")
+        chapter["char_status"] = record.get("char_status", "")
+        chapter["char_relations"] = record.get("char_relations", "")
+        self.app.staleness_service.mark_chain_fresh(idx)
+        self.app.novel_service.update_character_profile_status(
+            chapter["char_status"], chapter_num=idx + 1, silent=True, persist=False
+        )
+        self.app.relation_graph_service.apply_chapter(idx + 1, chapter["char_relations"])
+
+    def _schedule_persist(self, stats):
+        """累计一定数量的结果后写一次 novel.ini（界面线程调用）"""
+        stats["pending_persist"] += 1
+        if stats["pending_persist"] >= PERSIST_EVERY:
+            stats["pending_persist"] = 0
+            self.app.novel_service._persist_chapters_to_novel()
@@ -0,0 +1,184 @@
+"""
+多候选生成服务
+章节大纲或开头不满意时，一次请求多个候选，在本地排序后并排展示，由用户挑选：
+    - 接口支持 n 参数时一次请求返回全部候选（输入只计费一次），否则在限流下并行请求；
+    - 排序只用无需调用 AI 的启发式指标：
+        格式：大纲是否包含 【章节标题】/【内容概述】/【章节高潮】/【章节钩子】 标签（与 _on_outline_success 的解析一致），
+              开头是否混入标题或标签；
+        篇幅：概述或开头的字数是否在合理范围内；
+        新颖度：与前文各章摘要的 TF-IDF 相似度越低越好（开头另与前一章结尾比较），避免重复套路。
+候选数由 config.ini 的 [APP] candidate_count 设置。
+"""
+
+import re
+import tkinter as tk
+from tkinter import ttk, scrolledtext
+from concurrent.futures import ThreadPoolExecutor
+from AI.prompt_builder import PromptBuilder
+from AI.rate_limiter import RateLimiter
+from services.text_similarity import TfidfIndex
+
+
+MIN_CANDIDATES = 2
+MAX_CANDIDATES = 5
+CANDIDATE_REQUESTS_PER_MINUTE = 30
+# 大纲各标签的格式分权重
+OUTLINE_TAG_WEIGHTS = {"title": 0.3, "summary": 0.4, "climax": 0.15, "hook": 0.15}
+# 内容概述的合理字数范围
+OUTLINE_SUMMARY_CHARS = (150, 800)
+# 候选开头的目标字数
+OPENING_WORDS = 600
+# 新颖度比较时取前一章结尾的字数
+PREV_TAIL_CHARS = 1500
+# 综合得分权重：格式、篇幅、新颖度
+SCORE_WEIGHTS = (0.5, 0.2, 0.3)
+
+
+class CandidateService:
+    """多候选生成服务类"""
+
+    # 由 config.ini 的 [APP] candidate_count 设置
+    DEFAULT_COUNT = 3
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+
+    @staticmethod
+    def count():
+        return max(MIN_CANDIDATES, min(MAX_CANDIDATES, int(CandidateService.DEFAULT_COUNT)))
+
+    def collect(self, system_prompt, user_prompt, temperature, max_tokens, n, task):
+        """
+        请求 n 个候选（后台线程调用）
+        Returns:
+            [候选文本, ...]；全部失败时为 [以 ❌ 开头的错误信息]
+        """
+        ai_client = self.app.ai_client
+        with ai_client.task(task):
+            results = ai_client.generate_choices(system_prompt, user_prompt, temperature, max_tokens, n)
+        candidates = [text for text in results if not text.startswith("❌")]
+        errors = [text for text in results if text.startswith("❌")]
+        missing = n - len(candidates)
+        if missing > 0:
+            if candidates:
+                print(f"[信息] 接口只返回了 {len(candidates)} 个候选，并行补齐其余 {missing} 个")
+            limiter = RateLimiter(CANDIDATE_REQUESTS_PER_MINUTE, missing)
+
+            def request_one(_):
+                with ai_client.task(task):
+                    return limiter.call(ai_client, system_prompt, user_prompt, temperature, max_tokens)
+
+            with ThreadPoolExecutor(max_workers=missing) as pool:
+                for text in pool.map(request_one, range(missing)):
+                    (errors if text.startswith("❌") else candidates).append(text)
+        return candidates or errors[:1] or ["❌ 未生成任何候选"]
+
+    # ---------- 本地排序 ----------
+
+    def _novelty_index(self, current_idx):
+        """以前文各章摘要（无摘要时用概述）建立 TF-IDF 索引"""
+        index = TfidfIndex()
+        chapters = getattr(self.app, "chapter_list", [])[:current_idx or 0]
+        index.sync({i: ch.get("summary", "").strip() or ch.get("prompt", "").strip() for i, ch in enumerate(chapters)})
+        return index
+
+    @staticmethod
+    def _novelty(index, text, extra=""):
+        """1 - 与前文最相似一章（及 extra）的余弦相似度"""
+        scores = list(index.score(text).values())
+        if extra:
+            probe = TfidfIndex()
+            probe.sync({"extra": extra, "text": text})
+            scores += list(probe.score(text, ["extra"]).values())
+        return 1.0 - max(scores, default=0.0)
+
+    @staticmethod
+    def _length_score(length, low, high):
+        if length < low:
+            return length / low
+        if length > high:
+            return max(0.0, 1.0 - (length - high) / high)
+        return 1.0
+
+    @staticmethod
+    def _ranked(items):
+        for item in items:
+            item["score"] = sum(w * s for w, s in zip(SCORE_WEIGHTS, (item["format"], item["length"], item["novelty"])))
+        return sorted(items, key=lambda item: -item["score"])
+
+    def rank_outlines(self, texts, current_idx):
+        """
+        大纲候选排序
+        Returns:
+            [{"text", "score", "format", "length", "novelty", "notes"}, ...]，得分降序
+        """
+        index = self._novelty_index(current_idx)
+        items = []
+        for text in texts:
+            outline = PromptBuilder.parse_outline(text)
+            missing = [PromptBuilder.OUTLINE_TAGS[f] for f in OUTLINE_TAG_WEIGHTS if not outline[f]]
+            plot = "\n".join([outline["summary"], outline["climax"], outline["hook"]]).strip() or text
+            items.append({
+                "text": text,
+                "format": sum(w for f, w in OUTLINE_TAG_WEIGHTS.items() if outline[f]),
+                "length": self._length_score(len(outline["summary"]), *OUTLINE_SUMMARY_CHARS),
+                "novelty": self._novelty(index, plot),
+                "notes": f"缺少：{'、'.join(missing)}" if missing else "格式完整",
+            })
+        return self._ranked(items)
+
+    def rank_openings(self, texts, current_idx):
+        """开头候选排序（返回格式同 rank_outlines）"""
+        index = self._novelty_index(current_idx)
+        chapters = getattr(self.app, "chapter_list", [])
+        prev_tail = chapters[current_idx - 1].get("content", "")[-PREV_TAIL_CHARS:] if current_idx and current_idx <= len(chapters) else ""
+        items = []
+        for text in texts:
+            # 正文中不应出现章节标题或提示词标签
+            polluted = bool(re.match(r"\s*第[\d一二三四五六七八九十百千]+章", text)) or "【" in text
+            items.append({
+                "text": text,
+                "format": 0.5 if polluted else 1.0,
+                "length": self._length_score(len(text), OPENING_WORDS // 2, OPENING_WORDS * 2),
+                "novelty": self._novelty(index, text, prev_tail),
+                "notes": "混入了标题或标签" if polluted else f"{len(text)}字",
+            })
+        return self._ranked(items)
+
+    # ---------- 并排展示 ----------
+
+    def show(self, title, ranked, on_choose):
+        """
+        并排展示候选，点击“采用”后调用 on_choose(候选文本)
+        """
+        dialog = tk.Toplevel(self.app.root)
+        dialog.title(title)
+        dialog.transient(self.app.root)
+        dialog.grab_set()
+        self.app.ui_helper.center_window(dialog, min(1400, 380 * len(ranked) + 40), 640)
+
+        frame = tk.Frame(dialog, padx=10, pady=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+        frame.rowconfigure(0, weight=1)
+
+        def choose(text):
+            dialog.destroy()
+            on_choose(text)
+
+        for col, item in enumerate(ranked):
+            frame.columnconfigure(col, weight=1, uniform="candidate")
+            box = ttk.LabelFrame(frame, text=f"候选{col + 1}{'（推荐）' if col == 0 else ''} · 得分 {item['score']:.2f}", padding=6)
+            box.grid(row=0, column=col, sticky=tk.NSEW, padx=5)
+            tk.Label(box, text=f"格式 {item['format']:.2f} / 篇幅 {item['length']:.2f} / 新颖 {item['novelty']:.2f}\n{item['notes']}",
+                     font=("Microsoft YaHei", 9), fg="#555", justify=tk.LEFT).pack(anchor=tk.W)
+            text_widget = scrolledtext.ScrolledText(box, font=("Microsoft YaHei", 10), wrap=tk.WORD, width=30)
+            text_widget.insert("1.0", item["text"])
+            text_widget.config(state=tk.DISABLED)
+            text_widget.pack(fill=tk.BOTH, expand=True, pady=5)
+            tk.Button(box, text="✅ 采用此候选", command=lambda text=item["text"]: choose(text),
+                      font=("Microsoft YaHei", 9, "bold"), bg="#28a745", fg="white", cursor="hand2").pack(fill=tk.X)
@@ -0,0 +1,129 @@
+"""
+摘要链存储模块
+每章的 global_summary / char_status / char_relations 都是截至该章的累计结果，
+逐章保存完整文本会使 novel.ini 的体积与解析时间随章节数平方增长。
+
+存储格式（novel.ini）：
+    [CHAPTER_GLOBAL_SUMMARIES] 等原有分区   只保存检查点章节的完整文本
+    [CHAPTER_GLOBAL_SUMMARY_DELTAS] 等分区   其余章节相对上一章的行级差异（JSON）
+    [META] chain_storage = delta             格式标记，缺失时按旧版（逐章完整文本）读取
+
+差异格式为操作列表：[起, 止] 表示复制上一章第 起~止-1 行，字符串表示插入的新行（多行以换行连接）。
+每隔 CHECKPOINT_INTERVAL 章、或差异不比完整文本更短时写入检查点，
+因此重建任意一章最多只需回溯 CHECKPOINT_INTERVAL 章。
+"""
+
+import json
+import difflib
+
+
+CHAIN_STORAGE_VERSION = "delta"
+# 检查点间隔（章）
+CHECKPOINT_INTERVAL = 20
+
+# 字段 -> (检查点分区, 差异分区)
+CHAIN_SECTIONS = {
+    "global_summary": ("CHAPTER_GLOBAL_SUMMARIES", "CHAPTER_GLOBAL_SUMMARY_DELTAS"),
+    "char_status": ("CHAPTER_CHAR_STATUSES", "CHAPTER_CHAR_STATUS_DELTAS"),
+    "char_relations": ("CHAPTER_CHAR_RELATIONS", "CHAPTER_CHAR_RELATION_DELTAS"),
+}
+
+
+def encode_delta(prev_text, text):
+    """计算 text 相对 prev_text 的行级差异，返回 JSON 字符串"""
+    prev_lines = (prev_text or "").split("\n")
+    lines = (text or "").split("\n")
+    ops = []
+    matcher = difflib.SequenceMatcher(None, prev_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("\n".join(lines[j1:j2]))
+    return json.dumps(ops, ensure_ascii=False, separators=(",", ":"))
+
+
+def apply_delta(prev_text, delta):
+    """将差异应用到上一章文本，返回本章文本"""
+    prev_lines = (prev_text or "").split("\n")
+    lines = []
+    for op in json.loads(delta):
+        if isinstance(op, list):
+            lines.extend(prev_lines[op[0]:op[1]])
+        else:
+            lines.extend(op.split("\n"))
+    return "\n".join(lines)
+
+
+def is_delta_format(config):
+    return "META" in config and config["META"].get("chain_storage", "") == CHAIN_STORAGE_VERSION
+
+
+def needs_migration(config):
+    """旧版格式（逐章完整文本）且存在摘要链数据时需要迁移"""
+    if is_delta_format(config):
+        return False
+    return any(section in config and len(config[section]) > 0
+               for section, _ in CHAIN_SECTIONS.values())
+
+
+def write_chain(config, chapter_list):
+    """
+    将各章摘要链按“检查点 + 差异”写入配置（会先清空相关分区）
+    Returns:
+        写入的检查点数量
+    """
+    for section, delta_section in CHAIN_SECTIONS.values():
+        for name in (section, delta_section):
+            if name in config:
+                config.remove_section(name)
+            config.add_section(name)
+    if "META" not in config:
+        config.add_section("META")
+    config.set("META", "chain_storage", CHAIN_STORAGE_VERSION)
+
+    checkpoints = 0
+    for key, (section, delta_section) in CHAIN_SECTIONS.items():
+        prev_text = ""
+        for idx, chapter in enumerate(chapter_list):
+            # configparser 读回时会去掉值首尾的空白，差异须基于同样去除首尾空白的文本计算，才能原样重建
+            text = str(chapter.get(key, "") or "").strip()
+            if idx % CHECKPOINT_INTERVAL == 0:
+                config.set(section, str(idx), text)
+                checkpoints += 1
+            else:
+                delta = encode_delta(prev_text, text)
+                if len(delta) < len(text):
+                    config.set(delta_section, str(idx), delta)
+                else:
+                    # 整体改写的章节直接作为检查点，不比差异更大
+                    config.set(section, str(idx), text)
+                    checkpoints += 1
+            prev_text = text
+    return checkpoints
+
+
+def read_chain(config, indices):
+    """
+    按章节顺序重建各章摘要链（兼容旧版格式）
+    Returns:
+        {索引: {"global_summary": ..., "char_status": ..., "char_relations": ...}}
+    """
+    result = {idx: {} for idx in indices}
+    delta_format = is_delta_format(config)
+    for key, (section, delta_section) in CHAIN_SECTIONS.items():
+        full = config[section] if section in config else {}
+        deltas = config[delta_section] if delta_format and delta_section in config else {}
+        prev_text = ""
+        for idx in indices:
+            text = full.get(str(idx))
+            if text is None and str(idx) in deltas:
+                try:
+                    text = apply_delta(prev_text, deltas[str(idx)])
+                except (ValueError, TypeError, IndexError) as e:
+                    print(f"[警告] 第{idx+1}章 {key} 差异数据损坏，已置空: {e}")
+                    text = ""
+            text = text or ""
+            result[idx][key] = text
+            prev_text = text
+    return result
@@ -0,0 +1,530 @@
+"""
+人物经历存储服务
+定稿时解析出的人物动态按“角色 + 章节”结构化保存，与人物档案（静态设定）分离，
+避免档案文本无限增长、每次写 novel.ini 都重复序列化全部经历。
+
+存储文件：<小说目录>/character_events.jsonl，只追加，每行一条：
+    {"name": 角色名, "chapter": 章节序号, "events": [{"text": 经历, "tags": [标签, ...]}, ...]}
+    {"type": "periods", "name": 角色名, "watermark": 章节序号, "periods": [{"start", "end", "summary"}, ...]}
+同一角色同一章节以最后写入的记录为准（events 为空表示删除），加载时按需压缩。
+
+内存中每个角色维护按章节排序的章节列表，“最近 N 条”“自第 X 章以来”均通过二分查找完成。
+
+滚动压缩：后台任务在限流下让 AI 将水位线之后、最近 KEEP_RECENT_CHAPTERS 章之前的经历
+归纳为阶段摘要，并记录新的水位线；阶段摘要超过 MAX_PERIODS 段时合并最旧的两段。
+原始经历保留不动，提示词只携带“阶段摘要 + 水位线之后的经历”，长度与全书篇幅无关。
+"""
+
+import os
+import re
+import json
+import bisect
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from AI.prompt_builder import PromptBuilder
+from AI.rate_limiter import RateLimiter
+
+
+CHARACTER_EVENTS_FILENAME = "character_events.jsonl"
+# 组织提示词时每个角色默认附带的最近经历条数
+RECENT_EVENT_LIMIT = 5
+# 滚动压缩：最近若干章的经历保持原文
+KEEP_RECENT_CHAPTERS = 5
+# 水位线之后至少积累多少章经历才触发一次压缩
+COMPACT_BATCH_CHAPTERS = 10
+# 单次压缩最多处理的章数（旧数据首次压缩时分多轮推进水位线）
+COMPACT_MAX_CHAPTERS_PER_CALL = 40
+# 阶段摘要的段数上限与单段字数上限
+MAX_PERIODS = 3
+PERIOD_MAX_CHARS = 300
+# 提示词中最多携带的未压缩经历章数
+MAX_PROMPT_EVENT_CHAPTERS = KEEP_RECENT_CHAPTERS + COMPACT_BATCH_CHAPTERS
+# 后台压缩的限流参数
+COMPACT_CONCURRENCY = 2
+COMPACT_REQUESTS_PER_MINUTE = 10
+COMPACT_SYSTEM_PROMPT = "你是一位资深小说编辑，负责归纳人物经历。"
+# 旧版档案中累加经历所用的标题
+LEGACY_LOG_HEADERS = ("【人物经历】", "【状态变迁日志】")
+
+_LEGACY_LINE_PATTERN = re.compile(r"^第(\d+)章[：:]\s*(.+)$")
+_TAG_PATTERN = re.compile(r"^【([^】]{1,8})】")
+
+
+class CharacterEventService:
+    """人物经历存储服务类"""
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._lock = threading.RLock()
+        # {角色名: {"chapters": [已排序章节序号], "by_chapter": {章节序号: [事件, ...]}}}
+        self._events = {}
+        # {角色名: {"watermark": 已压缩到的章节, "periods": [{"start", "end", "summary"}, ...]}}
+        self._periods = {}
+        self._pending = []
+        self._loaded_dir = None
+        self._compact_thread = None
+
+    def _events_path(self):
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        return os.path.join(novel_dir, CHARACTER_EVENTS_FILENAME) if novel_dir else ""
+
+    # ==================== 加载与写入 ====================
+
+    def _ensure_loaded(self):
+        """切换小说后重新加载经历文件（调用方需持有锁）"""
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if novel_dir == self._loaded_dir:
+            return
+        self._events = {}
+        self._periods = {}
+        self._pending = []
+        self._loaded_dir = novel_dir
+        path = self._events_path()
+        if not path or not os.path.exists(path):
+            return
+        line_count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                line_count += 1
+                try:
+                    record = json.loads(line)
+                    if record.get("type") == "periods":
+                        self._periods[record["name"]] = {"watermark": int(record["watermark"]),
+                                                         "periods": record.get("periods", [])}
+                    else:
+                        self._set_chapter(record["name"], int(record["chapter"]), record.get("events", []))
+                except (ValueError, KeyError, TypeError):
+                    continue
+        record_count = sum(len(entry["chapters"]) for entry in self._events.values()) + len(self._periods)
+        if line_count > record_count * 2:
+            self._compact()
+
+    def _set_chapter(self, name, chapter, events):
+        """在内存中设置某角色某章的经历（调用方需持有锁）"""
+        entry = self._events.setdefault(name, {"chapters": [], "by_chapter": {}})
+        chapters = entry["chapters"]
+        pos = bisect.bisect_left(chapters, chapter)
+        exists = pos < len(chapters) and chapters[pos] == chapter
+        if events:
+            if not exists:
+                chapters.insert(pos, chapter)
+            entry["by_chapter"][chapter] = events
+        elif exists:
+            chapters.pop(pos)
+            entry["by_chapter"].pop(chapter, None)
+        if not chapters:
+            self._events.pop(name, None)
+
+    def _compact(self):
+        """按当前内存内容重写经历文件（调用方需持有锁）"""
+        path = self._events_path()
+        if not path:
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for name, entry in self._events.items():
+                for chapter in entry["chapters"]:
+                    record = {"name": name, "chapter": chapter, "events": entry["by_chapter"][chapter]}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            for name, state in self._periods.items():
+                f.write(json.dumps(self._periods_record(name, state), ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+        self._pending = []
+
+    def flush(self):
+        """将尚未写入的记录追加到经历文件"""
+        path = self._events_path()
+        if not path:
+            return False
+        try:
+            with self._lock:
+                if not self._pending:
+                    return True
+                with open(path, "a", encoding="utf-8") as f:
+                    for record in self._pending:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._pending = []
+            return True
+        except Exception as e:
+            print(f"[警告] 写入人物经历失败: {e}")
+            traceback.print_exc()
+            return False
+
+    @staticmethod
+    def extract_tags(text):
+        """提取经历开头的【标签】，如“【受伤】左臂中箭”"""
+        tags = []
+        rest = text.strip()
+        match = _TAG_PATTERN.match(rest)
+        while match:
+            tags.append(match.group(1).strip())
+            rest = rest[match.end():].lstrip()
+            match = _TAG_PATTERN.match(rest)
+        return tags
+
+    def record_chapter(self, name, chapter, texts, persist=True):
+        """
+        记录某角色在某章的经历（覆盖该章已有记录，重复定稿不会累加）
+        Args:
+            name: 角色名
+            chapter: 章节序号（从1开始）
+            texts: 经历文本列表
+            persist: 为False时只更新内存，由调用方稍后调用 flush()
+        Returns:
+            是否有变化
+        """
+        events = [{"text": text, "tags": self.extract_tags(text)} for text in texts if text]
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._events.get(name)
+            if (entry["by_chapter"].get(chapter) if entry else None) == (events or None):
+                return False
+            self._set_chapter(name, chapter, events)
+            self._pending.append({"name": name, "chapter": chapter, "events": events})
+        if persist:
+            self.flush()
+        return True
+
+    @staticmethod
+    def _periods_record(name, state):
+        return {"type": "periods", "name": name, "watermark": state["watermark"], "periods": state["periods"]}
+
+    def rename(self, old_name, new_name):
+        """角色改名时迁移其经历与阶段摘要"""
+        if old_name == new_name:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._events.pop(old_name, None)
+            state = self._periods.pop(old_name, None)
+            if not entry and not state:
+                return
+            for chapter in (entry["chapters"] if entry else []):
+                self._set_chapter(new_name, chapter, entry["by_chapter"][chapter])
+            if state:
+                self._periods[new_name] = state
+            self._compact()
+
+    def delete(self, name):
+        """删除角色时一并删除其经历与阶段摘要"""
+        with self._lock:
+            self._ensure_loaded()
+            removed = self._events.pop(name, None) or self._periods.get(name)
+            self._periods.pop(name, None)
+            if removed:
+                self._compact()
+
+    def shift_chapters(self, index, delta):
+        """
+        章节插入或删除后改写经历中的章节序号
+        Args:
+            index: 插入或删除的位置（章节索引）
+            delta: 1 表示在 index 处插入了一章，-1 表示删除了第 index 章（其经历一并丢弃）
+        删除的章节已被压缩时，丢弃包含它及其后的阶段摘要并回退水位线，由后台按原始经历重新压缩
+        """
+        removed = index + 1
+        try:
+            with self._lock:
+                self._ensure_loaded()
+                if not self._events_path() or not (self._events or self._periods):
+                    return
+                events = self._events
+                self._events = {}
+                for name, entry in events.items():
+                    for chapter in entry["chapters"]:
+                        new_chapter = chapter
+                        if chapter > index:
+                            if delta < 0 and chapter == removed:
+                                continue
+                            new_chapter = chapter + delta
+                        self._set_chapter(name, new_chapter, entry["by_chapter"][chapter])
+                for name, state in list(self._periods.items()):
+                    if state["watermark"] <= index:
+                        continue
+                    if delta > 0:
+                        periods = [dict(p, start=p["start"] + (1 if p["start"] > index else 0), end=p["end"] + 1)
+                                   if p["end"] > index else p for p in state["periods"]]
+                        self._periods[name] = {"watermark": state["watermark"] + 1, "periods": periods}
+                    else:
+                        periods = [p for p in state["periods"] if p["end"] < removed]
+                        if periods:
+                            self._periods[name] = {"watermark": periods[-1]["end"], "periods": periods}
+                        else:
+                            self._periods.pop(name)
+                self._compact()
+        except Exception as e:
+            print(f"[警告] 改写人物经历的章节序号失败: {e}")
+            traceback.print_exc()
+
+    def replace_from_text(self, name, text):
+        """
+        用“第N章：经历；经历”格式的文本整体替换某角色的经历（人物经历编辑窗口保存时调用）
+        Returns:
+            无法识别的行列表（这些行不会保存）
+        """
+        by_chapter, invalid = {}, []
+        for line in (text or "").splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            match = _LEGACY_LINE_PATTERN.match(line)
+            if not match:
+                invalid.append(line)
+                continue
+            texts = [t.strip() for t in match.group(2).split("；") if t.strip()]
+            by_chapter.setdefault(int(match.group(1)), []).extend(texts)
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._events.get(name)
+            for chapter in list(entry["chapters"] if entry else []):
+                if chapter not in by_chapter:
+                    self.record_chapter(name, chapter, [], persist=False)
+            for chapter, texts in by_chapter.items():
+                self.record_chapter(name, chapter, texts, persist=False)
+        self.flush()
+        return invalid
+
+    def periods(self, name):
+        """某角色已压缩的阶段摘要 [{"start", "end", "summary"}, ...]"""
+        with self._lock:
+            self._ensure_loaded()
+            state = self._periods.get(name)
+            return [dict(p) for p in state["periods"]] if state else []
+
+    # ==================== 查询 ====================
+
+    def count(self, name=None):
+        """经历条数（按章节计）"""
+        with self._lock:
+            self._ensure_loaded()
+            if name is not None:
+                entry = self._events.get(name)
+                return len(entry["chapters"]) if entry else 0
+            return sum(len(entry["chapters"]) for entry in self._events.values())
+
+    def _collect(self, entry, chapters):
+        return [dict(event, chapter=chapter) for chapter in chapters for event in entry["by_chapter"][chapter]]
+
+    def latest(self, name, n=RECENT_EVENT_LIMIT, before_chapter=None):
+        """
+        最近 n 章的经历（按章节升序）
+        Args:
+            before_chapter: 只取该章之前的经历（续写前文时避免混入后文）
+        Returns:
+            [{"chapter": 章节序号, "text": 经历, "tags": [...]}, ...]
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._events.get(name)
+            if not entry or n <= 0:
+                return []
+            chapters = entry["chapters"]
+            end = len(chapters) if before_chapter is None else bisect.bisect_left(chapters, before_chapter)
+            return self._collect(entry, chapters[max(0, end - n):end])
+
+    def since(self, name, chapter, before_chapter=None):
+        """自第 chapter 章（含）以来的经历，按章节升序"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._events.get(name)
+            if not entry:
+                return []
+            chapters = entry["chapters"]
+            start = bisect.bisect_left(chapters, chapter)
+            end = len(chapters) if before_chapter is None else bisect.bisect_left(chapters, before_chapter)
+            return self._collect(entry, chapters[start:end])
+
+    @staticmethod
+    def format_events(events):
+        """将经历格式化为“第N章：...”文本，同章多条以分号连接"""
+        lines = []
+        for event in events:
+            line_head = f"第{event['chapter']}章："
+            if lines and lines[-1].startswith(line_head):
+                lines[-1] += "；" + event["text"]
+            else:
+                lines.append(line_head + event["text"])
+        return "\n".join(lines)
+
+    def watermark(self, name):
+        """某角色经历已压缩到的章节，未压缩过返回 0"""
+        with self._lock:
+            self._ensure_loaded()
+            state = self._periods.get(name)
+            return state["watermark"] if state else 0
+
+    def profile_for_prompt(self, name, profile, before_chapter=None, limit=MAX_PROMPT_EVENT_CHAPTERS):
+        """
+        返回用于提示词的人物档案：静态设定 + 阶段摘要 + 水位线之后的经历
+        只使用 before_chapter 之前的阶段与经历，长度有上界
+        """
+        with self._lock:
+            self._ensure_loaded()
+            state = self._periods.get(name)
+            periods = [p for p in (state["periods"] if state else [])
+                       if before_chapter is None or p["end"] < before_chapter]
+        covered = periods[-1]["end"] if periods else 0
+        events = [e for e in self.latest(name, limit, before_chapter) if e["chapter"] > covered]
+        parts = [(profile or "").strip()]
+        if periods:
+            parts.append("【前期经历】\n" + "\n".join(f"第{p['start']}-{p['end']}章：{p['summary']}" for p in periods))
+        if events:
+            parts.append(f"【近期经历】\n{self.format_events(events)}")
+        if len(parts) == 1:
+            return profile
+        return "\n\n".join(parts)
+
+    def profiles_for_prompt(self, profiles, before_chapter=None, limit=MAX_PROMPT_EVENT_CHAPTERS):
+        """对 {角色名: 档案} 批量附加经历"""
+        return {name: self.profile_for_prompt(name, profile, before_chapter, limit) for name, profile in profiles.items()}
+
+    # ==================== 滚动压缩 ====================
+
+    def _plan_compaction(self, total_chapters):
+        """
+        找出需要压缩的角色（调用方需持有锁）
+        Returns:
+            [(角色名, 起始章, 截止章, 经历列表), ...]
+        """
+        cutoff = total_chapters - KEEP_RECENT_CHAPTERS
+        jobs = []
+        for name, entry in self._events.items():
+            watermark = self._periods.get(name, {}).get("watermark", 0)
+            chapters = entry["chapters"]
+            start = bisect.bisect_right(chapters, watermark)
+            end = bisect.bisect_right(chapters, cutoff)
+            if end - start >= COMPACT_BATCH_CHAPTERS:
+                end = min(end, start + COMPACT_MAX_CHAPTERS_PER_CALL)
+                jobs.append((name, watermark + 1, chapters[end - 1], self._collect(entry, chapters[start:end])))
+        return jobs
+
+    def is_compacting(self):
+        return bool(self._compact_thread and self._compact_thread.is_alive())
+
+    def start_compaction(self):
+        """
+        在后台压缩各角色较早的经历（界面线程调用，已在运行时忽略）
+        Returns:
+            是否启动了压缩任务
+        """
+        if self.is_compacting():
+            return False
+        total = len(getattr(self.app, "chapter_list", []) or [])
+        with self._lock:
+            self._ensure_loaded()
+            jobs = self._plan_compaction(total)
+            novel_dir = self._loaded_dir
+        if not jobs:
+            return False
+
+        if hasattr(self.app, "generation_service"):
+            self.app.generation_service._update_ai_config()
+        limiter = RateLimiter(COMPACT_REQUESTS_PER_MINUTE, COMPACT_CONCURRENCY)
+
+        def limited_generate(system_prompt, user_prompt, temperature, max_tokens):
+            return limiter.call(self.app.ai_client, system_prompt, user_prompt, temperature, max_tokens)
+
+        def summarize(name, history_text):
+            prompt = PromptBuilder.build_character_history_compact_prompt(name, history_text, PERIOD_MAX_CHARS)
+            return self.app.step_cache_service.cached_generate(
+                "char_history_compact", COMPACT_SYSTEM_PROMPT, prompt, 0.3, 800, limited_generate)
+
+        def compact_one(name, start, end, events):
+            summary = summarize(name, self.format_events(events))
+            if summary.startswith("❌"):
+                print(f"[警告] 压缩 {name} 的经历失败: {summary[:60]}")
+                return False
+            with self._lock:
+                if self._loaded_dir != novel_dir:
+                    return False
+                state = self._periods.get(name) or {"watermark": 0, "periods": []}
+                if state["watermark"] != start - 1:
+                    return False
+                periods = state["periods"] + [{"start": start, "end": end, "summary": summary.strip()}]
+                fold = periods[:2] if len(periods) > MAX_PERIODS else None
+            if fold:
+                # 阶段数超过上限：合并最旧的两段
+                merged = summarize(name, "\n".join(f"第{p['start']}-{p['end']}章：{p['summary']}" for p in fold))
+                if not merged.startswith("❌"):
+                    periods = [{"start": fold[0]["start"], "end": fold[1]["end"], "summary": merged.strip()}] + periods[2:]
+            with self._lock:
+                if self._loaded_dir != novel_dir:
+                    return False
+                state = {"watermark": end, "periods": periods}
+                self._periods[name] = state
+                self._pending.append(self._periods_record(name, state))
+            self.flush()
+            print(f"[信息] 已压缩 {name} 第{start}-{end}章的经历，水位线推进到第{end}章")
+            return True
+
+        def compact_thread():
+            done = 0
+            try:
+                round_jobs = jobs
+                with ThreadPoolExecutor(max_workers=limiter.max_concurrency) as pool:
+                    while round_jobs:
+                        results = list(pool.map(lambda job: compact_one(*job), round_jobs))
+                        if not any(results):
+                            break
+                        done += sum(1 for ok in results if ok)
+                        # 水位线推进后仍有积压的角色继续下一轮
+                        with self._lock:
+                            round_jobs = self._plan_compaction(total) if self._loaded_dir == novel_dir else []
+            except Exception as e:
+                print(f"[警告] 人物经历压缩任务异常: {e}")
+                traceback.print_exc()
+            print(f"[信息] 人物经历压缩结束，共完成 {done} 次压缩")
+
+        self._compact_thread = threading.Thread(target=compact_thread, daemon=True)
+        self._compact_thread.start()
+        return True
+
+    # ==================== 旧版档案迁移 ====================
+
+    def migrate_profile_logs(self):
+        """
+        将旧版人物档案中累加的“第N章：...”经历移入经历存储，并从档案文本中删除
+        Returns:
+            迁移的角色数
+        """
+        details = getattr(self.app, "character_setting_details", None)
+        if not details:
+            return 0
+        migrated = 0
+        try:
+            for name, content in list(details.items()):
+                header_pos = min((content.find(h) for h in LEGACY_LOG_HEADERS if h in content), default=-1)
+                if header_pos < 0:
+                    continue
+                profile_part = content[:header_pos].rstrip()
+                kept_lines = []
+                for line in content[header_pos:].splitlines():
+                    line = line.strip()
+                    if not line or line in LEGACY_LOG_HEADERS:
+                        continue
+                    match = _LEGACY_LINE_PATTERN.match(line)
+                    if match:
+                        texts = [t.strip() for t in match.group(2).split("；") if t.strip()]
+                        self.record_chapter(name, int(match.group(1)), texts, persist=False)
+                    else:
+                        kept_lines.append(line)
+                if kept_lines:
+                    profile_part = (profile_part + "\n\n" + "\n".join(kept_lines)).strip()
+                details[name] = profile_part
+                migrated += 1
+            if migrated:
+                self.flush()
+                print(f"[信息] 已将 {migrated} 位角色档案中的经历日志迁移到 {CHARACTER_EVENTS_FILENAME}")
+        except Exception as e:
+            print(f"[警告] 迁移人物经历失败: {e}")
+            traceback.print_exc()
+        return migrated
@@ -24,6 +24,9 @@ class ConfigManager:
             - max_tokens: 当前选中API的最大token数
             - current_api: 当前选中的API配置名称
             - available_apis: 所有可用的API配置列表 [{name, api_key, api_base, model, temperature, max_tokens}, ...]
+            - cache_friendly_prompts: 是否使用缓存友好的提示词布局
+            - scene_parallel_drafting: 长章节是否分场景并行创作
+            - candidate_count: 多候选构思/候选开头一次生成的候选数
         """
         config = configparser.ConfigParser(interpolation=None)
         os.makedirs("config", exist_ok=True)
@@ -69,6 +72,12 @@ class ConfigManager:
             
             # 获取当前使用的API配置名称
             current_api = config.get('APP', 'current_api', fallback='DEEPSEEK')
+            # 缓存友好的提示词布局
+            cache_friendly_prompts = config.getboolean('APP', 'cache_friendly_prompts', fallback=False)
+            # 长章节分场景并行创作
+            scene_parallel_drafting = config.getboolean('APP', 'scene_parallel_drafting', fallback=False)
+            # 多候选生成的候选数
+            candidate_count = config.getint('APP', 'candidate_count', fallback=3)
             
             # 获取所有API配置
             available_apis = []
@@ -120,7 +129,10 @@ class ConfigManager:
                 'max_tokens': current_api_config['max_tokens'],
                 'timeout': current_api_config['timeout'],
                 'current_api': current_api,
-                'available_apis': available_apis
+                'available_apis': available_apis,
+                'cache_friendly_prompts': cache_friendly_prompts,
+                'scene_parallel_drafting': scene_parallel_drafting,
+                'candidate_count': candidate_count
             }
         except (configparser.NoSectionError, configparser.NoOptionError) as e:
             print(f"错误: 配置文件格式错误: {e}")
@@ -144,6 +156,12 @@ timeout = 300
 current_api = DEEPSEEK
 # 上次打开的小说文件路径（程序会自动更新此项）
 last_novel = 
+# 缓存友好的提示词布局：稳定内容（风格、设定、任务说明）放在前面，便于接口复用提示词前缀缓存
+cache_friendly_prompts = true
+# 长章节分场景并行创作：先拆分场景计划，各场景同时生成后再润色衔接处，缩短等待时间（请求数更多）
+scene_parallel_drafting = false
+# 多候选构思/候选开头一次生成的候选数（2-5），接口支持 n 参数时一次请求返回全部候选
+candidate_count = 3
 
 # ========== AI接口配置 ==========
 # 你可以配置多个AI接口，通过修改 [APP] 中的 current_api 来切换使用哪个接口
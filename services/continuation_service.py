@@ -0,0 +1,144 @@
+"""
+续写上下文服务
+续写长章节时不再把整章原文放进提示词，而是发送“前文摘要 + 结尾原文窗口”：
+    - 结尾约 TAIL_WINDOW_CHARS 字保持原文，保证衔接处的语气与细节；
+    - 更早的部分使用摘要。摘要按章节缓存，每次续写只把新移出窗口的段落并入摘要，
+      因此无论章节写到多长，续写提示词的体量都基本不变。
+前文被修改（缓存覆盖的原文不再是当前前文的开头）时，摘要按当前前文重新生成。
+
+缓存文件：<小说目录>/continuation_summaries.json
+    {章节索引: {"hash": 已摘要前文的哈希, "length": 已摘要前文的字数, "summary": 摘要}}
+"""
+
+import os
+import json
+import hashlib
+import threading
+import traceback
+from AI.prompt_builder import PromptBuilder
+
+
+CONTINUATION_SUMMARIES_FILENAME = "continuation_summaries.json"
+# 结尾保留原文的字数
+TAIL_WINDOW_CHARS = 1500
+# 章节短于 TAIL_WINDOW_CHARS + 该字数时直接发送全文
+MIN_SUMMARIZED_CHARS = 1500
+# 前文摘要的字数上限
+SUMMARY_MAX_CHARS = 600
+# 窗口起点向后寻找段落边界的最大距离
+PARAGRAPH_SEARCH_CHARS = 300
+SUMMARY_SYSTEM_PROMPT = "你是一位专业的小说编辑，请精准提炼章节已写部分的剧情，供续写时参考。"
+
+
+class ContinuationService:
+    """续写上下文服务类"""
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._lock = threading.Lock()
+        self._summaries = {}
+        self._loaded_dir = None
+
+    def _cache_path(self):
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        return os.path.join(novel_dir, CONTINUATION_SUMMARIES_FILENAME) if novel_dir else ""
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+    def _ensure_loaded(self):
+        """切换小说后加载缓存文件（调用方需持有锁）"""
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if novel_dir == self._loaded_dir:
+            return
+        self._loaded_dir = novel_dir
+        self._summaries = {}
+        path = self._cache_path()
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._summaries = {int(k): v for k, v in json.load(f).items()}
+        except Exception as e:
+            print(f"[警告] 读取续写前文摘要失败，将重新生成: {e}")
+            self._summaries = {}
+
+    def _save(self):
+        """写回缓存文件（调用方需持有锁）"""
+        path = self._cache_path()
+        if not path:
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({str(k): v for k, v in sorted(self._summaries.items())}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def split(content):
+        """
+        将已有正文分为 (前文, 结尾窗口)；窗口从段落开头开始
+        章节较短时前文为空、窗口为全文
+        """
+        content = content or ""
+        if len(content) < TAIL_WINDOW_CHARS + MIN_SUMMARIZED_CHARS:
+            return "", content
+        cut = len(content) - TAIL_WINDOW_CHARS
+        newline = content.find("\n", cut, cut + PARAGRAPH_SEARCH_CHARS)
+        if newline != -1:
+            cut = newline + 1
+        return content[:cut].rstrip(), content[cut:].lstrip("\n")
+
+    def prepare(self, chapter_idx, content, generate=None):
+        """
+        组织续写所需的已有内容（后台线程调用，可能请求 AI 更新前文摘要）
+        Args:
+            chapter_idx: 章节索引
+            content: 当前章节已有正文
+            generate: 实际调用函数 f(step, system_prompt, user_prompt, temperature, max_tokens)，
+                      默认为带缓存的 step_cache_service.cached_generate
+        Returns:
+            (前文摘要, 结尾原文)；无需摘要或摘要失败时为 ("", 全文)
+        """
+        prefix, tail = self.split(content)
+        if not prefix:
+            return "", content
+        generate = generate or self.app.step_cache_service.cached_generate
+        try:
+            with self._lock:
+                self._ensure_loaded()
+                cached = dict(self._summaries.get(chapter_idx) or {})
+                novel_dir = self._loaded_dir
+            length = cached.get("length", 0)
+            reusable = (cached and length <= len(prefix)
+                        and self._hash(prefix[:length]) == cached.get("hash"))
+            if reusable and length == len(prefix):
+                print(f"[信息] 续写使用缓存的前文摘要（前文 {len(prefix)} 字）")
+                return cached["summary"], tail
+
+            if reusable:
+                old_summary, new_text = cached["summary"], prefix[length:]
+                print(f"[信息] 续写前文摘要增量更新：新增 {len(new_text)} 字并入摘要")
+            else:
+                old_summary, new_text = "", prefix
+                print(f"[信息] 续写前文摘要重新生成：前文 {len(prefix)} 字")
+            prompt = PromptBuilder.build_continuation_summary_prompt(old_summary, new_text, SUMMARY_MAX_CHARS)
+            summary = generate("continuation_summary", SUMMARY_SYSTEM_PROMPT, prompt, 0.3, 1200)
+            if not summary or summary.startswith("❌"):
+                print(f"[警告] 更新续写前文摘要失败，改为发送全文: {(summary or '')[:60]}")
+                return "", content
+            summary = summary.strip()
+            with self._lock:
+                if self._loaded_dir == novel_dir:
+                    self._summaries[chapter_idx] = {"hash": self._hash(prefix), "length": len(prefix), "summary": summary}
+                    self._save()
+            return summary, tail
+        except Exception as e:
+            print(f"[警告] 组织续写上下文失败，改为发送全文: {e}")
+            traceback.print_exc()
+            return "", content
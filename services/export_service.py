@@ -0,0 +1,384 @@
+"""
+导出服务
+统一的流式导出管线：章节逐个经过可插拔的格式写入器写出，
+不在内存中拼接整本书；导出在后台线程执行，支持进度回调、取消与章节范围筛选。
+"""
+
+import os
+import html
+import uuid
+import zipfile
+import threading
+import collections
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+import traceback
+import tkinter as tk
+from tkinter import ttk, messagebox
+from AI.prompt_builder import PromptBuilder
+
+
+# ==================== 章节来源 ====================
+
+def iter_chapters(chapter_list, chapter_range=None, chapter_filter=None):
+    """
+    逐章产出待导出的章节
+    Args:
+        chapter_list: 章节列表
+        chapter_range: (起始索引, 结束索引)，均包含；None 表示全部
+        chapter_filter: 可选过滤函数 f(index, chapter) -> bool
+    Yields:
+        (index, 章节标题, content)；章节标题形如“第N章 标题”，已带“第N章”前缀的标题不重复添加
+    """
+    start, end = 0, len(chapter_list) - 1
+    if chapter_range:
+        start = max(0, chapter_range[0])
+        end = min(end, chapter_range[1])
+    for idx in range(start, end + 1):
+        chapter = chapter_list[idx]
+        if chapter_filter and not chapter_filter(idx, chapter):
+            continue
+        yield idx, PromptBuilder._format_chapter_display(idx + 1, chapter.get("title", "")), (chapter.get("content", "") or "").strip()
+
+
+def iter_lines(content):
+    """按行产出正文（不构造换行符替换后的整章副本）"""
+    start = 0
+    length = len(content)
+    while start < length:
+        end = content.find("\n", start)
+        if end == -1:
+            end = length
+        line = content[start:end]
+        if line.endswith("\r"):
+            line = line[:-1]
+        yield line
+        start = end + 1
+
+
+# ==================== 格式写入器 ====================
+
+class TxtWriter:
+    """纯文本写入器（Windows 换行，兼容各大小说平台）"""
+    extension = ".txt"
+    newline = "\r\n"
+
+    def begin(self, f, book_title):
+        if book_title:
+            f.write(f"《{book_title}》{self.newline * 2}")
+
+    def write_chapter(self, f, index, title, content):
+        nl = self.newline
+        f.write(f"{title}{nl}")
+        f.write("-" * 30 + nl)
+        if content:
+            first = True
+            for line in iter_lines(content):
+                if not first:
+                    f.write(nl)
+                f.write(line)
+                first = False
+        else:
+            f.write("（本章正文内容为空）")
+        # 章节间格
+        f.write(nl * 3)
+
+    def end(self, f):
+        pass
+
+
+class MarkdownWriter:
+    """Markdown 写入器"""
+    extension = ".md"
+
+    def begin(self, f, book_title):
+        if book_title:
+            f.write(f"# {book_title}\n\n")
+
+    def write_chapter(self, f, index, title, content):
+        f.write(f"## {title}\n\n")
+        for line in iter_lines(content):
+            if line.strip():
+                f.write(line.strip() + "\n\n")
+
+    def end(self, f):
+        pass
+
+
+class HtmlWriter:
+    """HTML 写入器（单文件，带章节目录锚点）"""
+    extension = ".html"
+
+    def begin(self, f, book_title):
+        title = html.escape(book_title or "小说")
+        f.write("<!DOCTYPE html>\n<html lang=\"zh-CN\">\n<head>\n<meta charset=\"utf-8\">\n")
+        f.write(f"<title>{title}</title>\n")
+        f.write("<style>body{max-width:46em;margin:2em auto;line-height:1.8;font-family:serif;}"
+                "p{text-indent:2em;margin:0.4em 0;}</style>\n</head>\n<body>\n")
+        f.write(f"<h1>{title}</h1>\n")
+
+    def write_chapter(self, f, index, title, content):
+        f.write(f"<h2 id=\"chapter-{index+1}\">{html.escape(title)}</h2>\n")
+        for line in iter_lines(content):
+            if line.strip():
+                f.write(f"<p>{html.escape(line.strip())}</p>\n")
+
+    def end(self, f):
+        f.write("</body>\n</html>\n")
+
+
+# 总字数超过该阈值时使用进程池并行渲染 EPUB 章节
+EPUB_PARALLEL_THRESHOLD = 500000
+
+
+def render_epub_chapter(index, title, content):
+    """将单章渲染为 XHTML 字节串（模块级函数，可在进程池中执行）"""
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="zh-CN">\n'
+        f"<head><meta charset=\"utf-8\"/><title>{html.escape(title)}</title>"
+        '<link rel="stylesheet" type="text/css" href="style.css"/></head>\n<body>\n',
+        f"<h2>{html.escape(title)}</h2>\n",
+    ]
+    for line in iter_lines(content):
+        line = line.strip()
+        if line:
+            parts.append(f"<p>{html.escape(line)}</p>\n")
+    parts.append("</body>\n</html>\n")
+    return "".join(parts).encode("utf-8")
+
+
+class EpubWriter:
+    """
+    EPUB 3 写入器
+    章节逐个写入 zip 容器，不在内存中构建整本书；
+    目录（nav.xhtml / toc.ncx）与 content.opf 只依赖章节标题，在正文写完后生成。
+    """
+    extension = ".epub"
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 1) - 1))
+
+    def _iter_rendered(self, chapters, parallel):
+        """按原顺序产出 (index, title, xhtml字节)；并行时只保留有限个在途任务，保证内存有界"""
+        if not parallel:
+            for idx, title, content in chapters:
+                yield idx, title, render_epub_chapter(idx, title, content)
+            return
+        window = self.max_workers * 2
+        pending = collections.deque()
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            for idx, title, content in chapters:
+                pending.append((idx, title, pool.submit(render_epub_chapter, idx, title, content)))
+                if len(pending) >= window:
+                    i, t, future = pending.popleft()
+                    yield i, t, future.result()
+            while pending:
+                i, t, future = pending.popleft()
+                yield i, t, future.result()
+
+    def write_book(self, tmp_path, chapters, book_title="", total=None, progress_callback=None, cancel_event=None, total_chars=0):
+        book_title = book_title or "小说"
+        toc = []
+        parallel = total_chars >= EPUB_PARALLEL_THRESHOLD and self.max_workers > 1
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            # mimetype 必须是第一个条目且不压缩
+            zf.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+            zf.writestr("META-INF/container.xml",
+                        '<?xml version="1.0" encoding="utf-8"?>\n'
+                        '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+                        '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>\n'
+                        '</container>\n')
+            zf.writestr("OEBPS/style.css", "body{line-height:1.8;} p{text-indent:2em;margin:0.3em 0;} h2{text-align:center;}\n")
+
+            for idx, title, data in self._iter_rendered(chapters, parallel):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ExportCancelled()
+                name = f"chapter_{idx+1:05d}.xhtml"
+                with zf.open(f"OEBPS/{name}", "w") as entry:
+                    entry.write(data)
+                toc.append((name, title))
+                if progress_callback:
+                    progress_callback(len(toc), total, title)
+
+            self._write_navigation(zf, book_title, toc)
+        return len(toc)
+
+    @staticmethod
+    def _write_navigation(zf, book_title, toc):
+        title = html.escape(book_title)
+        book_id = f"urn:uuid:{uuid.uuid4()}"
+        modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        with zf.open("OEBPS/nav.xhtml", "w") as entry:
+            entry.write(('<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+                         '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="zh-CN">\n'
+                         f'<head><meta charset="utf-8"/><title>{title}</title></head>\n<body>\n'
+                         '<nav epub:type="toc" id="toc"><h1>目录</h1><ol>\n').encode("utf-8"))
+            for name, label in toc:
+                entry.write(f'<li><a href="{name}">{html.escape(label)}</a></li>\n'.encode("utf-8"))
+            entry.write("</ol></nav>\n</body>\n</html>\n".encode("utf-8"))
+
+        with zf.open("OEBPS/toc.ncx", "w") as entry:
+            entry.write(('<?xml version="1.0" encoding="utf-8"?>\n'
+                         '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">\n'
+                         f'<head><meta name="dtb:uid" content="{book_id}"/></head>\n'
+                         f'<docTitle><text>{title}</text></docTitle>\n<navMap>\n').encode("utf-8"))
+            for order, (name, label) in enumerate(toc, start=1):
+                entry.write((f'<navPoint id="nav{order}" playOrder="{order}"><navLabel><text>{html.escape(label)}</text></navLabel>'
+                             f'<content src="{name}"/></navPoint>\n').encode("utf-8"))
+            entry.write("</navMap>\n</ncx>\n".encode("utf-8"))
+
+        with zf.open("OEBPS/content.opf", "w") as entry:
+            entry.write(('<?xml version="1.0" encoding="utf-8"?>\n'
+                         '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="bookid">\n'
+                         '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+                         f'<dc:identifier id="bookid">{book_id}</dc:identifier>\n'
+                         f'<dc:title>{title}</dc:title>\n<dc:language>zh-CN</dc:language>\n'
+                         f'<meta property="dcterms:modified">{modified}</meta>\n</metadata>\n<manifest>\n'
+                         '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>\n'
+                         '<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>\n'
+                         '<item id="css" href="style.css" media-type="text/css"/>\n').encode("utf-8"))
+            for order, (name, _) in enumerate(toc, start=1):
+                entry.write(f'<item id="c{order}" href="{name}" media-type="application/xhtml+xml"/>\n'.encode("utf-8"))
+            entry.write('</manifest>\n<spine toc="ncx">\n'.encode("utf-8"))
+            for order in range(1, len(toc) + 1):
+                entry.write(f'<itemref idref="c{order}"/>\n'.encode("utf-8"))
+            entry.write("</spine>\n</package>\n".encode("utf-8"))
+
+
+# 格式名 -> (写入器类, 显示名称)
+EXPORT_WRITERS = {
+    "txt": (TxtWriter, "文本文件"),
+    "md": (MarkdownWriter, "Markdown"),
+    "html": (HtmlWriter, "HTML网页"),
+    "epub": (EpubWriter, "EPUB电子书"),
+}
+
+
+class ExportCancelled(Exception):
+    """导出被用户取消"""
+
+
+def export_chapters(export_path, chapters, writer, book_title="", total=None, progress_callback=None, cancel_event=None, total_chars=0):
+    """
+    流式导出：逐章写入临时文件，完成后原子替换目标文件
+    Args:
+        export_path: 导出文件路径
+        chapters: iter_chapters 产出的可迭代对象
+        writer: 格式写入器实例
+        book_title: 书名
+        total: 章节总数（用于进度显示）
+        progress_callback: 进度回调 f(已完成数, 总数, 章节标题)
+        cancel_event: threading.Event，置位后中止导出
+        total_chars: 待导出总字数（供 EPUB 写入器决定是否并行渲染）
+    Raises:
+        ExportCancelled: 导出被取消（临时文件会被删除）
+    """
+    tmp_path = export_path + ".part"
+    done = 0
+    try:
+        # 容器格式（如 EPUB）自行管理输出文件
+        if hasattr(writer, "write_book"):
+            done = writer.write_book(tmp_path, chapters, book_title, total, progress_callback, cancel_event, total_chars)
+            os.replace(tmp_path, export_path)
+            return done
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            writer.begin(f, book_title)
+            for idx, title, content in chapters:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ExportCancelled()
+                writer.write_chapter(f, idx, title, content)
+                done += 1
+                if progress_callback:
+                    progress_callback(done, total, title)
+            writer.end(f)
+        os.replace(tmp_path, export_path)
+        return done
+    except BaseException:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        raise
+
+
+class ExportService:
+    """导出服务类（后台线程 + 进度窗口）"""
+
+    def __init__(self, app):
+        """
+        初始化导出服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+
+    def start_export(self, export_path, fmt="txt", chapter_range=None, chapter_filter=None, book_title=""):
+        """
+        在后台线程中导出，并显示可取消的进度窗口
+        Args:
+            export_path: 导出文件路径
+            fmt: 导出格式（EXPORT_WRITERS 的键）
+            chapter_range: (起始索引, 结束索引)，均包含
+            chapter_filter: 可选过滤函数 f(index, chapter) -> bool
+            book_title: 书名
+        """
+        writer_cls = EXPORT_WRITERS[fmt][0]
+        # 取章节列表的浅拷贝，避免导出过程中编辑章节列表导致错位
+        chapter_list = list(self.app.chapter_list)
+        start, end = chapter_range if chapter_range else (0, len(chapter_list) - 1)
+        total = max(0, min(end, len(chapter_list) - 1) - max(0, start) + 1)
+        total_chars = sum(len(ch.get("content", "") or "") for ch in chapter_list[max(0, start):end + 1])
+        cancel_event = threading.Event()
+
+        dialog = tk.Toplevel(self.app.root)
+        dialog.title("正在导出")
+        dialog.transient(self.app.root)
+        dialog.resizable(False, False)
+        self.app.ui_helper.center_window(dialog, 420, 150)
+        status_label = tk.Label(dialog, text="准备导出...", font=("Microsoft YaHei", 10))
+        status_label.pack(pady=(15, 8))
+        progress = ttk.Progressbar(dialog, length=360, mode="determinate", maximum=max(total, 1))
+        progress.pack(pady=5)
+        cancel_btn = tk.Button(dialog, text="取消", command=cancel_event.set, cursor="hand2", width=10)
+        cancel_btn.pack(pady=10)
+        dialog.protocol("WM_DELETE_WINDOW", cancel_event.set)
+
+        def on_progress(done, total_count, title):
+            def update():
+                if dialog.winfo_exists():
+                    progress["value"] = done
+                    status_label.config(text=f"已导出 {done}/{total_count} 章：{title}")
+            self.app.root.after(0, update)
+
+        def on_finish(message, is_error=False):
+            if dialog.winfo_exists():
+                dialog.destroy()
+            if is_error:
+                messagebox.showerror("错误", message)
+            else:
+                messagebox.showinfo("导出", message)
+
+        def export_thread():
+            try:
+                count = export_chapters(
+                    export_path,
+                    iter_chapters(chapter_list, (start, end), chapter_filter),
+                    writer_cls(),
+                    book_title=book_title,
+                    total=total,
+                    progress_callback=on_progress,
+                    cancel_event=cancel_event,
+                    total_chars=total_chars,
+                )
+                self.app.root.after(0, lambda: on_finish(f"✅ 已导出 {count} 个章节至：\n{export_path}"))
+            except ExportCancelled:
+                self.app.root.after(0, lambda: on_finish("导出已取消。"))
+            except Exception as e:
+                traceback.print_exc()
+                err = str(e)
+                self.app.root.after(0, lambda: on_finish(f"导出过程中发生错误：{err}", is_error=True))
+
+        threading.Thread(target=export_thread, daemon=True).start()
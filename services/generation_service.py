@@ -8,6 +8,8 @@ from tkinter import messagebox
 import threading
 import traceback
 from AI.prompt_builder import PromptBuilder
+from AI.summary_segments import update_global_summary
+from services.candidate_service import OPENING_WORDS
 
 class GenerationService:
     """内容生成服务类"""
@@ -22,6 +24,33 @@ class GenerationService:
         self.app = app
         self.default_config = default_config
         
+    def _build_settings_section(self, novel_selected, char_selected, current_idx=None, query_text=""):
+        """
+        组织提示词中的设定部分：
+            - 设定与人物档案使用缓存的精简卡片（见 services/prompt_card_service.py）
+            - 小说设定超出预算时按与 query_text 的相关度筛选（见 services/setting_rank_service.py）
+            - 人物档案附带本章之前的经历（见 services/character_event_service.py）
+        """
+        novel_selected, char_selected = self.app.prompt_card_service.apply_settings(novel_selected, char_selected)
+        novel_selected = self.app.setting_rank_service.select(novel_selected, query_text)
+        char_selected = self.app.character_event_service.profiles_for_prompt(
+            char_selected, before_chapter=current_idx + 1 if current_idx is not None else None)
+        return PromptBuilder.build_settings_content(novel_selected, char_selected)
+
+    def _relations_for_prompt(self, text, current_idx):
+        """
+        本章出场人物（策划/已有正文与上一章摘要中提到的角色）的当前关系（见 services/relation_graph_service.py）
+        关系图（含旧版关系基线）尚无记录时返回 None，提示词沿用前三章的关系变动文本
+        """
+        if current_idx is None:
+            return None
+        graph = self.app.relation_graph_service
+        if not graph.has_edges(current_idx + 1):
+            return None
+        if 0 < current_idx <= len(self.app.chapter_list):
+            text = f"{text}\n{self.app.chapter_list[current_idx - 1].get('summary', '')}"
+        return graph.context_for(text, current_idx + 1)
+
     def _update_ai_config(self):
         """同步UI中的最新API配置到AI客户端"""
         try:
@@ -39,38 +68,45 @@ class GenerationService:
                 model=self.default_config.get('model')
             )
 
-    def generate_novel(self, prompt, novel_type, writing_style, temperature, max_tokens):
-        """使用AI客户端生成小说内容"""
-        try:
-            # 更新AI客户端配置
-            self._update_ai_config()
-            
-            # 读取章节字数限制配置
+    def _novel_prompts(self, prompt, novel_type, writing_style, word_count=None):
+        """组织系统提示词与用户提示词；word_count 默认读取章节字数设置"""
+        # 读取章节字数限制配置
+        if word_count is None:
             try:
                 word_count = self.app.chapter_words_var.get() if hasattr(self.app, "chapter_words_var") else 3000
             except Exception:
                 word_count = 3000
+        
+        # 构建系统提示词（包含字数限制；缓存友好模式下字数要求移至用户提示词末尾）
+        system_prompt = PromptBuilder.build_system_prompt(novel_type, writing_style, word_count)
+        
+        # 用户提示词直接使用传入的prompt（已包含所有内容）
+        user_prompt = PromptBuilder.append_word_count(prompt, word_count)
+        return system_prompt, user_prompt
+
+    def generate_novel(self, prompt, novel_type, writing_style, temperature, max_tokens, task="正文创作"):
+        """使用AI客户端生成小说内容（task 为统计提示词缓存命中所用的任务名）"""
+        try:
+            # 更新AI客户端配置
+            self._update_ai_config()
             
-            # 构建系统提示词（包含字数限制）
-            system_prompt = PromptBuilder.build_system_prompt(novel_type, writing_style, word_count)
-            
-            # 用户提示词直接使用传入的prompt（已包含所有内容）
-            user_prompt = prompt
+            system_prompt, user_prompt = self._novel_prompts(prompt, novel_type, writing_style)
             
             # 调用AI客户端生成内容
-            return self.app.ai_client.generate_content(
-                system_prompt=system_prompt,
-                user_prompt=user_prompt,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+            with self.app.ai_client.task(task):
+                return self.app.ai_client.generate_content(
+                    system_prompt=system_prompt,
+                    user_prompt=user_prompt,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
         except Exception as e:
             print(f"[错误] generate_novel 调用异常: {type(e).__name__}: {str(e)}")
             traceback.print_exc()
             return f"❌ 生成方法异常: {str(e)}"
 
-    def generate_content(self):
-        """生成内容（在后台线程中执行）"""
+    def generate_content(self, candidates=False):
+        """生成内容（在后台线程中执行）；candidates 为 True 时只生成多个候选开头供挑选"""
         try:
             prompt = self.app.prompt_text.get("1.0", tk.END).strip()
             
@@ -124,7 +160,7 @@ class GenerationService:
                                     for n, v in self.app.character_setting_checked.items() 
                                     if v and self.app.character_setting_details.get(n,'').strip()}
                 
-                settings_section = PromptBuilder.build_settings_content(novel_selected, char_selected)
+                settings_section = self._build_settings_section(novel_selected, char_selected, current_idx, prompt)
             except Exception:
                 settings_section = ""
             
@@ -149,6 +185,10 @@ class GenerationService:
             except Exception:
                 chapter_plan = None
 
+            # 本章策划中提到、但近几章未出场的人物/设定：找回其上次出场的章节
+            plan_text = "\n".join([prompt] + list((chapter_plan or {}).values()))
+            recalled = self.app.mention_index_service.recall_chapters(plan_text, current_idx)
+
             # 构建用户提示词（包含设定信息和章节标题）
             user_prompt = PromptBuilder.build_user_prompt(
                 instruction=prompt,
@@ -156,7 +196,10 @@ class GenerationService:
                 current_index=current_idx,
                 settings=settings_section,
                 chapter_title=chapter_title,
-                chapter_plan=chapter_plan
+                chapter_plan=chapter_plan,
+                recalled_chapters=recalled,
+                relations=self._relations_for_prompt(plan_text, current_idx),
+                open_hooks=self.app.hook_ledger_service.prompt_hooks(current_idx)
             )
 
             # 记录本次创作提示，供章节条目保存
@@ -173,21 +216,39 @@ class GenerationService:
             print(f"[调试] 字数限制: {word_count} 字")
             print(f"[调试] 温度: {temperature}, 最大token: {max_tokens}")
             
+            if candidates:
+                self._start_opening_candidates(user_prompt, current_idx, chapter_title, novel_type, writing_style, temperature, max_tokens)
+                return
+            
+            # 长章节可分场景并行创作（见 services/scene_draft_service.py）
+            scene_mode = self.app.scene_draft_service.should_draft(word_count)
+            scenes_text = self.app.scene_draft_service.stored_plan(self.app.chapter_list[current_idx], prompt, chapter_plan) if scene_mode else ""
+            scenes_basis = self.app.scene_draft_service.plan_basis(prompt, chapter_plan) if scene_mode else None
+            
             # 在后台线程中生成
             def generate_thread():
                 try:
-                    generated_text = self.generate_novel(
-                        prompt=user_prompt,
-                        novel_type=novel_type,
-                        writing_style=writing_style,
-                        temperature=temperature,
-                        max_tokens=max_tokens
-                    )
+                    scenes = None
+                    if scene_mode:
+                        generated_text, scenes = self.app.scene_draft_service.draft(
+                            user_prompt, prompt, chapter_plan, scenes_text,
+                            novel_type, writing_style, temperature, max_tokens, word_count
+                        )
+                    else:
+                        generated_text = self.generate_novel(
+                            prompt=user_prompt,
+                            novel_type=novel_type,
+                            writing_style=writing_style,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            task="正文创作"
+                        )
                     
                     print(f"[调试] 生成完成，内容长度: {len(generated_text)} 字符")
+                    self._journal_ai_response(current_idx, "generate", generated_text)
                     
                     # 在主线程中更新UI
-                    self.app.root.after(0, lambda: self._on_generate_success(generated_text, chapter_title))
+                    self.app.root.after(0, lambda: self._on_generate_success(generated_text, chapter_title, current_idx, scenes, scenes_basis))
                 except Exception as e:
                     print(f"[错误] 生成内容时发生异常: {type(e).__name__}: {str(e)}")
                     traceback.print_exc()
@@ -206,6 +267,41 @@ class GenerationService:
             self.app.generate_btn.config(state=tk.NORMAL, text="🚀 生成小说")
             messagebox.showerror("错误", f"发生错误: {str(e)}")
 
+    def _start_opening_candidates(self, user_prompt, current_idx, chapter_title, novel_type, writing_style, temperature, max_tokens):
+        """生成多个候选开头，本地排序后并排展示；采用的开头写入编辑器，可接着续写"""
+        def candidates_thread():
+            try:
+                self._update_ai_config()
+                opening_prompt = PromptBuilder.build_opening_prompt(user_prompt, OPENING_WORDS)
+                system_prompt, full_prompt = self._novel_prompts(opening_prompt, novel_type, writing_style, OPENING_WORDS)
+                texts = self.app.candidate_service.collect(
+                    system_prompt, full_prompt, temperature, min(max_tokens, OPENING_WORDS * 3),
+                    self.app.candidate_service.count(), "候选开头")
+                if texts[0].startswith("❌"):
+                    self.app.root.after(0, lambda: self._on_generate_success(texts[0], chapter_title))
+                    return
+                ranked = self.app.candidate_service.rank_openings(texts, current_idx)
+                
+                def choose(text):
+                    # 与单次生成一致：采用的结果先写入恢复日志再覆盖编辑器
+                    self._journal_ai_response(current_idx, "generate", text)
+                    self._on_generate_success(text, chapter_title)
+
+                def show():
+                    self._post_generation_cleanup()
+                    self.app.candidate_service.show(
+                        f"第{current_idx+1}章 开头候选（已按格式、篇幅、新颖度排序）", ranked, choose)
+                self.app.root.after(0, show)
+            except Exception as e:
+                print(f"[错误] 生成候选开头时发生异常: {type(e).__name__}: {str(e)}")
+                traceback.print_exc()
+                error_msg = f"生成候选开头时发生错误: {str(e)}"
+                self.app.root.after(0, lambda: self._on_generate_success(f"❌ {error_msg}", ""))
+        
+        print(f"[调试] 开始生成候选开头...")
+        thread = threading.Thread(target=candidates_thread, daemon=True)
+        thread.start()
+
     def continue_content(self):
         """续写小说（独立逻辑）"""
         try:
@@ -249,7 +345,7 @@ class GenerationService:
                 char_selected = {}
                 if hasattr(self.app, "character_setting_checked") and hasattr(self.app, "character_setting_details"):
                     char_selected = {n: self.app.character_setting_details.get(n,'') for n, v in self.app.character_setting_checked.items() if v}
-                settings_section = PromptBuilder.build_settings_content(novel_selected, char_selected)
+                settings_section = self._build_settings_section(novel_selected, char_selected, current_idx, prompt)
             except Exception:
                 settings_section = ""
             
@@ -265,33 +361,48 @@ class GenerationService:
             # 获取当前编辑器内容
             current_content = self.app.content_text.get("1.0", tk.END).strip()
             
-            # 构建用户提示词
-            user_prompt = PromptBuilder.build_user_prompt(
+            # 用户提示词的其余部分；已有内容在后台线程中组织（长章节需先更新前文摘要）
+            prompt_kwargs = dict(
                 instruction=prompt,
                 chapter_list=getattr(self.app, "chapter_list", []),
                 current_index=current_idx,
                 settings=settings_section,
                 chapter_title=chapter_title,
-                current_chapter_content=current_content
+                recalled_chapters=self.app.mention_index_service.recall_chapters(prompt, current_idx),
+                relations=self._relations_for_prompt(prompt + "\n" + current_content, current_idx),
+                open_hooks=self.app.hook_ledger_service.prompt_hooks(current_idx)
             )
-
-            # 记录提示
-            self.app._last_prompt = user_prompt
             
             print(f"[调试] 开始续写内容...")
             
             # 在后台线程中生成
             def generate_thread():
                 try:
+                    # 长章节：较早部分用缓存并增量更新的摘要，结尾部分保留原文
+                    earlier_summary, content_window = self.app.continuation_service.prepare(current_idx, current_content)
+                    user_prompt = PromptBuilder.build_user_prompt(
+                        current_chapter_content=content_window,
+                        earlier_summary=earlier_summary,
+                        **prompt_kwargs
+                    )
+                    # 记录提示
+                    self.app._last_prompt = user_prompt
+
                     generated_text = self.generate_novel(
                         prompt=user_prompt,
                         novel_type=novel_type,
                         writing_style=writing_style,
                         temperature=temperature,
-                        max_tokens=max_tokens
+                        max_tokens=max_tokens,
+                        task="续写"
                     )
                     
                     print(f"[调试] 续写完成，内容长度: {len(generated_text)} 字符")
+                    if not generated_text.startswith("❌"):
+                        self._journal_ai_response(
+                            current_idx, "continue",
+                            f"{current_content}\n\n{generated_text}" if current_content else generated_text
+                        )
                     
                     # 在主线程中更新UI
                     self.app.root.after(0, lambda: self._on_continue_success(generated_text, chapter_title))
@@ -311,6 +422,24 @@ class GenerationService:
             self.app.modify_btn.config(state=tk.NORMAL, text="🖊️ 续写小说")
             messagebox.showerror("错误", f"发生错误: {str(e)}")
 
+    def _record_chapter_version(self, content, source):
+        """将当前章节的正文记录到版本历史（AI 改写前后各记录一次）"""
+        try:
+            idx = getattr(self.app, "current_chapter_index", None)
+            if idx is None or not hasattr(self.app, "version_service"):
+                return
+            self.app.version_service.record_version(idx, content, source=source)
+        except Exception as e:
+            print(f"[警告] 记录章节版本失败: {e}")
+
+    def _journal_ai_response(self, chapter_index, task, content):
+        """AI 返回后立即写入恢复日志，防止未保存前崩溃导致结果丢失"""
+        try:
+            if hasattr(self.app, "journal_service"):
+                self.app.journal_service.record_ai_response(chapter_index, task, content)
+        except Exception as e:
+            print(f"[警告] 写入恢复日志失败: {e}")
+
     def _post_generation_cleanup(self):
         """生成/续写后的通用清理工作"""
         try:
@@ -321,14 +450,25 @@ class GenerationService:
         except Exception:
             pass
 
-    def _on_generate_success(self, generated_text, chapter_title):
-        """生成成功的回调（覆盖模式）"""
+    def _on_generate_success(self, generated_text, chapter_title, chapter_idx=None, scenes=None, scenes_basis=None):
+        """生成成功的回调（覆盖模式）；scenes 为分场景创作使用的场景计划，scenes_basis 为其依据哈希"""
         try:
             self._post_generation_cleanup()
             
             if generated_text.startswith("❌"):
                 messagebox.showerror("错误", generated_text)
             else:
+                # 新生成的场景计划连同依据写回章节，概述与策划不变时再次生成沿用
+                if scenes and chapter_idx is not None and 0 <= chapter_idx < len(self.app.chapter_list):
+                    chapter = self.app.chapter_list[chapter_idx]
+                    if PromptBuilder.parse_scene_plan(chapter.get("scenes", "")) != scenes:
+                        chapter["scenes"] = PromptBuilder.format_scene_plan(scenes)
+                        chapter["scenes_basis"] = scenes_basis
+
+                # 覆盖前保留原稿，避免 AI 结果覆盖后丢失
+                self._record_chapter_version(self.app.content_text.get("1.0", tk.END).strip(), "before_ai")
+                self._record_chapter_version(generated_text, "ai")
+                
                 # 覆盖内容
                 self.app.content_text.delete("1.0", tk.END)
                 self.app.content_text.insert("1.0", generated_text)
@@ -349,11 +489,14 @@ class GenerationService:
             if generated_text.startswith("❌"):
                 messagebox.showerror("错误", generated_text)
             else:
+                self._record_chapter_version(self.app.content_text.get("1.0", tk.END).strip(), "before_ai")
+                
                 # 追加内容
                 if self.app.content_text.get("1.0", tk.END).strip():
                     self.app.content_text.insert(tk.END, "\n\n" + generated_text)
                 else:
                     self.app.content_text.insert("1.0", generated_text)
+                self._record_chapter_version(self.app.content_text.get("1.0", tk.END).strip(), "ai")
                 
                 if hasattr(self.app, "update_word_count"):
                     self.app.update_word_count()
@@ -492,12 +635,13 @@ class GenerationService:
                     max_tokens = self.app.max_tokens_var.get() if hasattr(self.app, 'max_tokens_var') else 2000
                     
                     # 调用AI生成总结
-                    summary = self.app.ai_client.generate_content(
-                        system_prompt=system_prompt,
-                        user_prompt=user_prompt,
-                        temperature=0.7,
-                        max_tokens=max_tokens
-                    )
+                    with self.app.ai_client.task("章节总结"):
+                        summary = self.app.ai_client.generate_content(
+                            system_prompt=system_prompt,
+                            user_prompt=user_prompt,
+                            temperature=0.7,
+                            max_tokens=max_tokens
+                        )
                     
                     # 统计字数（中文字符数）
                     import re
@@ -589,8 +733,8 @@ class GenerationService:
             self.app.generate_btn.config(state=tk.NORMAL, text="🚀 生成小说")
         messagebox.showerror("错误", error_msg)
 
-    def generate_outline(self):
-        """AI 生成大纲（标题、概述、高潮、钩子）"""
+    def generate_outline(self, candidates=False):
+        """AI 生成大纲（标题、概述、高潮、钩子）；candidates 为 True 时生成多个候选供挑选"""
         try:
             # 检查是否选择了章节
             current_idx = None
@@ -609,7 +753,11 @@ class GenerationService:
                 # 获取选中的设定
                 novel_selected = {n: self.app.novel_setting_details.get(n,'') for n, v in self.app.novel_setting_checked.items() if v} if hasattr(self.app, "novel_setting_checked") else {}
                 char_selected = {n: self.app.character_setting_details.get(n,'') for n, v in self.app.character_setting_checked.items() if v} if hasattr(self.app, "character_setting_checked") else {}
-                settings_section = PromptBuilder.build_settings_content(novel_selected, char_selected)
+                # 大纲尚未生成，以本章标题与前一章摘要衡量设定的相关度
+                outline_query = self.app.chapter_list[current_idx].get("title", "") if current_idx < len(self.app.chapter_list) else ""
+                if 0 < current_idx <= len(self.app.chapter_list):
+                    outline_query += "\n" + (self.app.chapter_list[current_idx - 1].get("summary", "") or "")
+                settings_section = self._build_settings_section(novel_selected, char_selected, current_idx, outline_query)
             except Exception:
                 settings_section = ""
 
@@ -621,7 +769,8 @@ class GenerationService:
                 chapter_title=current_title,
                 chapter_list=getattr(self.app, "chapter_list", []),
                 current_index=current_idx,
-                settings=settings_section
+                settings=settings_section,
+                open_hooks=self.app.hook_ledger_service.prompt_hooks(current_idx)
             )
 
             # 锁定 UI
@@ -634,14 +783,30 @@ class GenerationService:
             def outline_thread():
                 try:
                     max_tokens = self.app.max_tokens_var.get() if hasattr(self.app, 'max_tokens_var') else 2000
+                    novel_type = self.app.novel_type_var.get()
+                    writing_style = self.app.writing_style_text.get("1.0", tk.END).strip() if hasattr(self.app, "writing_style_text") else self.app.writing_style_var.get()
+                    
+                    if candidates:
+                        # 多个候选：本地排序后并排展示
+                        self._update_ai_config()
+                        system_prompt, full_prompt = self._novel_prompts(user_prompt, novel_type, writing_style)
+                        texts = self.app.candidate_service.collect(
+                            system_prompt, full_prompt, 0.8, max_tokens, self.app.candidate_service.count(), "章节大纲")
+                        if texts[0].startswith("❌"):
+                            self.app.root.after(0, lambda: self._on_outline_error(texts[0]))
+                            return
+                        ranked = self.app.candidate_service.rank_outlines(texts, current_idx)
+                        self.app.root.after(0, lambda: self._on_outline_candidates(ranked, current_idx))
+                        return
                     
                     # 使用配置的 token 限制
                     generated_text = self.generate_novel(
                         prompt=user_prompt,
-                        novel_type=self.app.novel_type_var.get(),
-                        writing_style=self.app.writing_style_text.get("1.0", tk.END).strip() if hasattr(self.app, "writing_style_text") else self.app.writing_style_var.get(),
+                        novel_type=novel_type,
+                        writing_style=writing_style,
                         temperature=0.8,
-                        max_tokens=max_tokens
+                        max_tokens=max_tokens,
+                        task="章节大纲"
                     )
                     
                     # 解析结果
@@ -662,17 +827,11 @@ class GenerationService:
                 self.app.hide_loading_animation()
             
             # 正则提取
-            import re
-            
-            def extract(tag, content):
-                pattern = rf"【{tag}】：?(.*?)(?=【|$)"
-                match = re.search(pattern, content, re.DOTALL)
-                return match.group(1).strip() if match else ""
-
-            ch_title = extract("章节标题", text)
-            ch_summary = extract("内容概述", text)
-            ch_climax = extract("章节高潮", text)
-            ch_hook = extract("章节钩子", text)
+            outline = PromptBuilder.parse_outline(text)
+            ch_title = outline["title"]
+            ch_summary = outline["summary"]
+            ch_climax = outline["climax"]
+            ch_hook = outline["hook"]
             
             # 填入 UI
             if ch_title and hasattr(self.app, 'chapter_title_var'):
@@ -691,6 +850,12 @@ class GenerationService:
         except Exception as e:
             messagebox.showerror("解析失败", f"大纲解析出错：{e}")
 
+    def _on_outline_candidates(self, ranked, chapter_idx):
+        """并排展示大纲候选，采用后按单个大纲填充"""
+        if hasattr(self.app, "hide_loading_animation"):
+            self.app.hide_loading_animation()
+        self.app.candidate_service.show(f"第{chapter_idx+1}章 大纲候选（已按格式、篇幅、新颖度排序）", ranked, self._on_outline_success)
+
     def _on_outline_error(self, err):
         if hasattr(self.app, "hide_loading_animation"):
             self.app.hide_loading_animation()
@@ -732,7 +897,8 @@ class GenerationService:
                 # 重新组织设定详情以供修改参考
                 novel_selected = {n: self.app.novel_setting_details.get(n,'') for n, v in self.app.novel_setting_checked.items() if v} if hasattr(self.app, "novel_setting_checked") else {}
                 char_selected = {n: self.app.character_setting_details.get(n,'') for n, v in self.app.character_setting_checked.items() if v} if hasattr(self.app, "character_setting_checked") else {}
-                settings_section = PromptBuilder.build_settings_content(novel_selected, char_selected)
+                current_idx = getattr(self.app, "current_chapter_index", None)
+                settings_section = self._build_settings_section(novel_selected, char_selected, current_idx, f"{instruction}\n{current_content}")
             except Exception:
                 settings_section = ""
 
@@ -751,8 +917,10 @@ class GenerationService:
                         novel_type=novel_type,
                         writing_style=writing_style,
                         temperature=self.app.temperature_var.get(),
-                        max_tokens=self.app.max_tokens_var.get()
+                        max_tokens=self.app.max_tokens_var.get(),
+                        task="正文修改"
                     )
+                    self._journal_ai_response(getattr(self.app, "current_chapter_index", None), "modify", result)
                     
                     # 成功回调
                     def on_success():
@@ -763,7 +931,9 @@ class GenerationService:
                         if result.startswith("❌"):
                             messagebox.showerror("错误", result)
                         else:
-                            # 替换当前正文
+                            # 替换当前正文（替换前后均记录版本）
+                            self._record_chapter_version(current_content, "before_ai")
+                            self._record_chapter_version(result, "ai")
                             self.app.content_text.delete("1.0", tk.END)
                             self.app.content_text.insert("1.0", result)
                             if hasattr(self.app, "update_word_count"):
@@ -793,7 +963,7 @@ class GenerationService:
         """
         定稿逻辑：两步生成法
         1. 仅凭本章正文生成 [本章摘要]
-        2. 全局摘要 = 前一章全局摘要 + 本章摘要 (由 AI 整合更新)
+        2. 全局摘要 = 前一章全局摘要 + 本章摘要 (由 AI 分段整合更新，见 AI/summary_segments.py)
         """
         try:
             chapter_list = self.app.chapter_list
@@ -837,9 +1007,11 @@ class GenerationService:
                     # 更新 API 配置
                     self._update_ai_config()
                     
+                    # 各步骤结果按输入哈希缓存：重跑时已成功且输入未变的步骤直接复用
                     # --- 第一步：生成本章摘要 ---
                     step1_prompt = PromptBuilder.build_chapter_summary_prompt(current_content)
-                    ch_summary = self.app.ai_client.generate_content(
+                    ch_summary = self.app.step_cache_service.cached_generate(
+                        "summary",
                         system_prompt="你是一位专业的小说编辑，请精准提炼章节核心剧情。",
                         user_prompt=step1_prompt,
                         temperature=0.3,
@@ -852,12 +1024,9 @@ class GenerationService:
 
                     # --- 第二步：更新全局摘要 (剧情) ---
                     self.app.root.after(0, lambda: self.app.finalize_btn.config(text="⌛ 正在更新全局提要...") if hasattr(self.app, "finalize_btn") else None)
-                    step2_prompt = PromptBuilder.build_global_summary_update_prompt(old_global, ch_summary)
-                    global_summary = self.app.ai_client.generate_content(
-                        system_prompt="你是一位定稿专家，负责合并剧情摘要。",
-                        user_prompt=step2_prompt,
-                        temperature=0.3,
-                        max_tokens=2000
+                    # 分段更新：只改写最新一段，旧段冻结或定期压缩，单章消耗不随全书长度增长
+                    global_summary = update_global_summary(
+                        self.app.step_cache_service.cached_generate, old_global, ch_summary, current_idx + 1
                     )
 
                     # --- 第三步：增量更新人物动态 ---
@@ -867,7 +1036,8 @@ class GenerationService:
                         old_status = chapter_list[current_idx-1].get("char_status", "").strip()
                     
                     step3_prompt = PromptBuilder.build_char_status_update_prompt(old_status, ch_summary, current_idx + 1)
-                    new_char_status = self.app.ai_client.generate_content(
+                    new_char_status = self.app.step_cache_service.cached_generate(
+                        "char_status",
                         system_prompt="你是一个严谨的档案员，负责记录角色状态变迁。",
                         user_prompt=step3_prompt,
                         temperature=0.3,
@@ -876,12 +1046,13 @@ class GenerationService:
 
                     # --- 第四步：增量更新人物关系 ---
                     self.app.root.after(0, lambda: self.app.finalize_btn.config(text="⌛ 正在更新人物关系...") if hasattr(self.app, "finalize_btn") else None)
-                    old_relations = ""
-                    if current_idx > 0:
-                        old_relations = chapter_list[current_idx-1].get("char_relations", "").strip()
+                    # 只查询本章出场人物相关的关系；关系图尚无记录时沿用上一章的关系文本
+                    fallback_relations = chapter_list[current_idx-1].get("char_relations", "").strip() if current_idx > 0 else ""
+                    old_relations = self.app.relation_graph_service.context_for(ch_summary, current_idx + 1, fallback_relations)
                     
                     step4_prompt = PromptBuilder.build_char_relations_update_prompt(old_relations, ch_summary, current_idx + 1)
-                    new_char_relations = self.app.ai_client.generate_content(
+                    new_char_relations = self.app.step_cache_service.cached_generate(
+                        "char_relations",
                         system_prompt="你是一个关系分析师，负责梳理人物情感纠葛。",
                         user_prompt=step4_prompt,
                         temperature=0.3,
@@ -913,12 +1084,13 @@ class GenerationService:
                             display_status = re.sub(r'</?RECORDS>', '', new_char_status, flags=re.IGNORECASE).strip()
                             self.app.char_status_text.insert("1.0", display_status)
                         
-                        # --- 同步累加到人物档案 (Setting) ---
+                        # --- 同步到人物经历存储与关系图 ---
                         self.app.novel_service.update_character_profile_status(new_char_status.strip())
+                        self.app.relation_graph_service.apply_chapter(current_idx + 1, new_char_relations)
 
                         if hasattr(self.app, "char_relations_text"):
                             self.app.char_relations_text.delete("1.0", tk.END)
-                            self.app.char_relations_text.insert("1.0", new_char_relations.strip())
+                            self.app.char_relations_text.insert("1.0", re.sub(r'</?RELATIONS>', '', new_char_relations, flags=re.IGNORECASE).strip())
                             
                         # 同步数据
                         if 0 <= current_idx < len(self.app.chapter_list):
@@ -926,8 +1098,14 @@ class GenerationService:
                             self.app.chapter_list[current_idx]["summary"] = ch_summary.strip()
                             self.app.chapter_list[current_idx]["char_status"] = new_char_status.strip()
                             self.app.chapter_list[current_idx]["char_relations"] = new_char_relations.strip()
+                            if hasattr(self.app, "staleness_service"):
+                                self.app.staleness_service.mark_summary_fresh(current_idx, self.app.staleness_service.summary_basis_of(current_content))
+                                self.app.staleness_service.mark_chain_fresh(current_idx)
                             
                             self.app.novel_service._persist_chapters_to_novel()
+                            self.app.novel_service.refresh_stale_marks()
+                            # 后台归纳较早的人物经历
+                            self.app.character_event_service.start_compaction()
                             
                             if hasattr(self.app, "novel_outline_text"):
                                 self.app.novel_outline_text.delete("1.0", tk.END)
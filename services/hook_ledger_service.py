@@ -0,0 +1,275 @@
+"""
+伏笔台账服务
+记录每章策划中的“本章钩子”，并在之后章节的摘要提到它时标记为已回收。
+组织提示词时只附带仍未回收的伏笔（数量固定上限），不必为了延续伏笔而回看大量旧章节。
+
+回收检测不调用 AI：以字二元组为特征，按逆文档频率加权，
+计算钩子的特征有多少出现在后续某章摘要中，达到阈值即视为该章回收了这条伏笔。
+
+台账文件：<小说目录>/hook_ledger.json
+    {"summaries": {章节索引: 摘要哈希},
+     "hooks": {章节索引: {"hash": 钩子哈希, "resolved_in": 回收章节索引或 null, "score": 匹配度}}}
+钩子与摘要按哈希比对，只重新检测有变化的部分；摘要的二元组倒排表常驻内存，同样只更新有变化的章节。
+"""
+
+import os
+import json
+import hashlib
+import threading
+import traceback
+from services.text_similarity import char_bigrams, idf
+
+
+HOOK_LEDGER_FILENAME = "hook_ledger.json"
+# 加权重合度达到该值视为已回收
+RESOLVE_THRESHOLD = 0.2
+# 至少共有的二元组数，避免过短的钩子误判
+MIN_SHARED_BIGRAMS = 3
+# 出现在超过该比例摘要中的二元组（多为主角名、常用词）不参与匹配
+MAX_DOC_FREQ_RATIO = 0.3
+# 提示词中最多列出的未回收伏笔数与每条的字数上限
+MAX_PROMPT_HOOKS = 8
+MAX_HOOK_CHARS = 80
+
+
+class HookLedgerService:
+    """伏笔台账服务类"""
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._lock = threading.RLock()
+        self._summaries = {}
+        self._hooks = {}
+        # 摘要倒排表 {"postings": {二元组: {章节索引}}, "grams": {章节索引: 二元组集合}, "hashes": {章节索引: 摘要哈希}}
+        self._index = None
+        self._loaded_dir = None
+        self._refresh_thread = None
+
+    def _ledger_path(self):
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        return os.path.join(novel_dir, HOOK_LEDGER_FILENAME) if novel_dir else ""
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+    # ==================== 加载与保存 ====================
+
+    def _ensure_loaded(self):
+        """切换小说后加载台账文件（调用方需持有锁）"""
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if novel_dir == self._loaded_dir:
+            return
+        self._loaded_dir = novel_dir
+        self._summaries, self._hooks = {}, {}
+        self._index = None
+        path = self._ledger_path()
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._summaries = {int(k): v for k, v in data.get("summaries", {}).items()}
+            self._hooks = {int(k): v for k, v in data.get("hooks", {}).items()}
+        except Exception as e:
+            print(f"[警告] 读取伏笔台账失败，将重建: {e}")
+            self._summaries, self._hooks = {}, {}
+
+    def _save(self):
+        """写回台账文件（调用方需持有锁）"""
+        path = self._ledger_path()
+        if not path:
+            return
+        data = {"summaries": {str(k): v for k, v in sorted(self._summaries.items())},
+                "hooks": {str(k): v for k, v in sorted(self._hooks.items())}}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    # ==================== 回收检测 ====================
+
+    def refresh(self, hooks=None, summaries=None):
+        """
+        按当前章节的钩子与摘要增量更新台账
+        Args:
+            hooks / summaries: 各章钩子与摘要文本列表，默认取自章节列表（后台线程调用时应传入快照）
+        Returns:
+            本次重新检测的钩子数
+        """
+        if hooks is None or summaries is None:
+            chapters = list(getattr(self.app, "chapter_list", []))
+            hooks = [(ch.get("hook", "") or "").strip() for ch in chapters]
+            summaries = [(ch.get("summary", "") or "").strip() for ch in chapters]
+        with self._lock:
+            self._ensure_loaded()
+            summary_hashes = {idx: self._hash(text) for idx, text in enumerate(summaries) if text}
+            changed = {idx for idx, h in summary_hashes.items() if self._summaries.get(idx) != h}
+            removed = set(self._summaries) - set(summary_hashes)
+            hook_hashes = {idx: self._hash(text) for idx, text in enumerate(hooks) if text}
+            stale_hooks = [idx for idx in self._hooks if idx not in hook_hashes]
+
+            # 需要检测的 (钩子索引, 候选摘要索引集合或 None 表示全部后续章节)
+            jobs = {}
+            for idx, h in hook_hashes.items():
+                entry = self._hooks.get(idx)
+                if entry is None or entry["hash"] != h:
+                    jobs[idx] = None
+                    continue
+                resolved_in = entry.get("resolved_in")
+                if resolved_in is not None and (resolved_in in changed or resolved_in in removed):
+                    jobs[idx] = None
+                    continue
+                # 未回收的钩子与更早章节摘要的变化：只检测变化的摘要
+                limit = resolved_in if resolved_in is not None else len(summaries)
+                candidates = {j for j in changed if idx < j < limit}
+                if candidates:
+                    jobs[idx] = candidates
+
+            if not jobs and not changed and not removed and not stale_hooks:
+                return 0
+
+            index = self._update_index(summaries, summary_hashes)
+            for idx in stale_hooks:
+                self._hooks.pop(idx, None)
+            for idx, candidates in jobs.items():
+                entry = self._hooks.get(idx)
+                if candidates is None or entry is None or entry["hash"] != hook_hashes[idx]:
+                    entry = {"hash": hook_hashes[idx], "resolved_in": None, "score": 0.0}
+                    candidates = None
+                found, score = self._find_resolution(hooks[idx], idx, candidates, index)
+                if found is not None:
+                    entry = dict(entry, resolved_in=found, score=round(score, 3))
+                self._hooks[idx] = entry
+            self._summaries = summary_hashes
+            self._save()
+        if jobs:
+            print(f"[信息] 伏笔台账已更新：重新检测 {len(jobs)} 条，未回收 {len(self.open_hooks())} 条")
+        return len(jobs)
+
+    def _update_index(self, summaries, summary_hashes):
+        """
+        按摘要哈希增量更新倒排表，只重新切分有变化的摘要（调用方需持有锁）
+        Returns:
+            {"postings": {二元组: {章节索引}}, "doc_count": 非空摘要数}
+        """
+        if self._index is None:
+            self._index = {"postings": {}, "grams": {}, "hashes": {}}
+        postings, grams, hashes = self._index["postings"], self._index["grams"], self._index["hashes"]
+        for idx in [i for i, h in hashes.items() if summary_hashes.get(i) != h]:
+            for gram in grams.pop(idx):
+                docs = postings[gram]
+                docs.discard(idx)
+                if not docs:
+                    del postings[gram]
+            del hashes[idx]
+        for idx, h in summary_hashes.items():
+            if idx in hashes:
+                continue
+            grams[idx] = set(char_bigrams(summaries[idx]))
+            for gram in grams[idx]:
+                postings.setdefault(gram, set()).add(idx)
+            hashes[idx] = h
+        return {"postings": postings, "doc_count": len(hashes)}
+
+    @staticmethod
+    def _find_resolution(hook, hook_idx, candidates, index):
+        """
+        找出最早回收该钩子的章节
+        Args:
+            candidates: 只在这些章节中查找；None 表示全部后续章节
+        Returns:
+            (章节索引或 None, 匹配度)
+        """
+        postings, doc_count = index["postings"], index["doc_count"]
+        max_df = max(1, int(doc_count * MAX_DOC_FREQ_RATIO))
+        weights = {}
+        for gram in set(char_bigrams(hook)):
+            df = len(postings.get(gram, ()))
+            if df <= max_df:
+                weights[gram] = idf(doc_count, df)
+        total = sum(weights.values())
+        if not total:
+            return None, 0.0
+        scores, shared = {}, {}
+        for gram, weight in weights.items():
+            for idx in postings.get(gram, ()):
+                if idx <= hook_idx or (candidates is not None and idx not in candidates):
+                    continue
+                scores[idx] = scores.get(idx, 0.0) + weight
+                shared[idx] = shared.get(idx, 0) + 1
+        for idx in sorted(scores):
+            score = scores[idx] / total
+            if score >= RESOLVE_THRESHOLD and shared[idx] >= MIN_SHARED_BIGRAMS:
+                return idx, score
+        return None, 0.0
+
+    def start_refresh(self):
+        """在后台更新台账（界面线程调用）"""
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return False
+        chapters = list(getattr(self.app, "chapter_list", []))
+        hooks = [(ch.get("hook", "") or "").strip() for ch in chapters]
+        summaries = [(ch.get("summary", "") or "").strip() for ch in chapters]
+
+        def refresh_thread():
+            try:
+                self.refresh(hooks, summaries)
+            except Exception as e:
+                print(f"[警告] 更新伏笔台账失败: {e}")
+                traceback.print_exc()
+
+        self._refresh_thread = threading.Thread(target=refresh_thread, daemon=True)
+        self._refresh_thread.start()
+        return True
+
+    # ==================== 查询 ====================
+
+    def open_hooks(self, before_idx=None):
+        """
+        未回收的伏笔
+        Args:
+            before_idx: 只看该章节索引之前埋下、且在该章之前未回收的伏笔；None 表示全部
+        Returns:
+            [(章节索引, 钩子文本), ...]，按章节升序
+        """
+        chapters = getattr(self.app, "chapter_list", [])
+        result = []
+        with self._lock:
+            self._ensure_loaded()
+            for idx in sorted(self._hooks):
+                if before_idx is not None and idx >= before_idx:
+                    break
+                resolved_in = self._hooks[idx].get("resolved_in")
+                if resolved_in is not None and (before_idx is None or resolved_in < before_idx):
+                    continue
+                if idx < len(chapters):
+                    result.append((idx, (chapters[idx].get("hook", "") or "").strip()))
+        return result
+
+    def resolution_of(self, idx):
+        """某章伏笔的回收章节索引，未回收或未记录返回 None"""
+        with self._lock:
+            self._ensure_loaded()
+            return (self._hooks.get(idx) or {}).get("resolved_in")
+
+    def prompt_hooks(self, current_idx):
+        """
+        组织提示词用的未回收伏笔（固定上限，取最近埋下的若干条）
+        Returns:
+            [(章节序号, 钩子文本), ...]
+        """
+        if current_idx is None:
+            return []
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"[警告] 更新伏笔台账失败: {e}")
+            traceback.print_exc()
+        hooks = self.open_hooks(current_idx)[-MAX_PROMPT_HOOKS:]
+        return [(idx + 1, text if len(text) <= MAX_HOOK_CHARS else text[:MAX_HOOK_CHARS] + "…") for idx, text in hooks]
@@ -0,0 +1,244 @@
+"""
+TXT 导入服务
+将已有的整本 TXT 小说按“第X章”标题流式切分为章节，批量写入当前小说。
+文件通过内存映射逐行读取，不一次性解码整本书；耗时与文件大小成线性关系。
+"""
+
+import os
+import re
+import mmap
+import codecs
+import threading
+import traceback
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+
+# 章节标题：与 PromptBuilder._strip_chapter_prefix 识别的“第N章”格式一致（章后可直接接标题，如“第1章风起”），另兼容中文数字
+CHAPTER_HEADING_PATTERN = re.compile(
+    r"^\s*第\s*([0-9０-９零〇一二两三四五六七八九十百千万]+)\s*章(?:\s+|[:：、.．]\s*)?(.*)$"
+)
+# 标题行的最大长度，超过视为正文（避免把正文中的“第三章”误判为标题）
+MAX_HEADING_LENGTH = 60
+# 编码探测时读取的字节数
+ENCODING_SAMPLE_SIZE = 256 * 1024
+# 每读取多少字节回调一次进度
+PROGRESS_STEP = 1024 * 1024
+
+
+class ImportCancelled(Exception):
+    """导入被用户取消"""
+
+
+def detect_encoding(sample):
+    """
+    探测文本编码
+    Args:
+        sample: 文件开头的字节样本
+    Returns:
+        "utf-8-sig" / "utf-8" / "gb18030"
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # 样本末尾可能截断了一个多字节字符，只要错误出现在最后几个字节内仍视为 UTF-8
+        if e.start >= len(sample) - 3:
+            return "utf-8"
+    # GB18030 是 GBK 的超集
+    return "gb18030"
+
+
+def parse_heading(line):
+    """
+    判断一行是否为章节标题
+    Returns:
+        纯标题（不含“第X章”前缀，可能为空字符串）；不是标题时返回 None
+    """
+    stripped = line.strip()
+    if not stripped or len(stripped) > MAX_HEADING_LENGTH:
+        return None
+    match = CHAPTER_HEADING_PATTERN.match(stripped)
+    if not match:
+        return None
+    return match.group(2).strip()
+
+
+def split_txt_chapters(path, progress_callback=None, cancel_event=None):
+    """
+    流式切分 TXT 文件
+    Args:
+        path: TXT 文件路径
+        progress_callback: 可选回调 f(已读取字节数, 总字节数)
+        cancel_event: threading.Event，置位后中止
+    Returns:
+        (章节列表[(标题, 正文)], 首个标题之前被跳过的字数, 使用的编码)
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return [], 0, "utf-8"
+
+    chapters = []
+    preface_chars = 0
+    current_title = None
+    current_lines = []
+
+    def flush():
+        nonlocal preface_chars
+        body = "\n".join(current_lines).strip()
+        if current_title is None:
+            preface_chars = len(body)
+        else:
+            chapters.append((current_title, body))
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        encoding = detect_encoding(mm[:ENCODING_SAMPLE_SIZE])
+        if encoding == "utf-8-sig":
+            mm.seek(len(codecs.BOM_UTF8))
+            encoding = "utf-8"
+        next_report = PROGRESS_STEP
+
+        while True:
+            raw = mm.readline()
+            if not raw:
+                break
+            try:
+                line = raw.decode(encoding)
+            except UnicodeDecodeError:
+                if encoding == "utf-8":
+                    # 样本全为 ASCII 时可能误判，遇到非法字节后改用 GB18030
+                    encoding = "gb18030"
+                line = raw.decode(encoding, errors="replace")
+            line = line.rstrip("\r\n")
+
+            title = parse_heading(line)
+            if title is not None:
+                flush()
+                current_title = title
+                current_lines = []
+            else:
+                current_lines.append(line)
+
+            position = mm.tell()
+            if position >= next_report:
+                next_report = position + PROGRESS_STEP
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ImportCancelled()
+                if progress_callback:
+                    progress_callback(position, size)
+
+        flush()
+
+    if progress_callback:
+        progress_callback(size, size)
+    return chapters, preface_chars, encoding
+
+
+class ImportService:
+    """TXT 导入服务类"""
+
+    def __init__(self, app):
+        """
+        初始化导入服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+
+    def start_import(self, path):
+        """
+        在后台线程中切分 TXT 文件并显示进度，切分完成后确认并一次性写入当前小说
+        Args:
+            path: TXT 文件路径
+        """
+        cancel_event = threading.Event()
+
+        dialog = tk.Toplevel(self.app.root)
+        dialog.title("正在导入")
+        dialog.transient(self.app.root)
+        dialog.resizable(False, False)
+        self.app.ui_helper.center_window(dialog, 420, 150)
+        status_label = tk.Label(dialog, text="正在读取文件...", font=("Microsoft YaHei", 10))
+        status_label.pack(pady=(15, 8))
+        progress = ttk.Progressbar(dialog, length=360, mode="determinate", maximum=100)
+        progress.pack(pady=5)
+        tk.Button(dialog, text="取消", command=cancel_event.set, cursor="hand2", width=10).pack(pady=10)
+        dialog.protocol("WM_DELETE_WINDOW", cancel_event.set)
+
+        def on_progress(done, total):
+            def update():
+                if dialog.winfo_exists():
+                    progress["value"] = done * 100 / max(total, 1)
+                    status_label.config(text=f"已读取 {done / 1048576:.1f} / {total / 1048576:.1f} MB")
+            self.app.root.after(0, update)
+
+        def close_dialog():
+            if dialog.winfo_exists():
+                dialog.destroy()
+
+        def on_parsed(chapters, preface_chars, encoding):
+            close_dialog()
+            self._confirm_and_append(path, chapters, preface_chars, encoding)
+
+        def on_error(message):
+            close_dialog()
+            messagebox.showerror("错误", message)
+
+        def import_thread():
+            try:
+                chapters, preface_chars, encoding = split_txt_chapters(path, on_progress, cancel_event)
+                self.app.root.after(0, lambda: on_parsed(chapters, preface_chars, encoding))
+            except ImportCancelled:
+                self.app.root.after(0, close_dialog)
+            except Exception as e:
+                traceback.print_exc()
+                err = str(e)
+                self.app.root.after(0, lambda: on_error(f"导入过程中发生错误：{err}"))
+
+        threading.Thread(target=import_thread, daemon=True).start()
+
+    def _confirm_and_append(self, path, chapters, preface_chars, encoding):
+        """确认切分结果后，将章节追加到当前小说并一次性持久化"""
+        if not chapters:
+            messagebox.showwarning("导入", "未在文件中识别到“第X章”格式的章节标题。")
+            return
+
+        total_chars = sum(len(body) for _, body in chapters)
+        message = (
+            f"文件：{os.path.basename(path)}（{encoding}）\n"
+            f"识别到 {len(chapters)} 个章节，共 {total_chars} 字。\n"
+        )
+        if preface_chars:
+            message += f"首个章节标题之前的 {preface_chars} 字（如书名、简介）将不会导入。\n"
+        message += f"\n是否追加到当前小说（现有 {len(self.app.chapter_list)} 章）之后？"
+        if not messagebox.askyesno("确认导入", message):
+            return
+
+        start = len(self.app.chapter_list)
+        for offset, (title, body) in enumerate(chapters):
+            self.app.chapter_list.append({
+                "title": title or "未命名章节",
+                "content": body,
+                "prompt": "",
+                "summary": "",
+                "climax": "",
+                "hook": "",
+                "scenes": "",
+                "num": str(start + offset + 1),
+                "global_summary": "",
+                "char_status": "",
+                "char_relations": ""
+            })
+
+        # 所有章节一次性写入（单次 novel.ini 写入 + 快照刷新）
+        if not self.app.novel_service._persist_chapters_to_novel():
+            del self.app.chapter_list[start:]
+            messagebox.showerror("错误", "写入章节失败，已撤销本次导入。")
+            return
+
+        self.app.novel_service.refresh_chapter_listbox()
+        self.app.mention_index_service.start_refresh()
+        print(f"[信息] 已从 {path} 导入 {len(chapters)} 个章节")
+        messagebox.showinfo("导入", f"✅ 已导入 {len(chapters)} 个章节。")
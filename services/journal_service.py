@@ -0,0 +1,187 @@
+"""
+预写日志（崩溃恢复）服务
+在小说目录下维护一个只追加的日志文件，实时记录 AI 返回结果与编辑器的定期快照，
+程序异常退出后可在下次打开小说时恢复尚未保存的内容。
+
+日志文件：<小说目录>/journal.log，每行一条 JSON 记录：
+    {"type": "ai", "chapter": 索引, "task": "generate", "content": "...", "time": ...}
+    {"type": "editor", "chapter": 索引, "content": "...", "time": ...}
+    {"type": "saved", "chapter": 索引, "time": ...}
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import traceback
+
+
+JOURNAL_FILENAME = "journal.log"
+
+
+class JournalService:
+    """预写日志服务类"""
+
+    def __init__(self, app):
+        """
+        初始化日志服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._lock = threading.Lock()
+        # 最近一次编辑器快照的哈希，内容未变化时不重复写入
+        self._last_snapshot_hash = None
+
+    def _journal_path(self):
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if not novel_dir:
+            return ""
+        return os.path.join(novel_dir, JOURNAL_FILENAME)
+
+    def _append(self, record):
+        """追加一条记录并立即落盘（fsync）"""
+        path = self._journal_path()
+        if not path:
+            return False
+        try:
+            record["time"] = time.time()
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            with self._lock:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+            return True
+        except Exception as e:
+            print(f"[警告] 写入恢复日志失败: {e}")
+            traceback.print_exc()
+            return False
+
+    def _chapter_title(self, chapter_index):
+        try:
+            return self.app.chapter_list[chapter_index].get("title", "")
+        except Exception:
+            return ""
+
+    def record_ai_response(self, chapter_index, task, content):
+        """
+        记录 AI 返回后的章节完整正文（在工作线程中、更新界面之前调用）
+        Args:
+            chapter_index: 章节索引
+            task: 任务类型（generate/continue/modify）
+            content: 应用 AI 结果后的章节完整正文
+        """
+        if chapter_index is None or not content or content.startswith("❌"):
+            return False
+        return self._append({
+            "type": "ai",
+            "chapter": chapter_index,
+            "title": self._chapter_title(chapter_index),
+            "task": task,
+            "content": content,
+        })
+
+    def record_editor_snapshot(self, chapter_index, content):
+        """记录编辑器正文快照（内容与上次快照相同时跳过）"""
+        if chapter_index is None or not content:
+            return False
+        digest = hashlib.sha1(f"{chapter_index}:{content}".encode("utf-8")).hexdigest()
+        if digest == self._last_snapshot_hash:
+            return False
+        self._last_snapshot_hash = digest
+        return self._append({
+            "type": "editor",
+            "chapter": chapter_index,
+            "title": self._chapter_title(chapter_index),
+            "content": content,
+        })
+
+    def mark_saved(self, chapter_index):
+        """
+        章节保存成功后调用：写入检查点，若已没有待恢复内容则截断日志
+        """
+        path = self._journal_path()
+        if not path or not os.path.exists(path):
+            return
+        self._append({"type": "saved", "chapter": chapter_index})
+        if not self.pending_entries():
+            self.truncate()
+
+    def pending_entries(self):
+        """
+        读取日志，返回每个章节最后一次检查点之后的最新记录
+        Returns:
+            {章节索引: 记录}
+        """
+        path = self._journal_path()
+        if not path or not os.path.exists(path):
+            return {}
+        pending = {}
+        with self._lock:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 崩溃时最后一行可能不完整
+                        continue
+                    chapter_index = record.get("chapter")
+                    if record.get("type") == "saved":
+                        pending.pop(chapter_index, None)
+                    else:
+                        pending[chapter_index] = record
+        return pending
+
+    def shift_chapters(self, index, delta):
+        """
+        章节插入或删除后改写日志中的章节索引
+        Args:
+            index: 插入或删除的位置（章节索引）
+            delta: 1 表示在 index 处插入了一章，-1 表示删除了第 index 章（其记录一并丢弃）
+        """
+        path = self._journal_path()
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with self._lock:
+                records = []
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            continue
+                lines = []
+                for record in records:
+                    chapter_index = record.get("chapter")
+                    if isinstance(chapter_index, int) and chapter_index >= index:
+                        if delta < 0 and chapter_index == index:
+                            continue
+                        record["chapter"] = chapter_index + delta
+                    lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.writelines(lines)
+                os.replace(tmp_path, path)
+            self._last_snapshot_hash = None
+        except Exception as e:
+            print(f"[警告] 改写恢复日志的章节索引失败: {e}")
+            traceback.print_exc()
+
+    def truncate(self):
+        """清空日志"""
+        path = self._journal_path()
+        if not path:
+            return
+        try:
+            with self._lock:
+                if os.path.exists(path):
+                    os.remove(path)
+            self._last_snapshot_hash = None
+        except Exception as e:
+            print(f"[警告] 清空恢复日志失败: {e}")
@@ -0,0 +1,280 @@
+"""
+人物/设定提及索引服务
+按章节记录每个角色（含别名）与设定条目在正文中的出现次数，
+用于人物档案页的即时出场统计，以及组织提示词时低成本地找回相关旧章节。
+
+索引文件：<小说目录>/mention_index.json
+    {"version": 名称版本, "chapters": {章节索引: {"hash": 正文哈希, "counts": {名称: 次数}}}}
+保存章节时只重算该章；打开小说或批量导入后在后台比对正文哈希，只重算有变化的章节。
+名称（角色名、别名、设定名）变化时版本号改变，索引在后台整体重建；重建完成前沿用旧索引。
+"""
+
+import os
+import json
+import bisect
+import hashlib
+import threading
+import traceback
+from services.name_matcher import NameMatcher, parse_aliases
+
+
+MENTION_INDEX_FILENAME = "mention_index.json"
+
+
+class MentionIndexService:
+    """提及索引服务类"""
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._lock = threading.RLock()
+        self._chapters = {}
+        # 倒排表 {名称: [已排序章节索引]}，以及 {名称: {章节索引: 次数}}
+        self._postings = {}
+        self._counts = {}
+        # 索引计数所对应的名称版本，以及当前自动机的名称版本；名称变化后的重建是否已安排或正在进行
+        self._version = None
+        self._matcher_version = None
+        self._matcher = None
+        self._rebuild_scheduled = False
+        self._loaded_dir = None
+        self._refresh_thread = None
+
+    def _index_path(self):
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        return os.path.join(novel_dir, MENTION_INDEX_FILENAME) if novel_dir else ""
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+    def _entities(self):
+        """{名称: [别名, ...]}：人物设定与小说设定的条目名"""
+        entities = {}
+        for details in (getattr(self.app, "novel_setting_details", {}), getattr(self.app, "character_setting_details", {})):
+            for name, text in (details or {}).items():
+                entities.setdefault(name, parse_aliases(text))
+        return entities
+
+    def _current_matcher(self):
+        """按名称版本获取自动机；与索引的版本不一致时安排后台整体重建（调用方需持有锁）"""
+        entities = self._entities()
+        version = self._hash(json.dumps(sorted(entities.items()), ensure_ascii=False))
+        if version != self._matcher_version:
+            self._matcher_version = version
+            self._matcher = NameMatcher(entities)
+        if version != self._version and not self._rebuild_scheduled:
+            if self._version is not None:
+                print("[信息] 人物/设定名称已变化，提及索引将在后台重建")
+            self._rebuild_scheduled = True
+            self.app.root.after(0, self.start_refresh)
+        return self._matcher
+
+    # ==================== 加载与保存 ====================
+
+    def _ensure_loaded(self):
+        """切换小说后加载索引文件（调用方需持有锁）"""
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if novel_dir == self._loaded_dir:
+            return
+        self._loaded_dir = novel_dir
+        self._chapters, self._postings, self._counts = {}, {}, {}
+        self._version = None
+        path = self._index_path()
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._version = data.get("version")
+            for key, entry in data.get("chapters", {}).items():
+                self._set_chapter(int(key), entry["hash"], entry["counts"])
+        except Exception as e:
+            print(f"[警告] 读取提及索引失败，将重建: {e}")
+            self._chapters, self._postings, self._counts = {}, {}, {}
+            self._version = None
+
+    def _save(self):
+        """写回索引文件（调用方需持有锁）"""
+        path = self._index_path()
+        if not path:
+            return
+        data = {"version": self._version,
+                "chapters": {str(idx): entry for idx, entry in sorted(self._chapters.items())}}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def _set_chapter(self, idx, content_hash, counts):
+        """更新某章的计数与倒排表（调用方需持有锁）"""
+        old = self._chapters.get(idx)
+        if old:
+            for name in old["counts"]:
+                postings = self._postings.get(name, [])
+                pos = bisect.bisect_left(postings, idx)
+                if pos < len(postings) and postings[pos] == idx:
+                    postings.pop(pos)
+                self._counts.get(name, {}).pop(idx, None)
+        if counts is None:
+            self._chapters.pop(idx, None)
+            return
+        self._chapters[idx] = {"hash": content_hash, "counts": counts}
+        for name, count in counts.items():
+            bisect.insort(self._postings.setdefault(name, []), idx)
+            self._counts.setdefault(name, {})[idx] = count
+
+    # ==================== 更新 ====================
+
+    def update_chapter(self, idx, save=True):
+        """
+        重算单章的提及计数（正文未变化时跳过）
+        Returns:
+            是否有更新
+        """
+        try:
+            with self._lock:
+                self._ensure_loaded()
+                matcher = self._current_matcher()
+                if not (0 <= idx < len(self.app.chapter_list)):
+                    return False
+                content = self.app.chapter_list[idx].get("content", "") or ""
+                content_hash = self._hash(content)
+                entry = self._chapters.get(idx)
+                if entry and entry["hash"] == content_hash:
+                    return False
+                self._set_chapter(idx, content_hash, matcher.count(content))
+                if save:
+                    self._save()
+                return True
+        except Exception as e:
+            print(f"[警告] 更新提及索引失败: {e}")
+            traceback.print_exc()
+            return False
+
+    def start_refresh(self):
+        """
+        在后台比对全部章节的正文哈希，只重算有变化的章节；名称版本变化时重算全部章节（界面线程调用）
+        Returns:
+            是否启动了刷新任务
+        """
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return False
+        contents = [chapter.get("content", "") or "" for chapter in self.app.chapter_list]
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if not novel_dir:
+            self._rebuild_scheduled = False
+            return False
+        # 刷新期间不再另行安排重建，结束后复位
+        self._rebuild_scheduled = True
+
+        def refresh_thread():
+            updated = 0
+            try:
+                with self._lock:
+                    self._ensure_loaded()
+                    matcher = self._current_matcher()
+                    version = self._matcher_version
+                    rebuild = version != self._version
+                    # 章节被删除后多出的索引
+                    for idx in [i for i in self._chapters if i >= len(contents)]:
+                        self._set_chapter(idx, None, None)
+                        updated += 1
+                for idx, content in enumerate(contents):
+                    content_hash = self._hash(content)
+                    entry = self._chapters.get(idx)
+                    if not rebuild and entry and entry["hash"] == content_hash:
+                        continue
+                    counts = matcher.count(content)
+                    with self._lock:
+                        if self._loaded_dir != novel_dir:
+                            return
+                        if self._matcher is not matcher:
+                            # 重建途中名称又有变化，按新名称重新开始
+                            self.app.root.after(0, self.start_refresh)
+                            return
+                        self._set_chapter(idx, content_hash, counts)
+                    updated += 1
+                if updated or rebuild:
+                    with self._lock:
+                        if self._loaded_dir == novel_dir:
+                            self._version = version
+                            self._save()
+                print(f"[信息] 提及索引已更新 {updated} 章（共 {len(contents)} 章）")
+            except Exception as e:
+                print(f"[警告] 刷新提及索引失败: {e}")
+                traceback.print_exc()
+            finally:
+                self._rebuild_scheduled = False
+
+        self._refresh_thread = threading.Thread(target=refresh_thread, daemon=True)
+        self._refresh_thread.start()
+        return True
+
+    # ==================== 查询 ====================
+
+    def lookup(self, name):
+        """
+        查询某角色/设定的出场情况
+        Returns:
+            {"total": 总次数, "chapters": 出现章数, "first": 首次章节序号, "last": 最近章节序号}，
+            从未出现时返回 None
+        """
+        with self._lock:
+            self._ensure_loaded()
+            postings = self._postings.get(name)
+            if not postings:
+                return None
+            counts = self._counts[name]
+            return {
+                "total": sum(counts.values()),
+                "chapters": len(postings),
+                "first": postings[0] + 1,
+                "last": postings[-1] + 1,
+            }
+
+    def chapters_of(self, name):
+        """某名称出现的章节 [(章节索引, 次数), ...]，按章节升序"""
+        with self._lock:
+            self._ensure_loaded()
+            counts = self._counts.get(name, {})
+            return [(idx, counts[idx]) for idx in self._postings.get(name, [])]
+
+    def last_before(self, name, before_idx):
+        """某名称在 before_idx 之前最后出现的章节索引，没有返回 None"""
+        with self._lock:
+            self._ensure_loaded()
+            postings = self._postings.get(name, [])
+            pos = bisect.bisect_left(postings, before_idx)
+            return postings[pos - 1] if pos else None
+
+    def describe(self, name):
+        """档案页悬浮提示中显示的出场统计，未出现时返回空字符串"""
+        info = self.lookup(name)
+        if not info:
+            return ""
+        return (f"📍 出场 {info['total']} 次 / {info['chapters']} 章"
+                f"｜首次：第{info['first']}章｜最近：第{info['last']}章")
+
+    def recall_chapters(self, text, current_idx, recent=3, limit=3):
+        """
+        低成本的上下文选取：找出 text（如本章策划）中提到、但最近 recent 章没有出场的角色/设定，
+        返回它们上一次出场的章节索引（按距今由近到远，最多 limit 个）
+        """
+        if current_idx is None or not text:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            names = self._current_matcher().count(text)
+        picked = []
+        window_start = current_idx - recent
+        for name in sorted(names, key=lambda n: -names[n]):
+            last = self.last_before(name, current_idx)
+            if last is None or last >= window_start or last in picked:
+                continue
+            picked.append(last)
+        return sorted(picked, reverse=True)[:limit]
@@ -0,0 +1,158 @@
+"""
+人物名匹配模块
+以全部角色名与别名构建 Aho-Corasick 自动机，一次线性扫描即可找出文本中出现的所有角色，
+重叠时取最长匹配（如“李四娘”优先于“李四”），用于人物动态同步、提及检测与检索。
+
+别名来自人物档案中形如“别名：小四、四娘”的行（支持 别名/外号/绰号/又名/昵称/称号）。
+单字角色名不参与子串匹配（“宁”会误中“宁采臣”“安宁”），只在解析的人物名与其完全相同时采用。
+自动机按“角色名 + 别名”的版本缓存，人物设定不变时不会重建。
+"""
+
+import re
+import hashlib
+from collections import deque
+
+
+ALIAS_PATTERN = re.compile(r"^\s*[-*]?\s*(?:别名|外号|绰号|又名|昵称|称号)\s*[：:]\s*(.+)$", re.MULTILINE)
+ALIAS_SEPARATORS = re.compile(r"[、，,；;/|\s]+")
+# 单字别名误匹配太多，忽略；单字角色名只做完全匹配
+MIN_ALIAS_LENGTH = 2
+
+
+def parse_aliases(profile):
+    """从人物档案中提取别名列表"""
+    aliases = []
+    for match in ALIAS_PATTERN.finditer(profile or ""):
+        for alias in ALIAS_SEPARATORS.split(match.group(1)):
+            alias = alias.strip("“”\"'（）()【】")
+            if len(alias) >= MIN_ALIAS_LENGTH and alias not in aliases:
+                aliases.append(alias)
+    return aliases
+
+
+class NameMatcher:
+    """角色名 Aho-Corasick 自动机"""
+
+    def __init__(self, names):
+        """
+        构建自动机
+        Args:
+            names: {角色名: [别名, ...]}
+        """
+        # 每个节点：goto 字典、失败指针、以该节点结尾的最长模式 (长度, 角色名)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]
+        self.canonical = {}
+        for name, aliases in names.items():
+            for pattern in [name] + list(aliases or []):
+                # 同一写法出现在多个角色下时，以角色名本身优先，其次先登记者优先
+                if pattern and (pattern not in self.canonical or pattern == name):
+                    self.canonical[pattern] = name
+        for pattern, name in self.canonical.items():
+            if len(pattern) >= MIN_ALIAS_LENGTH:
+                self._add(pattern, name)
+        self._build()
+
+    def _add(self, pattern, name):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+            node = nxt
+        self._output[node] = (len(pattern), name)
+
+    def _build(self):
+        """广度优先计算失败指针；节点输出合并为沿失败链的最长模式"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                if node == 0:
+                    self._fail[nxt] = 0
+                else:
+                    fail = self._fail[node]
+                    while fail and ch not in self._goto[fail]:
+                        fail = self._fail[fail]
+                    self._fail[nxt] = self._goto[fail].get(ch, 0)
+                if self._output[nxt] is None:
+                    self._output[nxt] = self._output[self._fail[nxt]]
+                queue.append(nxt)
+
+    def _raw_matches(self, text):
+        """逐字符扫描，返回每个结束位置上最长的匹配 [(起, 止, 角色名), ...]"""
+        matches = []
+        node = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            out = output[node]
+            if out:
+                matches.append((pos + 1 - out[0], pos + 1, out[1]))
+        return matches
+
+    def find_all(self, text):
+        """
+        找出文本中所有角色出现位置（互不重叠，最长优先）
+        Returns:
+            [(起始位置, 结束位置, 角色名), ...]，按位置排序
+        """
+        matches = self._raw_matches(text or "")
+        # 按起点升序、长度降序，贪心选取不重叠的最长匹配
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+        result = []
+        last_end = 0
+        for start, end, name in matches:
+            if start >= last_end:
+                result.append((start, end, name))
+                last_end = end
+        return result
+
+    def count(self, text):
+        """统计文本中各角色的出现次数 {角色名: 次数}"""
+        counts = {}
+        for _, _, name in self.find_all(text):
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def resolve(self, token):
+        """
+        将解析出的人物名解析为档案中的角色名
+        完全等于某个角色名/别名时直接采用，否则取其中最长的匹配（单字角色名不参与）；无匹配返回 None
+        """
+        token = (token or "").strip()
+        if token in self.canonical:
+            return self.canonical[token]
+        matches = self.find_all(token)
+        if not matches:
+            return None
+        return max(matches, key=lambda m: m[1] - m[0])[2]
+
+
+_cache = {"version": None, "matcher": None}
+
+
+def matcher_version(details):
+    """人物设定的“角色名 + 别名”版本号"""
+    raw = "\n".join(f"{name}\t{'|'.join(parse_aliases(profile))}" for name, profile in sorted((details or {}).items()))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def get_matcher(details):
+    """
+    获取当前人物设定对应的自动机（版本不变时复用）
+    Args:
+        details: {角色名: 人物档案}
+    """
+    version = matcher_version(details)
+    if _cache["version"] != version:
+        _cache["matcher"] = NameMatcher({name: parse_aliases(profile) for name, profile in (details or {}).items()})
+        _cache["version"] = version
+    return _cache["matcher"]
@@ -4,14 +4,18 @@
 """
 
 import tkinter as tk
-from tkinter import messagebox, filedialog, simpledialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import os
 import configparser
+import shutil
 import threading
 import traceback
 from datetime import datetime
 from AI.prompt_builder import PromptBuilder
 from services.config_manager import ConfigManager
+from services.snapshot_service import SnapshotService
+from services import chain_store
+from services.name_matcher import get_matcher
 
 
 class NovelService:
@@ -30,19 +34,17 @@ class NovelService:
     def refresh_chapter_listbox(self):
         """刷新所有页面的章节列表显示"""
         try:
-            # 策划页列表框
-            if hasattr(self.app, 'chapter_listbox'):
-                self.app.chapter_listbox.delete(0, tk.END)
-                for idx, chapter in enumerate(self.app.chapter_list):
-                    display_text = f"第{idx+1}章 {chapter.get('title', '')}"
-                    self.app.chapter_listbox.insert(tk.END, display_text)
-            
-            # 正文页列表框
-            if hasattr(self.app, 'content_chapter_listbox'):
-                self.app.content_chapter_listbox.delete(0, tk.END)
+            # 摘要链过期的章节追加标记并以橙色显示
+            stale = self.app.staleness_service.compute_stale() if hasattr(self.app, "staleness_service") else {}
+            for listbox_name in ("chapter_listbox", "content_chapter_listbox"):
+                listbox = getattr(self.app, listbox_name, None)
+                if listbox is None:
+                    continue
+                listbox.delete(0, tk.END)
                 for idx, chapter in enumerate(self.app.chapter_list):
-                    display_text = f"第{idx+1}章 {chapter.get('title', '')}"
-                    self.app.content_chapter_listbox.insert(tk.END, display_text)
+                    listbox.insert(tk.END, self._chapter_display_text(idx, chapter.get('title', ''), stale))
+                    if idx in stale:
+                        listbox.itemconfig(idx, fg="#d9822b")
                     
             # 恢复当前选择
             if self.app.current_chapter_index is not None:
@@ -50,6 +52,34 @@ class NovelService:
         except Exception as e:
             print(f"[错误] 刷新章节列表失败: {e}")
 
+    def _chapter_display_text(self, idx, title, stale=None):
+        """章节列表显示文本：第X章 标题（过期时追加标记）"""
+        display_text = f"第{idx+1}章 {title}"
+        if hasattr(self.app, "staleness_service"):
+            display_text += self.app.staleness_service.stale_label(idx, stale)
+        return display_text
+
+    def refresh_stale_marks(self):
+        """只更新过期标记有变化的列表项，保留当前选择（保存或后台刷新后调用）"""
+        try:
+            stale = self.app.staleness_service.compute_stale() if hasattr(self.app, "staleness_service") else {}
+            for listbox_name in ("chapter_listbox", "content_chapter_listbox"):
+                listbox = getattr(self.app, listbox_name, None)
+                if listbox is None or listbox.size() != len(self.app.chapter_list):
+                    continue
+                selected = set(listbox.curselection())
+                for idx, chapter in enumerate(self.app.chapter_list):
+                    display_text = self._chapter_display_text(idx, chapter.get('title', ''), stale)
+                    if listbox.get(idx) == display_text:
+                        continue
+                    listbox.delete(idx)
+                    listbox.insert(idx, display_text)
+                    listbox.itemconfig(idx, fg="#d9822b" if idx in stale else "")
+                    if idx in selected:
+                        listbox.selection_set(idx)
+        except Exception as e:
+            print(f"[错误] 刷新过期标记失败: {e}")
+
     def _sync_listbox_selection(self, index, source):
         """在两个列表框之间同步选择状态"""
         if source == "plan":
@@ -280,7 +310,9 @@ class NovelService:
                 "num": str(insert_idx + 1)
             }
             self.app.chapter_list.insert(insert_idx, new_chapter)
+            self._shift_chapter_history(insert_idx, 1)
             self._persist_chapters_to_novel()
+            self.app.mention_index_service.start_refresh()
             self.refresh_chapter_listbox()
             self.app.chapter_listbox.selection_set(insert_idx)
             dialog.destroy()
@@ -408,7 +440,7 @@ class NovelService:
                 self.app.chapter_list[idx]["char_relations"] = ch_char_relations
                 
                 # 同步列表框标题显示 (格式: 第X章 标题)
-                display_text = f"第{idx+1}章 {ch_title}"
+                display_text = self._chapter_display_text(idx, ch_title)
                 if hasattr(self.app, "chapter_listbox"):
                     self.app.chapter_listbox.delete(idx)
                     self.app.chapter_listbox.insert(idx, display_text)
@@ -442,6 +474,20 @@ class NovelService:
                         messagebox.showerror("错误", error_msg)
                     return False
                 
+                # 记录版本历史（内容未变化时不会重复记录）
+                if hasattr(self.app, "version_service"):
+                    self.app.version_service.record_version(idx, content, source="save")
+                # 已落盘，恢复日志中该章节的记录不再需要
+                if hasattr(self.app, "journal_service"):
+                    self.app.journal_service.mark_saved(idx)
+                # 只重算本章的人物/设定提及
+                if hasattr(self.app, "mention_index_service"):
+                    self.app.mention_index_service.update_chapter(idx)
+                # 修改可能使后续章节的摘要链过期：刷新标记，并在后台重算当前章节之前的过期章节
+                if hasattr(self.app, "staleness_service"):
+                    self.refresh_stale_marks()
+                    self.app.staleness_service.schedule_lazy_refresh()
+                
                 if not silent:
                     messagebox.showinfo("成功", f"已保存第{idx+1}章")
                 return True
@@ -454,6 +500,13 @@ class NovelService:
                 messagebox.showerror("错误", error_msg)
             return False
     
+    def _shift_chapter_history(self, index, delta):
+        """章节插入（delta=1）或删除（delta=-1）后，移动按章节保存的版本历史、恢复日志、人物关系图与人物经历"""
+        for name in ("version_service", "journal_service", "relation_graph_service", "character_event_service"):
+            service = getattr(self.app, name, None)
+            if service is not None:
+                service.shift_chapters(index, delta)
+
     def delete_selected_chapter(self):
         """删除列表中选定的章节"""
         try:
@@ -467,7 +520,9 @@ class NovelService:
             
             if messagebox.askyesno("确认删除", f"确定要删除 {title} 吗？"):
                 del self.app.chapter_list[idx]
+                self._shift_chapter_history(idx, -1)
                 self._persist_chapters_to_novel()
+                self.app.mention_index_service.start_refresh()
                 self.refresh_chapter_listbox()
                 messagebox.showinfo("成功", "章节已删除")
         except Exception as e:
@@ -542,6 +597,9 @@ class NovelService:
                             self.app._is_handling_chapter_selection = False
                             self._restore_selection(self.app.current_chapter_index)
                             return
+                    elif hasattr(self.app, "journal_service"):
+                        # 用户放弃了更改，恢复日志中的内容也不应再提示恢复
+                        self.app.journal_service.mark_saved(self.app.current_chapter_index)
                 
                 # 同步另一个列表框的选择
                 self._sync_listbox_selection(new_index, source)
@@ -556,6 +614,8 @@ class NovelService:
 
                 # 载入新选择的章节
                 self.load_selected_chapter()
+                if hasattr(self.app, "staleness_service"):
+                    self.app.staleness_service.schedule_lazy_refresh()
             finally:
                 self.app._is_handling_chapter_selection = False
         except Exception as e:
@@ -565,27 +625,35 @@ class NovelService:
             if hasattr(self.app, '_is_handling_chapter_selection'):
                 self.app._is_handling_chapter_selection = False
     
-    def update_character_profile_status(self, status_text_raw):
+    def update_character_profile_status(self, status_text_raw, chapter_num=None, silent=False, persist=True):
         """
-        解析状态文本并累加到角色档案中
+        解析状态文本并写入人物经历存储（见 services/character_event_service.py）
         采用锚点标签格式：<RECORDS> @角色#描述 </RECORDS>
+        Args:
+            status_text_raw: AI 返回的人物动态文本
+            chapter_num: 章节序号（从1开始），None 时取当前章节
+            silent: 为True时不弹出提示框（批量处理时使用）
+            persist: 为False时只更新内存，由调用方稍后调用 character_event_service.flush()
+        Returns:
+            同步的角色数
         """
         if not status_text_raw:
-            return
+            return 0
             
         import re
         print(f"[调试] 开始精准解析角色变动...")
         
         try:
-            # 1. 自动识别当前章节
-            chapter_num = 1
-            if hasattr(self.app, 'current_chapter_index') and self.app.current_chapter_index is not None:
-                chapter_num = self.app.current_chapter_index + 1
-            else:
-                # 尝试从文本中搜寻章节标记（兜底）
-                ch_match = re.search(r'第(\d+)章', status_text_raw)
-                if ch_match:
-                    chapter_num = int(ch_match.group(1))
+            # 1. 自动识别当前章节（调用方未指定时）
+            if chapter_num is None:
+                chapter_num = 1
+                if hasattr(self.app, 'current_chapter_index') and self.app.current_chapter_index is not None:
+                    chapter_num = self.app.current_chapter_index + 1
+                else:
+                    # 尝试从文本中搜寻章节标记（兜底）
+                    ch_match = re.search(r'第(\d+)章', status_text_raw)
+                    if ch_match:
+                        chapter_num = int(ch_match.group(1))
 
             # 2. 提取有效记录区，同时兼容全角符号
             content_to_parse = status_text_raw.replace('＠', '@').replace('＃', '#')
@@ -598,6 +666,8 @@ class NovelService:
             # 使用字典进行记录聚合，确保一章一人只有一条汇总记录
             # 结构：{ '角色名': [经历1, 经历2, ...] }
             char_updates_map = {} 
+            details = getattr(self.app, 'character_setting_details', None)
+            matcher = get_matcher(details) if details else None
 
             for block in record_blocks:
                 block = block.strip()
@@ -615,51 +685,38 @@ class NovelService:
                 if not char_name or not experience:
                     continue
 
-                # 匹配并归类
-                if hasattr(self.app, 'character_setting_details'):
-                    for existing_name in self.app.character_setting_details.keys():
-                        if existing_name == char_name or (existing_name in char_name and len(existing_name) >= 2):
-                            if existing_name not in char_updates_map:
-                                char_updates_map[existing_name] = []
-                            # 避免重复记录完全相同的内容
-                            if experience not in char_updates_map[existing_name]:
-                                char_updates_map[existing_name].append(experience)
-
-            # 统一同步聚合后的结果
+                # 匹配并归类（角色名/别名自动机，最长匹配优先）
+                existing_name = matcher.resolve(char_name) if matcher else None
+                if existing_name:
+                    if existing_name not in char_updates_map:
+                        char_updates_map[existing_name] = []
+                    # 避免重复记录完全相同的内容
+                    if experience not in char_updates_map[existing_name]:
+                        char_updates_map[existing_name].append(experience)
+
+            # 统一写入人物经历存储（同一角色同一章只保留最新一次定稿的结果）
             updated_count = 0
+            events = self.app.character_event_service
             for name, exp_list in char_updates_map.items():
-                # 合并该角色在本章的所有动态
-                full_experience = "；".join(exp_list)
-                new_log_line = f"第{chapter_num}章：{full_experience}"
-                
-                old_content = self.app.character_setting_details[name]
-                if new_log_line not in old_content:
-                    header = "【人物经历】"
-                    if "【状态变迁日志】" in old_content:
-                        header = "【状态变迁日志】"
-                    
-                    if header not in old_content:
-                        new_content = old_content.strip() + f"\n\n{header}\n" + new_log_line
-                    else:
-                        new_content = old_content.strip() + "\n" + new_log_line
-                    
-                    self.app.character_setting_details[name] = new_content
+                if events.record_chapter(name, chapter_num, exp_list, persist=False):
                     updated_count += 1
-                    print(f"[调试] 档案同步: {name} <- {new_log_line}")
+                    print(f"[调试] 经历同步: {name} <- 第{chapter_num}章：{'；'.join(exp_list)}")
             
             if updated_count > 0:
-                from services.persistence_service import PersistenceService
-                ps = PersistenceService(self.app)
-                ps.save_novel_settings()
-                print(f"[成功] 已将 {updated_count} 条经历同步至人物设定。")
-                messagebox.showinfo("同步成功", f"✅ 已成功将 {updated_count} 位角色的经历同步到档案。")
-            else:
+                if persist:
+                    events.flush()
+                print(f"[成功] 已将 {updated_count} 条经历同步至人物经历。")
+                if not silent:
+                    messagebox.showinfo("同步成功", f"✅ 已成功将 {updated_count} 位角色的经历同步到档案。")
+            elif not silent:
                 messagebox.showinfo("提示", "未发现可同步的新动态（可能已同步或格式不符）。")
+            return updated_count
                 
         except Exception as e:
             print(f"[警告] 角色档案解析失败: {e}")
             import traceback
             traceback.print_exc()
+            return 0
 
     def _persist_chapters_to_novel(self):
         """
@@ -669,6 +726,7 @@ class NovelService:
                 [CHAPTER_TITLES] 索引=标题（纯标题）
                 [CHAPTER_PROMPTS] 索引=创作提示
                 [CHAPTER_SUMMARIES] 索引=章节总结
+                [CHAPTER_GLOBAL_SUMMARIES] 等摘要链分区：检查点 + 差异（见 services/chain_store.py）
             - 章节文件：chapters/chapter_001.txt，首行写 '第X章 标题'，空行后正文
         Returns:
             bool: 保存成功返回True，失败返回False
@@ -699,12 +757,10 @@ class NovelService:
                 config.remove_section("CHAPTER_CLIMAXES")
             if "CHAPTER_HOOKS" in config:
                 config.remove_section("CHAPTER_HOOKS")
-            if "CHAPTER_GLOBAL_SUMMARIES" in config:
-                config.remove_section("CHAPTER_GLOBAL_SUMMARIES")
-            if "CHAPTER_CHAR_STATUSES" in config:
-                config.remove_section("CHAPTER_CHAR_STATUSES")
-            if "CHAPTER_CHAR_RELATIONS" in config:
-                config.remove_section("CHAPTER_CHAR_RELATIONS")
+            if "CHAPTER_SUMMARY_BASIS" in config:
+                config.remove_section("CHAPTER_SUMMARY_BASIS")
+            if "CHAPTER_CHAIN_BASIS" in config:
+                config.remove_section("CHAPTER_CHAIN_BASIS")
             
             config.add_section("CHAPTERS")
             config.add_section("CHAPTER_TITLES")
@@ -712,9 +768,8 @@ class NovelService:
             config.add_section("CHAPTER_SUMMARIES")
             config.add_section("CHAPTER_CLIMAXES")
             config.add_section("CHAPTER_HOOKS")
-            config.add_section("CHAPTER_GLOBAL_SUMMARIES")
-            config.add_section("CHAPTER_CHAR_STATUSES")
-            config.add_section("CHAPTER_CHAR_RELATIONS")
+            config.add_section("CHAPTER_SUMMARY_BASIS")
+            config.add_section("CHAPTER_CHAIN_BASIS")
             
             # 保存每个章节
             for idx, chapter in enumerate(self.app.chapter_list):
@@ -743,16 +798,22 @@ class NovelService:
                 
                 # 新增字段容错
                 try:
-                    config.set("CHAPTER_GLOBAL_SUMMARIES", str(idx), str(chapter.get("global_summary", "")))
-                    config.set("CHAPTER_CHAR_STATUSES", str(idx), str(chapter.get("char_status", "")))
-                    config.set("CHAPTER_CHAR_RELATIONS", str(idx), str(chapter.get("char_relations", "")))
+                    # 摘要链依据哈希（用于过期检测）
+                    config.set("CHAPTER_SUMMARY_BASIS", str(idx), str(chapter.get("summary_basis", "")))
+                    config.set("CHAPTER_CHAIN_BASIS", str(idx), str(chapter.get("chain_basis", "")))
                 except Exception:
                     pass
             
+            # 全局摘要/人物动态/人物关系按“检查点 + 差异”保存，避免逐章完整快照
+            chain_store.write_chain(config, self.app.chapter_list)
+            
             # 写入配置文件
             with open(novel_ini_path, "w", encoding="utf-8") as f:
                 config.write(f)
             
+            # 刷新快照，供下次打开时一次性读取
+            SnapshotService(self.app).save_snapshot_in_background()
+            
             print(f"[信息] 已保存 {len(self.app.chapter_list)} 个章节到 {self.app.current_novel_dir}")
             return True
         except Exception as e:
@@ -760,6 +821,183 @@ class NovelService:
             traceback.print_exc()
             return False
 
+    def _migrate_chain_storage(self, novel_ini_path):
+        """
+        将旧版 novel.ini 中逐章保存的完整摘要链改写为“检查点 + 差异”格式
+        迁移前备份为 novel.ini.bak，失败时保留原文件不变
+        Returns:
+            bool: 迁移成功返回True
+        """
+        try:
+            backup_path = novel_ini_path + ".bak"
+            if not os.path.exists(backup_path):
+                shutil.copy2(novel_ini_path, backup_path)
+            old_size = os.path.getsize(novel_ini_path)
+            if not self._persist_chapters_to_novel():
+                return False
+            new_size = os.path.getsize(novel_ini_path)
+            print(f"[信息] 已将摘要链迁移为差异存储：novel.ini {old_size // 1024}KB -> {new_size // 1024}KB（原文件备份为 {os.path.basename(backup_path)}）")
+            return True
+        except Exception as e:
+            print(f"[警告] 摘要链存储迁移失败，保持旧格式: {e}")
+            traceback.print_exc()
+            return False
+
+    def offer_journal_recovery(self):
+        """
+        读取恢复日志，若存在尚未保存的 AI 结果或编辑器快照，提示用户恢复
+        无论恢复与否，处理完毕后都会清空日志
+        """
+        try:
+            if not hasattr(self.app, "journal_service"):
+                return
+            journal = self.app.journal_service
+            pending = journal.pending_entries()
+            
+            # 过滤掉与已保存内容一致或章节已不存在的记录
+            recoverable = {}
+            for idx, record in pending.items():
+                if not isinstance(idx, int) or not (0 <= idx < len(self.app.chapter_list)):
+                    continue
+                if record.get("content", "") == self.app.chapter_list[idx].get("content", ""):
+                    continue
+                recoverable[idx] = record
+            
+            if not recoverable:
+                journal.truncate()
+                return
+            
+            task_labels = {"generate": "AI生成", "continue": "AI续写", "modify": "AI修改"}
+            lines = []
+            for idx in sorted(recoverable):
+                record = recoverable[idx]
+                stamp = datetime.fromtimestamp(record.get("time", 0)).strftime("%m-%d %H:%M")
+                kind = task_labels.get(record.get("task", ""), "AI结果") if record.get("type") == "ai" else "编辑器内容"
+                lines.append(f"- 第{idx+1}章 {record.get('title', '')}：{kind}（{stamp}，{len(record.get('content', ''))}字）")
+            
+            should_recover = messagebox.askyesno(
+                "恢复未保存内容",
+                "检测到上次异常退出前有未保存的内容：\n\n" + "\n".join(lines) +
+                "\n\n点击'是'恢复并保存这些内容（原内容会记录到历史版本）\n点击'否'放弃"
+            )
+            if should_recover:
+                for idx, record in recoverable.items():
+                    if hasattr(self.app, "version_service"):
+                        self.app.version_service.record_version(idx, self.app.chapter_list[idx].get("content", ""), source="before_restore")
+                        self.app.version_service.record_version(idx, record["content"], source="restore")
+                    self.app.chapter_list[idx]["content"] = record["content"]
+                if self._persist_chapters_to_novel():
+                    messagebox.showinfo("成功", f"✅ 已恢复 {len(recoverable)} 个章节的未保存内容")
+                else:
+                    messagebox.showerror("错误", "恢复内容保存失败，恢复日志已保留。")
+                    return
+            journal.truncate()
+        except Exception as e:
+            print(f"[错误] 恢复未保存内容失败: {e}")
+            traceback.print_exc()
+
+    def show_version_history(self):
+        """
+        显示当前章节的版本历史，支持查看差异与恢复
+        """
+        try:
+            cur_idx = self.app.current_chapter_index
+            if cur_idx is None or cur_idx < 0 or cur_idx >= len(self.app.chapter_list):
+                messagebox.showwarning("提示", "请先选择或加载一个有效章节。")
+                return
+            if not hasattr(self.app, "version_service"):
+                return
+            
+            version_service = self.app.version_service
+            versions = version_service.list_versions(cur_idx)
+            if not versions:
+                messagebox.showinfo("提示", "当前章节暂无历史版本。\n\n保存章节或使用 AI 改写后会自动记录版本。")
+                return
+            
+            source_labels = {
+                "save": "保存",
+                "before_ai": "AI改写前",
+                "ai": "AI结果",
+                "before_restore": "恢复前",
+                "restore": "恢复",
+            }
+            
+            dialog = tk.Toplevel(self.app.root)
+            dialog.title(f"第{cur_idx+1}章 历史版本")
+            dialog.transient(self.app.root)
+            dialog.grab_set()
+            self.app.ui_helper.center_window(dialog, 900, 600)
+            
+            left = tk.Frame(dialog, padx=10, pady=10)
+            left.pack(side=tk.LEFT, fill=tk.Y)
+            tk.Label(left, text="版本列表（新→旧）：", font=("Microsoft YaHei", 10, "bold")).pack(anchor=tk.W)
+            version_listbox = tk.Listbox(left, width=36, font=("Microsoft YaHei", 10), exportselection=False)
+            version_listbox.pack(fill=tk.Y, expand=True, pady=5)
+            
+            right = tk.Frame(dialog, padx=10, pady=10)
+            right.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            tk.Label(right, text="与上一版本的差异：", font=("Microsoft YaHei", 10, "bold")).pack(anchor=tk.W)
+            diff_text = tk.Text(right, font=("Microsoft YaHei", 10), wrap=tk.WORD)
+            diff_text.pack(fill=tk.BOTH, expand=True, pady=5)
+            diff_text.tag_config("add", foreground="#28a745")
+            diff_text.tag_config("del", foreground="#dc3545")
+            
+            ordered = list(reversed(versions))
+            for entry in ordered:
+                stamp = datetime.fromtimestamp(entry.get("time", 0)).strftime("%Y-%m-%d %H:%M:%S")
+                label = source_labels.get(entry.get("source", ""), entry.get("source", ""))
+                version_listbox.insert(tk.END, f"{stamp}  {label}  {entry.get('size', 0)}字")
+            
+            def on_select(event=None):
+                sel = version_listbox.curselection()
+                if not sel:
+                    return
+                pos = sel[0]
+                digest = ordered[pos]["hash"]
+                prev_digest = ordered[pos + 1]["hash"] if pos + 1 < len(ordered) else None
+                diff_text.config(state=tk.NORMAL)
+                diff_text.delete("1.0", tk.END)
+                for line in version_service.diff_versions(prev_digest, digest).split("\n"):
+                    tag = "add" if line.startswith("+") else ("del" if line.startswith("-") else "")
+                    diff_text.insert(tk.END, line + "\n", tag)
+                diff_text.config(state=tk.DISABLED)
+            
+            def on_restore():
+                sel = version_listbox.curselection()
+                if not sel:
+                    messagebox.showwarning("提示", "请先选择要恢复的版本！", parent=dialog)
+                    return
+                if not messagebox.askyesno("确认恢复", "确定将本章正文恢复为所选版本吗？\n\n当前正文会先记录为一个历史版本。", parent=dialog):
+                    return
+                # 以编辑器中的最新内容作为“恢复前”版本
+                if hasattr(self.app, "content_text"):
+                    self.app.chapter_list[cur_idx]["content"] = self.app.content_text.get("1.0", tk.END).strip()
+                text = version_service.restore_version(cur_idx, ordered[sel[0]]["hash"])
+                if text is None:
+                    messagebox.showerror("错误", "恢复版本失败！", parent=dialog)
+                    return
+                self._persist_chapters_to_novel()
+                if hasattr(self.app, "content_text"):
+                    self.app.content_text.delete("1.0", tk.END)
+                    self.app.content_text.insert("1.0", text)
+                self.app.original_chapter_content = text
+                if hasattr(self.app, "update_word_count"):
+                    self.app.update_word_count()
+                dialog.destroy()
+                messagebox.showinfo("成功", "✅ 已恢复所选版本")
+            
+            version_listbox.bind("<<ListboxSelect>>", on_select)
+            btns = tk.Frame(left)
+            btns.pack(fill=tk.X)
+            tk.Button(btns, text="↩️ 恢复此版本", command=on_restore, bg="#28a745", fg="white", cursor="hand2").pack(side=tk.LEFT)
+            tk.Button(btns, text="关闭", command=dialog.destroy, cursor="hand2").pack(side=tk.RIGHT)
+            
+            version_listbox.selection_set(0)
+            on_select()
+        except Exception as e:
+            traceback.print_exc()
+            messagebox.showerror("错误", f"打开历史版本失败: {str(e)}")
+
     def export_current_chapter(self):
         """
         导出当前选中的单章为txt文件
@@ -809,41 +1047,136 @@ class NovelService:
 
     def export_novel_text(self):
         """
-        导出全书为单个txt文件
+        导出全书：选择格式与章节范围后，在后台线程中流式导出
         """
         try:
             if not self.app.chapter_list:
                 messagebox.showwarning("提示", "目前没有任何章节内容可以导出。")
                 return
 
-            # 建议默认文件名
-            default_name = "我的精彩小说.txt"
-            if hasattr(self.app, "title_entry"):
-                title = self.app.title_entry.get().strip()
-                if title:
-                    default_name = f"{title}.txt"
+            from services.export_service import ExportService, EXPORT_WRITERS
 
-            file_path = filedialog.asksaveasfilename(
-                title="导出全文文本",
-                defaultextension=".txt",
-                initialfile=default_name,
+            book_title = self.app.title_entry.get().strip() if hasattr(self.app, "title_entry") else ""
+            total = len(self.app.chapter_list)
+
+            dialog = tk.Toplevel(self.app.root)
+            dialog.title("导出全文")
+            dialog.transient(self.app.root)
+            dialog.grab_set()
+            self.app.ui_helper.center_window(dialog, 420, 230)
+
+            frame = tk.Frame(dialog, padx=20, pady=15)
+            frame.pack(fill=tk.BOTH, expand=True)
+
+            tk.Label(frame, text="导出格式：", font=("Microsoft YaHei", 10)).grid(row=0, column=0, sticky=tk.W, pady=5)
+            format_names = {label: key for key, (_, label) in EXPORT_WRITERS.items()}
+            format_var = tk.StringVar(value=EXPORT_WRITERS["txt"][1])
+            ttk.Combobox(frame, textvariable=format_var, values=list(format_names.keys()), state="readonly", width=18).grid(row=0, column=1, columnspan=3, sticky=tk.W, pady=5)
+
+            tk.Label(frame, text="章节范围：", font=("Microsoft YaHei", 10)).grid(row=1, column=0, sticky=tk.W, pady=5)
+            start_var = tk.IntVar(value=1)
+            end_var = tk.IntVar(value=total)
+            tk.Spinbox(frame, from_=1, to=total, textvariable=start_var, width=6).grid(row=1, column=1, sticky=tk.W)
+            tk.Label(frame, text="至").grid(row=1, column=2, padx=5)
+            tk.Spinbox(frame, from_=1, to=total, textvariable=end_var, width=6).grid(row=1, column=3, sticky=tk.W)
+
+            skip_empty_var = tk.BooleanVar(value=False)
+            tk.Checkbutton(frame, text="跳过正文为空的章节", variable=skip_empty_var).grid(row=2, column=0, columnspan=4, sticky=tk.W, pady=5)
+
+            def on_confirm():
+                try:
+                    start, end = int(start_var.get()), int(end_var.get())
+                except (tk.TclError, ValueError):
+                    messagebox.showwarning("提示", "章节范围请输入数字！", parent=dialog)
+                    return
+                if not (1 <= start <= end <= total):
+                    messagebox.showwarning("提示", f"章节范围无效（1 ~ {total}）！", parent=dialog)
+                    return
+                fmt = format_names.get(format_var.get(), "txt")
+                writer_cls, label = EXPORT_WRITERS[fmt]
+
+                default_name = f"{book_title or '我的精彩小说'}{writer_cls.extension}"
+                file_path = filedialog.asksaveasfilename(
+                    title="导出全文",
+                    defaultextension=writer_cls.extension,
+                    initialfile=default_name,
+                    filetypes=[(label, f"*{writer_cls.extension}"), ("所有文件", "*.*")],
+                    parent=dialog
+                )
+                if not file_path:
+                    return
+                dialog.destroy()
+
+                chapter_filter = (lambda idx, ch: bool((ch.get("content", "") or "").strip())) if skip_empty_var.get() else None
+                ExportService(self.app).start_export(
+                    file_path,
+                    fmt=fmt,
+                    chapter_range=(start - 1, end - 1),
+                    chapter_filter=chapter_filter,
+                    book_title=book_title
+                )
+
+            btns = tk.Frame(dialog, padx=20, pady=10)
+            btns.pack(fill=tk.X, side=tk.BOTTOM)
+            tk.Button(btns, text="取消", command=dialog.destroy, cursor="hand2").pack(side=tk.RIGHT, padx=5)
+            tk.Button(btns, text="导出", command=on_confirm, bg="#28a745", fg="white", cursor="hand2").pack(side=tk.RIGHT, padx=5)
+
+        except Exception as e:
+            traceback.print_exc()
+            messagebox.showerror("错误", f"导出失败: {str(e)}")
+
+    def refresh_stale_summaries(self):
+        """
+        手动刷新所有过期章节的摘要链（后台按章节顺序重算）
+        """
+        try:
+            service = self.app.staleness_service
+            if service.is_refreshing():
+                messagebox.showinfo("提示", "过期摘要正在后台刷新中。")
+                return
+            stale = service.compute_stale()
+            if not stale:
+                messagebox.showinfo("提示", "所有已定稿章节的摘要链均为最新。")
+                return
+            first = min(stale)
+            if not messagebox.askyesno(
+                "刷新过期摘要",
+                f"共有 {len(stale)} 个章节的摘要链已过期（自第{first+1}章起）。\n\n"
+                "将在后台按顺序重算，若某章重算结果与原来相同会提前停止。是否开始？"
+            ):
+                return
+
+            def on_done(count, error):
+                if error:
+                    messagebox.showerror("刷新过期摘要", f"已更新 {count} 章后停止：\n{error}")
+                else:
+                    messagebox.showinfo("刷新过期摘要", f"✅ 刷新完成，共更新 {count} 章。")
+
+            service.refresh_stale(on_done=on_done)
+        except Exception as e:
+            traceback.print_exc()
+            messagebox.showerror("错误", f"刷新过期摘要失败: {str(e)}")
+
+    def import_novel_text(self):
+        """
+        导入整本 TXT 小说：按“第X章”标题自动切分后追加到当前小说
+        """
+        try:
+            if not getattr(self.app, "current_novel_dir", ""):
+                messagebox.showwarning("提示", "请先新建或打开一部小说，再导入 TXT。")
+                return
+            file_path = filedialog.askopenfilename(
+                title="导入 TXT 小说",
                 filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")]
             )
-
             if not file_path:
                 return
 
-            # 调用持久化服务的导出方法
-            from services.persistence_service import PersistenceService
-            ps = PersistenceService(self.app)
-            if ps.export_to_single_text(file_path, self.app.chapter_list):
-                messagebox.showinfo("成功", f"✅ 小说全文已成功导出至：\n{file_path}")
-            else:
-                messagebox.showerror("错误", "导出过程中发生错误，请检查磁盘空间或权限。")
-
+            from services.import_service import ImportService
+            ImportService(self.app).start_import(file_path)
         except Exception as e:
             traceback.print_exc()
-            messagebox.showerror("错误", f"导出失败: {str(e)}")
+            messagebox.showerror("错误", f"导入失败: {str(e)}")
 
     def save_novel(self):
         """保存小说内容"""
@@ -1069,6 +1402,7 @@ class NovelService:
 
             with open(novel_ini, "w", encoding="utf-8") as f:
                 cfg.write(f)
+            SnapshotService(self.app).save_snapshot_in_background(target_dir)
 
             messagebox.showinfo("成功", f"✅ 已保存小说配置到：\n{novel_ini}")
         except Exception as e:
@@ -1076,56 +1410,8 @@ class NovelService:
             messagebox.showerror("错误", f"保存配置失败: {str(e)}")
 
     def export_novel_to_txt(self):
-        """导出小说到TXT文件（包含标题和所有章节）"""
-        try:
-            # 检查是否有小说标题
-            novel_title = self.app.title_entry.get().strip() if hasattr(self.app, "title_entry") else ""
-            if not novel_title:
-                messagebox.showwarning("提示", "请先输入小说标题！")
-                return
-            
-            # 检查是否有章节内容
-            if not self.app.chapter_list:
-                messagebox.showwarning("提示", "没有章节可导出！")
-                return
-            
-            # 让用户选择保存位置
-            file_path = filedialog.asksaveasfilename(
-                title="导出小说",
-                defaultextension=".txt",
-                filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")],
-                initialfile=f"{novel_title}.txt"
-            )
-            
-            if not file_path:
-                return
-            
-            # 生成导出内容
-            with open(file_path, "w", encoding="utf-8") as f:
-                # 写入标题
-                f.write(f"《{novel_title}》\n\n")
-                
-                # 写入每个章节
-                for idx, chapter in enumerate(self.app.chapter_list, start=1):
-                    title = chapter.get("title", "")
-                    content = chapter.get("content", "")
-                    
-                    # 格式化章节标题
-                    chapter_header = PromptBuilder._format_chapter_display(idx, title)
-                    
-                    # 写入章节标题和内容
-                    f.write(f"{chapter_header}\n\n")
-                    if content:
-                        f.write(f"{content}\n\n")
-                    
-                    # 章节之间添加分隔符（除了最后一章）
-                    if idx < len(self.app.chapter_list):
-                        f.write("\n")
-            
-            messagebox.showinfo("成功", f"✅ 小说已导出到：\n{file_path}")
-        except Exception as e:
-            traceback.print_exc()
-            messagebox.showerror("错误", f"导出失败: {str(e)}")
+        """导出小说到TXT文件（与“导出全文”共用同一条流式导出管线）"""
+        self.export_novel_text()
 
     def load_novel_config(self, file_path=None):
         """读取 novel.ini 并填充界面，文件选择器仅限 *.ini"""
@@ -1142,8 +1428,13 @@ class NovelService:
             save_config_value = ConfigManager.save_config_value
             save_config_value("APP", "last_novel", file_path)
 
+            # 优先使用快照（一次顺序读取），校验失败时回退到 novel.ini 与章节文件
+            snapshot = SnapshotService(self.app).load_snapshot(file_path)
             cfg = configparser.ConfigParser(interpolation=None)
-            cfg.read(file_path, encoding="utf-8")
+            if snapshot:
+                cfg.read_dict(snapshot["sections"])
+            else:
+                cfg.read(file_path, encoding="utf-8")
             basic = cfg["BASIC"] if "BASIC" in cfg else {}
 
             # 更新当前目录
@@ -1221,6 +1512,10 @@ class NovelService:
                 if "CHARACTERS_SELECTED" in cfg:
                     for name, val in cfg["CHARACTERS_SELECTED"].items():
                         self.app.character_setting_checked[name] = str(val).lower() == "true"
+                # 旧版档案中累加的经历日志迁移到人物经历存储
+                if hasattr(self.app, "character_event_service") and self.app.character_event_service.migrate_profile_logs():
+                    from services.persistence_service import PersistenceService
+                    PersistenceService(self.app).save_novel_settings()
                 # 刷新复选界面（若存在）
                 if hasattr(self.app, "novel_setting_checks"):
                     self.app.novel_setting_checks.rebuild(self.app.novel_setting_details, self.app.novel_setting_checked)
@@ -1238,9 +1533,7 @@ class NovelService:
             messagebox.showerror("错误", f"读取配置失败: {str(e)}")
         else:
             try:
-                # 加载章节列表（若存在）
-                cfg = configparser.ConfigParser(interpolation=None)
-                cfg.read(file_path, encoding="utf-8")
+                # 加载章节列表（若存在），复用上面已读取的配置
                 novel_dir = os.path.dirname(file_path)
                 # 清空内存与列表UI
                 self.app.chapter_list.clear()
@@ -1264,6 +1557,8 @@ class NovelService:
                         indices = sorted((int(k) for k in cfg["CHAPTER_TITLES"].keys()), key=int)
                     except Exception:
                         indices = []
+                # 摘要链按章节顺序一次性重建（兼容旧版逐章完整文本）
+                chains = chain_store.read_chain(cfg, indices)
                 # 逐章加载
                 for idx in indices:
                     title = ""
@@ -1280,34 +1575,24 @@ class NovelService:
                         summary = cfg["CHAPTER_SUMMARIES"].get(str(idx), "") or ""
                     content = ""
                     try:
-                        path = os.path.join(chapters_dir, fname)
-                        if os.path.exists(path):
-                            with open(path, "r", encoding="utf-8") as cf:
-                                text = cf.read()
-                            # 去掉可能的首行“第X章 标题”
-                            lines = text.splitlines()
-                            if lines:
-                                # 若第一行以“第...章”开头，则去掉首行空行处理正文
-                                first = lines[0].strip()
-                                if first.startswith("第") and "章" in first:
-                                    # 跳过首行和紧随其后的空行
-                                    body_start = 1
-                                    if len(lines) > 1 and lines[1].strip() == "":
-                                        body_start = 2
-                                    content = "\n".join(lines[body_start:])
-                                else:
-                                    content = text
-                            else:
-                                content = ""
-                            content = content.strip()
+                        if snapshot and fname in snapshot["chapters"]:
+                            content = snapshot["chapters"][fname]
+                        else:
+                            path = os.path.join(chapters_dir, fname)
+                            if os.path.exists(path):
+                                with open(path, "r", encoding="utf-8") as cf:
+                                    # 去掉可能的首行“第X章 标题”
+                                    content = SnapshotService.extract_chapter_body(cf.read())
                     except Exception:
                         content = ""
                     
                     climax = cfg["CHAPTER_CLIMAXES"].get(str(idx), "") if "CHAPTER_CLIMAXES" in cfg else ""
                     hook = cfg["CHAPTER_HOOKS"].get(str(idx), "") if "CHAPTER_HOOKS" in cfg else ""
-                    global_summary = cfg["CHAPTER_GLOBAL_SUMMARIES"].get(str(idx), "") if "CHAPTER_GLOBAL_SUMMARIES" in cfg else ""
-                    char_status = cfg["CHAPTER_CHAR_STATUSES"].get(str(idx), "") if "CHAPTER_CHAR_STATUSES" in cfg else ""
-                    char_relations = cfg["CHAPTER_CHAR_RELATIONS"].get(str(idx), "") if "CHAPTER_CHAR_RELATIONS" in cfg else ""
+                    global_summary = chains[idx]["global_summary"]
+                    char_status = chains[idx]["char_status"]
+                    char_relations = chains[idx]["char_relations"]
+                    summary_basis = cfg["CHAPTER_SUMMARY_BASIS"].get(str(idx), "") if "CHAPTER_SUMMARY_BASIS" in cfg else ""
+                    chain_basis = cfg["CHAPTER_CHAIN_BASIS"].get(str(idx), "") if "CHAPTER_CHAIN_BASIS" in cfg else ""
                     
                     self.app.chapter_list.append({
                         "title": PromptBuilder._strip_chapter_prefix(title), 
@@ -1318,13 +1603,42 @@ class NovelService:
                         "hook": hook,
                         "global_summary": global_summary,
                         "char_status": char_status,
-                        "char_relations": char_relations
+                        "char_relations": char_relations,
+                        "summary_basis": summary_basis,
+                        "chain_basis": chain_basis
                     })
+                # 旧版本数据没有依据哈希，视为最新
+                if hasattr(self.app, "staleness_service"):
+                    self.app.staleness_service.ensure_basis()
+                # 旧版逐章完整快照迁移为“检查点 + 差异”格式
+                if chain_store.needs_migration(cfg):
+                    self._migrate_chain_storage(file_path)
                 # 刷新UI
                 if hasattr(self.app, "refresh_chapter_listbox"):
                     self.app.refresh_chapter_listbox()
                 # 刷新章节总结显示
                 if hasattr(self.app, "refresh_chapter_summaries"):
                     self.app.refresh_chapter_summaries()
+                # 后台按保留策略压缩版本库
+                if hasattr(self.app, "version_service"):
+                    self.app.version_service.start_background_compaction()
+                # 后台归纳较早的人物经历
+                if hasattr(self.app, "character_event_service"):
+                    self.app.character_event_service.start_compaction()
+                # 后台为设定条目生成提示词卡片
+                if hasattr(self.app, "prompt_card_service"):
+                    self.app.prompt_card_service.start_refresh()
+                # 旧版小说的人物关系文本迁入关系图
+                if hasattr(self.app, "relation_graph_service"):
+                    self.app.relation_graph_service.migrate_legacy()
+                # 后台补齐人物/设定提及索引
+                if hasattr(self.app, "mention_index_service"):
+                    self.app.mention_index_service.start_refresh()
+                # 后台更新伏笔台账
+                if hasattr(self.app, "hook_ledger_service"):
+                    self.app.hook_ledger_service.start_refresh()
+                # 检查上次异常退出前是否有未保存的内容
+                if hasattr(self.app, "offer_journal_recovery"):
+                    self.app.offer_journal_recovery()
             except Exception:
                 traceback.print_exc()
@@ -7,6 +7,8 @@
 import os
 import configparser
 import traceback
+from services.snapshot_service import SnapshotService
+from services import chain_store
 
 
 class PersistenceService:
@@ -60,10 +62,6 @@ class PersistenceService:
                 config.remove_section("CHAPTER_HOOKS")
             if "CHAPTER_SCENES" in config:
                 config.remove_section("CHAPTER_SCENES")
-            if "CHAPTER_CHAR_STATUSES" in config:
-                config.remove_section("CHAPTER_CHAR_STATUSES")
-            if "CHAPTER_CHAR_RELATIONS" in config:
-                config.remove_section("CHAPTER_CHAR_RELATIONS")
             if "CHAPTER_NUMS" in config:
                 config.remove_section("CHAPTER_NUMS")
             
@@ -73,8 +71,6 @@ class PersistenceService:
             config.add_section("CHAPTER_CLIMAXES")
             config.add_section("CHAPTER_HOOKS")
             config.add_section("CHAPTER_SCENES")
-            config.add_section("CHAPTER_CHAR_STATUSES")
-            config.add_section("CHAPTER_CHAR_RELATIONS")
             config.add_section("CHAPTER_NUMS")
             
             # 保存每个章节
@@ -103,14 +99,15 @@ class PersistenceService:
                 config.set("CHAPTER_CLIMAXES", str(idx), climax)
                 config.set("CHAPTER_HOOKS", str(idx), hook)
                 config.set("CHAPTER_SCENES", str(idx), scenes.replace("\n", "[\\n]")) # 转义换行
-                config.set("CHAPTER_GLOBAL_SUMMARIES", str(idx), str(chapter.get("global_summary", "")))
-                config.set("CHAPTER_CHAR_STATUSES", str(idx), str(chapter.get("char_status", "")))
-                config.set("CHAPTER_CHAR_RELATIONS", str(idx), str(chapter.get("char_relations", "")))
                 config.set("CHAPTER_NUMS", str(idx), num)
             
+            # 摘要链按“检查点 + 差异”保存
+            chain_store.write_chain(config, self.app.chapter_list)
+            
             # 写入配置文件
             with open(novel_ini_path, "w", encoding="utf-8") as f:
                 config.write(f)
+            SnapshotService(self.app).save_snapshot_in_background()
             
             print(f"[信息] 已保存 {len(self.app.chapter_list)} 个章节到 {self.app.current_novel_dir}")
             return True
@@ -153,6 +150,7 @@ class PersistenceService:
                     indices = []
             
             # 加载章节数据
+            chains = chain_store.read_chain(config, indices)
             chapter_list = []
             for idx in indices:
                 title = ""
@@ -173,9 +171,9 @@ class PersistenceService:
                 scenes_raw = config.get("CHAPTER_SCENES", str(idx), fallback="")
                 scenes = scenes_raw.replace("[\\n]", "\n")
                 num = config.get("CHAPTER_NUMS", str(idx), fallback=str(int(idx)+1))
-                global_summary = config.get("CHAPTER_GLOBAL_SUMMARIES", str(idx), fallback="")
-                char_status = config.get("CHAPTER_CHAR_STATUSES", str(idx), fallback="")
-                char_relations = config.get("CHAPTER_CHAR_RELATIONS", str(idx), fallback="")
+                global_summary = chains[idx]["global_summary"]
+                char_status = chains[idx]["char_status"]
+                char_relations = chains[idx]["char_relations"]
 
                 # 读取内容
                 content = ""
@@ -220,28 +218,11 @@ class PersistenceService:
     
     def export_to_single_text(self, export_path, chapter_list):
         """
-        根据章节列表导出完整的长文本文件
+        根据章节列表导出完整的长文本文件（同步执行，逐章流式写入）
         """
         try:
-            with open(export_path, "w", encoding="utf-8", newline='') as f:
-                for idx, chapter in enumerate(chapter_list):
-                    title = chapter.get("title", f"第{idx+1}章")
-                    content = chapter.get("content", "").strip()
-                    
-                    # 写入章节标题头
-                    f.write(f"第{idx+1}章 {title}\r\n")
-                    f.write("-" * 30 + "\r\n")
-                    
-                    if content:
-                        # 确保内容中的换行符为 \r\n
-                        normalized_content = content.replace("\r\n", "\n").replace("\n", "\r\n")
-                        f.write(normalized_content)
-                    else:
-                        f.write("（本章正文内容为空）")
-                    
-                    # 章节间格
-                    f.write("\r\n\r\n\r\n")
-                    
+            from services.export_service import export_chapters, iter_chapters, TxtWriter
+            export_chapters(export_path, iter_chapters(chapter_list), TxtWriter())
             return True
         except Exception as e:
             print(f"[错误] 导出全文文本失败: {e}")
@@ -292,6 +273,7 @@ class PersistenceService:
             # 写入文件
             with open(novel_ini, "w", encoding="utf-8") as f:
                 config.write(f)
+            SnapshotService(self.app).save_snapshot_in_background(target_dir)
             
             print(f"[信息] 已保存小说配置到: {novel_ini}")
             return True
@@ -353,6 +335,7 @@ class PersistenceService:
             # 写入文件
             with open(novel_ini, "w", encoding="utf-8") as f:
                 config.write(f)
+            SnapshotService(self.app).save_snapshot_in_background()
             
             print(f"[信息] 已保存小说设定到: {novel_ini}")
             return True
@@ -0,0 +1,244 @@
+"""
+提示词卡片服务
+小说设定与人物设定往往包含写给作者自己看的长篇设计笔记，原样放进提示词既浪费 Token 又稀释重点。
+本服务为每个设定条目生成一张精简的“提示词卡片”，以条目原文的哈希为键缓存，
+原文不变时一直复用，原文修改后自动失效并在后台重新生成。
+
+缓存文件：<小说目录>/prompt_cards.json
+    {哈希: {"kind": 类别, "name": 条目名, "card": 卡片文本, "source_tokens": 原文Token, "card_tokens": 卡片Token}}
+卡片尚未生成时使用原文，组织提示词不会因此等待 AI。
+"""
+
+import os
+import json
+import hashlib
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from AI.prompt_builder import PromptBuilder
+from AI.rate_limiter import RateLimiter
+
+
+PROMPT_CARDS_FILENAME = "prompt_cards.json"
+# 原文短于该字数的条目直接使用原文
+CARD_MIN_CHARS = 200
+# 卡片字数上限
+CARD_MAX_CHARS = 200
+# 后台生成的限流参数
+CARD_CONCURRENCY = 2
+CARD_REQUESTS_PER_MINUTE = 20
+CARD_SYSTEM_PROMPT = "你是一位资深小说编辑，负责将设定资料提炼为供写作模型参考的精简卡片。"
+
+KIND_LABELS = {
+    "setting": "小说设定",
+    "character": "人物设定",
+}
+
+
+class PromptCardService:
+    """提示词卡片服务类"""
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._lock = threading.Lock()
+        self._cards = {}
+        self._loaded_dir = None
+        self._refresh_thread = None
+        # 本次运行中生成失败的条目，不再反复重试
+        self._failed = set()
+        # 本次运行累计节省的 Token 数
+        self.saved_tokens = 0
+
+    def _cards_path(self):
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        return os.path.join(novel_dir, PROMPT_CARDS_FILENAME) if novel_dir else ""
+
+    @staticmethod
+    def make_key(kind, name, text):
+        raw = json.dumps([kind, name, text], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _ensure_loaded(self):
+        """切换小说后重新加载卡片文件（调用方需持有锁）"""
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if novel_dir == self._loaded_dir:
+            return
+        self._cards = {}
+        self._loaded_dir = novel_dir
+        path = self._cards_path()
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._cards = json.load(f)
+        except Exception as e:
+            print(f"[警告] 读取提示词卡片失败，将重新生成: {e}")
+            self._cards = {}
+
+    def _save(self, live_keys=None):
+        """写回卡片文件，只保留仍在使用的条目（调用方需持有锁）"""
+        path = self._cards_path()
+        if not path:
+            return
+        if live_keys is not None:
+            self._cards = {key: card for key, card in self._cards.items() if key in live_keys}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._cards, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    # ==================== 使用卡片 ====================
+
+    def apply(self, kind, entries):
+        """
+        将 {条目名: 原文} 替换为卡片
+        Returns:
+            (替换后的字典, 是否有条目缺少卡片)
+        """
+        result = {}
+        missing = False
+        with self._lock:
+            self._ensure_loaded()
+            for name, text in entries.items():
+                text = text or ""
+                if len(text.strip()) < CARD_MIN_CHARS:
+                    result[name] = text
+                    continue
+                card = self._cards.get(self.make_key(kind, name, text))
+                if card:
+                    result[name] = card["card"]
+                else:
+                    result[name] = text
+                    missing = True
+        return result, missing
+
+    def apply_settings(self, novel_selected, char_selected):
+        """
+        为提示词组织设定卡片，统计并打印节省的 Token；缺少卡片时在后台补齐
+        Returns:
+            (小说设定, 人物设定)
+        """
+        novel_cards, novel_missing = self.apply("setting", novel_selected)
+        char_cards, char_missing = self.apply("character", char_selected)
+        before = sum(PromptBuilder.estimate_tokens(v) for v in list(novel_selected.values()) + list(char_selected.values()))
+        after = sum(PromptBuilder.estimate_tokens(v) for v in list(novel_cards.values()) + list(char_cards.values()))
+        if before > after:
+            self.saved_tokens += before - after
+            print(f"[信息] 设定卡片：约 {before} → {after} Tokens，本次节省 {before - after}，累计节省 {self.saved_tokens}")
+        if novel_missing or char_missing:
+            self.start_refresh()
+        return novel_cards, char_cards
+
+    def report(self, entries=None):
+        """
+        卡片覆盖情况与整体节省
+        Args:
+            entries: 条目快照 [(类别, 条目名, 原文), ...]，默认读取当前设定（仅限界面线程）
+        Returns:
+            {"entries": 需卡片条目数, "ready": 已生成数, "source_tokens": 原文总Token, "card_tokens": 卡片总Token}
+        """
+        stats = {"entries": 0, "ready": 0, "source_tokens": 0, "card_tokens": 0}
+        if entries is None:
+            entries = self._all_entries()
+        with self._lock:
+            self._ensure_loaded()
+            for kind, name, text in entries:
+                stats["entries"] += 1
+                card = self._cards.get(self.make_key(kind, name, text))
+                if card:
+                    stats["ready"] += 1
+                    stats["source_tokens"] += card["source_tokens"]
+                    stats["card_tokens"] += card["card_tokens"]
+        return stats
+
+    # ==================== 后台生成 ====================
+
+    def _all_entries(self):
+        """需要卡片的全部条目快照 [(类别, 条目名, 原文), ...]（界面线程调用，设定字典只在界面线程修改）"""
+        entries = []
+        for kind, details in (("setting", getattr(self.app, "novel_setting_details", {})),
+                              ("character", getattr(self.app, "character_setting_details", {}))):
+            for name, text in list((details or {}).items()):
+                if len((text or "").strip()) >= CARD_MIN_CHARS:
+                    entries.append((kind, name, text))
+        return entries
+
+    def is_refreshing(self):
+        return bool(self._refresh_thread and self._refresh_thread.is_alive())
+
+    def start_refresh(self):
+        """
+        在后台为缺少卡片的条目生成卡片（已在运行时忽略）
+        从后台线程调用时转交界面线程，以便在界面线程上读取设定字典的快照
+        Returns:
+            是否启动了生成任务
+        """
+        if threading.current_thread() is not threading.main_thread():
+            self.app.root.after(0, self.start_refresh)
+            return False
+        if self.is_refreshing():
+            return False
+        entries = self._all_entries()
+        with self._lock:
+            self._ensure_loaded()
+            live_keys = set()
+            jobs = []
+            for kind, name, text in entries:
+                key = self.make_key(kind, name, text)
+                live_keys.add(key)
+                if key not in self._cards and key not in self._failed:
+                    jobs.append((key, kind, name, text))
+            if len(live_keys) < len(self._cards):
+                # 原文已修改或已删除的条目，其旧卡片不再需要
+                self._save(live_keys)
+            novel_dir = self._loaded_dir
+        if not jobs:
+            return False
+
+        if hasattr(self.app, "generation_service"):
+            self.app.generation_service._update_ai_config()
+        limiter = RateLimiter(CARD_REQUESTS_PER_MINUTE, CARD_CONCURRENCY)
+
+        def make_card(key, kind, name, text):
+            prompt = PromptBuilder.build_prompt_card_prompt(KIND_LABELS[kind], name, text, CARD_MAX_CHARS)
+            with self.app.ai_client.task("prompt_card"):
+                card = limiter.call(self.app.ai_client, CARD_SYSTEM_PROMPT, prompt, 0.3, 600)
+            if card.startswith("❌"):
+                print(f"[警告] 生成“{name}”的提示词卡片失败: {card[:60]}")
+                self._failed.add(key)
+                return False
+            card = card.strip()
+            with self._lock:
+                if self._loaded_dir != novel_dir:
+                    return False
+                self._cards[key] = {
+                    "kind": kind,
+                    "name": name,
+                    "card": card,
+                    "source_tokens": PromptBuilder.estimate_tokens(text),
+                    "card_tokens": PromptBuilder.estimate_tokens(card),
+                }
+                self._save()
+            return True
+
+        def refresh_thread():
+            results = []
+            try:
+                with ThreadPoolExecutor(max_workers=limiter.max_concurrency) as pool:
+                    results = list(pool.map(lambda job: make_card(*job), jobs))
+            except Exception as e:
+                print(f"[警告] 提示词卡片生成任务异常: {e}")
+                traceback.print_exc()
+            stats = self.report(entries)
+            print(f"[信息] 提示词卡片生成结束：新增 {sum(1 for ok in results if ok)} 张，"
+                  f"已覆盖 {stats['ready']}/{stats['entries']} 个条目，"
+                  f"约 {stats['source_tokens']} → {stats['card_tokens']} Tokens")
+
+        self._refresh_thread = threading.Thread(target=refresh_thread, daemon=True)
+        self._refresh_thread.start()
+        return True
@@ -0,0 +1,336 @@
+"""
+人物关系图服务
+人物关系以图的形式保存：边为两名角色之间的关系（类型 + 简述），并记录每次变化发生的章节。
+定稿时 AI 只输出本章的关系变动（增量），不再每章重写整张关系网；
+组织提示词时只查询与本章出场人物相关的边。
+
+AI 输出格式（每行一条，放在 <RELATIONS> 标签内）：
+    @角色A|角色B#关系类型#简述        如：@杨帆|李媛媛#恋人#补习中互生情愫
+    关系类型为“解除”表示两人关系不再值得记录
+
+存储文件：<小说目录>/relation_graph.jsonl，只追加，每行一条：
+    {"chapter": 章节序号, "deltas": [{"a", "b", "type", "note"}, ...]}
+同一章节以最后写入的记录为准，重新定稿某章会替换该章的变动。
+
+旧版小说每章保存整张关系网文本（char_relations），无法解析为边。打开小说时把关系图首条记录之前
+最近一章的关系文本一次性迁入为“基线”：
+    {"chapter": 章节序号, "baseline": 关系文本}
+组织提示词时，基线中提到本章出场人物的行与关系图中的边一并列出。
+"""
+
+import os
+import re
+import json
+import bisect
+import threading
+import traceback
+from services.name_matcher import get_matcher
+
+
+RELATION_GRAPH_FILENAME = "relation_graph.jsonl"
+# 关系类型为以下值时视为关系解除
+REMOVED_TYPES = ("解除", "无", "无关")
+# 提示词中最多列出的关系数
+MAX_PROMPT_EDGES = 30
+
+_DELTA_PATTERN = re.compile(r"^\s*[@＠]?\s*([^|｜#＃@＠]+?)\s*[|｜]\s*([^|｜#＃]+?)\s*[#＃]\s*([^#＃]+?)\s*(?:[#＃]\s*(.*?))?\s*$")
+
+
+def parse_relation_deltas(text):
+    """
+    解析 AI 输出的关系变动
+    Returns:
+        [{"a": 角色A, "b": 角色B, "type": 关系类型, "note": 简述}, ...]
+    """
+    body = re.sub(r"</?RELATIONS>", "", text or "", flags=re.IGNORECASE)
+    deltas = []
+    for line in body.splitlines():
+        line = line.strip().lstrip("-*").strip()
+        match = _DELTA_PATTERN.match(line)
+        if not match:
+            continue
+        a, b, rel_type, note = (g.strip() if g else "" for g in match.groups())
+        if a and b and a != b and rel_type:
+            deltas.append({"a": a, "b": b, "type": rel_type, "note": note})
+    return deltas
+
+
+class RelationGraphService:
+    """人物关系图服务类"""
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._lock = threading.RLock()
+        # {章节序号: [变动, ...]}
+        self._chapters = {}
+        # {(角色A, 角色B): [发生变动的章节序号（升序）]}，以及 {角色: {关系对, ...}}
+        self._pair_chapters = {}
+        self._adjacency = {}
+        # 旧版关系文本基线 (章节序号, 文本)
+        self._baseline = None
+        self._loaded_dir = None
+
+    def _graph_path(self):
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        return os.path.join(novel_dir, RELATION_GRAPH_FILENAME) if novel_dir else ""
+
+    @staticmethod
+    def _pair(a, b):
+        return (a, b) if a <= b else (b, a)
+
+    def _canonical(self, name):
+        """将 AI 输出的人名解析为档案中的角色名，未登记的次要角色保留原名"""
+        details = getattr(self.app, "character_setting_details", None)
+        if details:
+            return get_matcher(details).resolve(name) or name
+        return name
+
+    # ==================== 加载与写入 ====================
+
+    def _ensure_loaded(self):
+        """切换小说后重新加载关系图（调用方需持有锁）"""
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if novel_dir == self._loaded_dir:
+            return
+        self._loaded_dir = novel_dir
+        self._chapters, self._pair_chapters, self._adjacency = {}, {}, {}
+        self._baseline = None
+        path = self._graph_path()
+        if not path or not os.path.exists(path):
+            return
+        line_count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                line_count += 1
+                try:
+                    record = json.loads(line)
+                    if "baseline" in record:
+                        self._baseline = (int(record["chapter"]), record["baseline"])
+                        continue
+                    self._set_chapter(int(record["chapter"]), record.get("deltas", []))
+                except (ValueError, KeyError, TypeError):
+                    continue
+        if line_count > len(self._chapters) * 2 + 1:
+            self._compact()
+
+    def _compact(self):
+        """按当前内存内容重写关系图文件（调用方需持有锁）"""
+        path = self._graph_path()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if self._baseline:
+                f.write(json.dumps({"chapter": self._baseline[0], "baseline": self._baseline[1]}, ensure_ascii=False) + "\n")
+            for chapter in sorted(self._chapters):
+                f.write(json.dumps({"chapter": chapter, "deltas": self._chapters[chapter]}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+
+    def _set_chapter(self, chapter, deltas):
+        """替换某章的关系变动并更新索引（调用方需持有锁）"""
+        for delta in self._chapters.pop(chapter, []):
+            pair = self._pair(delta["a"], delta["b"])
+            chapters = self._pair_chapters.get(pair, [])
+            pos = bisect.bisect_left(chapters, chapter)
+            if pos < len(chapters) and chapters[pos] == chapter:
+                chapters.pop(pos)
+        if not deltas:
+            return
+        self._chapters[chapter] = deltas
+        for delta in deltas:
+            pair = self._pair(delta["a"], delta["b"])
+            chapters = self._pair_chapters.setdefault(pair, [])
+            pos = bisect.bisect_left(chapters, chapter)
+            if pos == len(chapters) or chapters[pos] != chapter:
+                chapters.insert(pos, chapter)
+            for name in pair:
+                self._adjacency.setdefault(name, set()).add(pair)
+
+    def apply_chapter(self, chapter, relations_text):
+        """
+        应用某章 AI 输出的关系变动（覆盖该章已有变动）
+        Args:
+            chapter: 章节序号（从1开始）
+            relations_text: AI 输出的关系变动文本
+        Returns:
+            解析出的变动条数
+        """
+        deltas = []
+        for delta in parse_relation_deltas(relations_text):
+            a, b = self._canonical(delta["a"]), self._canonical(delta["b"])
+            if a != b:
+                deltas.append(dict(delta, a=a, b=b))
+        path = self._graph_path()
+        try:
+            with self._lock:
+                self._ensure_loaded()
+                if self._chapters.get(chapter, []) == deltas:
+                    return len(deltas)
+                self._set_chapter(chapter, deltas)
+                if path:
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({"chapter": chapter, "deltas": deltas}, ensure_ascii=False) + "\n")
+            print(f"[信息] 第{chapter}章人物关系变动 {len(deltas)} 条已写入关系图")
+        except Exception as e:
+            print(f"[警告] 写入人物关系图失败: {e}")
+            traceback.print_exc()
+        return len(deltas)
+
+    def migrate_legacy(self):
+        """
+        将关系图首条记录之前最近一章的旧版关系文本迁入为基线（打开小说时调用，只迁移一次）
+        Returns:
+            是否迁移
+        """
+        chapter_list = getattr(self.app, "chapter_list", []) or []
+        try:
+            with self._lock:
+                self._ensure_loaded()
+                path = self._graph_path()
+                if not path or self._baseline:
+                    return False
+                first = min(self._chapters) if self._chapters else len(chapter_list) + 1
+                for chapter in range(min(first, len(chapter_list) + 1) - 1, 0, -1):
+                    text = (chapter_list[chapter - 1].get("char_relations", "") or "").strip()
+                    if text:
+                        break
+                else:
+                    return False
+                self._baseline = (chapter, text)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"chapter": chapter, "baseline": text}, ensure_ascii=False) + "\n")
+            print(f"[信息] 已将第{chapter}章的旧版人物关系迁入关系图")
+            return True
+        except Exception as e:
+            print(f"[警告] 迁移旧版人物关系失败: {e}")
+            traceback.print_exc()
+            return False
+
+    def shift_chapters(self, index, delta):
+        """
+        章节插入或删除后改写关系图中的章节序号
+        Args:
+            index: 插入或删除的位置（章节索引）
+            delta: 1 表示在 index 处插入了一章，-1 表示删除了第 index 章（其变动一并丢弃）
+        """
+        try:
+            with self._lock:
+                self._ensure_loaded()
+                if not self._graph_path() or not (self._chapters or self._baseline):
+                    return
+                chapters = self._chapters
+                self._chapters, self._pair_chapters, self._adjacency = {}, {}, {}
+                for chapter, deltas in chapters.items():
+                    if chapter > index:
+                        if delta < 0 and chapter == index + 1:
+                            continue
+                        chapter += delta
+                    self._set_chapter(chapter, deltas)
+                if self._baseline and self._baseline[0] > index:
+                    self._baseline = (self._baseline[0] + delta, self._baseline[1])
+                self._compact()
+        except Exception as e:
+            print(f"[警告] 改写人物关系图的章节序号失败: {e}")
+            traceback.print_exc()
+
+    # ==================== 查询 ====================
+
+    def has_edges(self, before_chapter=None):
+        """关系图中是否有（指定章节之前的）记录，含旧版关系基线"""
+        with self._lock:
+            self._ensure_loaded()
+            if before_chapter is None:
+                return bool(self._chapters or self._baseline)
+            if self._baseline and self._baseline[0] < before_chapter:
+                return True
+            return any(chapter < before_chapter for chapter in self._chapters)
+
+    def baseline_lines(self, names, before_chapter=None, limit=MAX_PROMPT_EDGES):
+        """旧版关系基线中提到给定角色的行（基线晚于 before_chapter 时为空）"""
+        with self._lock:
+            self._ensure_loaded()
+            baseline = self._baseline
+        if not baseline or not names or (before_chapter is not None and baseline[0] >= before_chapter):
+            return []
+        details = getattr(self.app, "character_setting_details", None) or {}
+        matcher = get_matcher(details)
+        names = set(names)
+        lines = [line.strip() for line in baseline[1].splitlines()
+                 if line.strip() and names.intersection(matcher.count(line))]
+        return lines[-limit:]
+
+    def _edge_at(self, pair, before_chapter):
+        """某关系对在 before_chapter 之前的最新状态（调用方需持有锁）"""
+        chapters = self._pair_chapters.get(pair, [])
+        end = len(chapters) if before_chapter is None else bisect.bisect_left(chapters, before_chapter)
+        if not end:
+            return None
+        chapter = chapters[end - 1]
+        for delta in self._chapters.get(chapter, []):
+            if self._pair(delta["a"], delta["b"]) == pair:
+                if delta["type"] in REMOVED_TYPES:
+                    return None
+                return dict(delta, chapter=chapter, since=chapters[0])
+        return None
+
+    def edges_for(self, names, before_chapter=None):
+        """
+        与给定角色相关的当前关系（只看 before_chapter 之前的变动）
+        Returns:
+            [{"a", "b", "type", "note", "chapter": 最近变动章节, "since": 首次记录章节}, ...]，最近变动的在前
+        """
+        with self._lock:
+            self._ensure_loaded()
+            pairs = set()
+            for name in names:
+                pairs.update(self._adjacency.get(name, ()))
+            edges = [edge for edge in (self._edge_at(pair, before_chapter) for pair in pairs) if edge]
+        edges.sort(key=lambda e: -e["chapter"])
+        return edges
+
+    def history(self, a, b):
+        """两名角色之间关系的逐章变化 [{"chapter", "type", "note"}, ...]"""
+        pair = self._pair(a, b)
+        with self._lock:
+            self._ensure_loaded()
+            result = []
+            for chapter in self._pair_chapters.get(pair, []):
+                for delta in self._chapters.get(chapter, []):
+                    if self._pair(delta["a"], delta["b"]) == pair:
+                        result.append({"chapter": chapter, "type": delta["type"], "note": delta["note"]})
+            return result
+
+    @staticmethod
+    def format_edges(edges, limit=MAX_PROMPT_EDGES):
+        lines = []
+        for edge in edges[:limit]:
+            note = f"；{edge['note']}" if edge.get("note") else ""
+            lines.append(f"- {edge['a']}—{edge['b']}：{edge['type']}（第{edge['chapter']}章{note}）")
+        return "\n".join(lines)
+
+    def names_in(self, text):
+        """文本中出现的已登记角色"""
+        details = getattr(self.app, "character_setting_details", None)
+        if not details or not text:
+            return []
+        return list(get_matcher(details).count(text))
+
+    def context_for(self, text, before_chapter, fallback=""):
+        """
+        组织提示词用的关系上下文：只列出 text 中出场角色相关的关系
+        关系图在该章之前尚无记录（含基线）时返回 fallback
+        """
+        if not self.has_edges(before_chapter):
+            return fallback
+        names = self.names_in(text)
+        edges = self.format_edges(self.edges_for(names, before_chapter))
+        legacy = self.baseline_lines(names, before_chapter)
+        if legacy:
+            edges = "\n".join(filter(None, [edges, "（旧版关系记录）", *legacy]))
+        return edges
@@ -0,0 +1,162 @@
+"""
+分场景并行创作服务
+长章节整章一次生成时，耗时等于全部输出 Token 除以单个流的速度。开启分场景创作后：
+    1. 场景计划：章节已有 scenes 字段时直接使用，否则请 AI 将本章概述拆分为若干场景，并写回 scenes 字段；
+       AI 生成的计划同时记录本章概述与策划的哈希（scenes_basis），概述或策划修改后重新生成；
+    2. 并行创作：各场景共用整章上下文与场景计划，附上本场景的起止提示，在限流下同时生成；
+    3. 衔接润色：相邻场景的衔接处只改写下一场景的开头段落，各衔接处同样并行处理。
+生成耗时约为最长一个场景的耗时加两次短请求。任何一步失败时回退为整章一次生成。
+由 config.ini 的 [APP] scene_parallel_drafting 控制。
+"""
+
+import json
+import hashlib
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from AI.prompt_builder import PromptBuilder
+from AI.rate_limiter import RateLimiter
+
+
+# 章节字数不少于该值时才分场景创作
+SCENE_MIN_WORDS = 3000
+# 每个场景的目标字数与场景数范围
+SCENE_TARGET_WORDS = 1500
+MIN_SCENES = 2
+MAX_SCENES = 6
+SCENE_CONCURRENCY = 6
+SCENE_REQUESTS_PER_MINUTE = 60
+# 衔接润色时上一场景结尾、下一场景开头段落的最大字数
+STITCH_CONTEXT_CHARS = 400
+STITCH_MAX_HEAD_CHARS = 600
+SCENE_PLAN_SYSTEM_PROMPT = "你是一位专业的小说策划编辑，擅长把章节剧情拆分为节奏清晰、衔接紧密的场景。"
+STITCH_SYSTEM_PROMPT = "你是一位专业的小说编辑，擅长润色段落之间的过渡。"
+
+
+class SceneDraftService:
+    """分场景并行创作服务类"""
+
+    # 由 config.ini 的 [APP] scene_parallel_drafting 设置
+    ENABLED = False
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+
+    def should_draft(self, word_count):
+        """本章是否使用分场景创作"""
+        return SceneDraftService.ENABLED and word_count >= SCENE_MIN_WORDS
+
+    @staticmethod
+    def plan_basis(instruction, chapter_plan):
+        """场景计划的依据哈希（本章概述 + 章节高潮/钩子）"""
+        chapter_plan = chapter_plan or {}
+        raw = json.dumps([instruction or "", chapter_plan.get("climax", ""), chapter_plan.get("hook", "")], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def stored_plan(self, chapter, instruction, chapter_plan):
+        """
+        章节中可沿用的场景计划：用户填写的计划（无依据哈希）总是沿用，
+        AI 生成的计划只在本章概述与策划未修改时沿用
+        """
+        scenes_text = chapter.get("scenes", "") or ""
+        basis = chapter.get("scenes_basis")
+        if scenes_text and basis and basis != self.plan_basis(instruction, chapter_plan):
+            print("[信息] 本章概述或策划已修改，重新生成场景计划")
+            return ""
+        return scenes_text
+
+    @staticmethod
+    def scene_count(word_count):
+        return max(MIN_SCENES, min(MAX_SCENES, round(word_count / SCENE_TARGET_WORDS)))
+
+    def draft(self, user_prompt, instruction, chapter_plan, scenes_text, novel_type, writing_style, temperature, max_tokens, word_count):
+        """
+        分场景并行创作整章（后台线程调用）
+        Args:
+            user_prompt: 整章的用户提示词（各场景共享的上下文）
+            instruction: 本章内容概述
+            chapter_plan: 章节策划 {"climax", "hook"}
+            scenes_text: 章节已有的 scenes 字段
+            其余参数同 GenerationService.generate_novel
+        Returns:
+            (正文, 场景计划)；正文失败时为 ❌ 开头的错误信息，场景计划为 None 表示已回退为整章生成
+        """
+        generation = self.app.generation_service
+        try:
+            generation._update_ai_config()
+            ai_client = self.app.ai_client
+            limiter = RateLimiter(SCENE_REQUESTS_PER_MINUTE, SCENE_CONCURRENCY)
+
+            # 1. 场景计划
+            scenes = PromptBuilder.parse_scene_plan(scenes_text)
+            if len(scenes) < MIN_SCENES:
+                count = self.scene_count(word_count)
+                plan_prompt = PromptBuilder.build_scene_plan_prompt(instruction, chapter_plan, count, word_count)
+                with ai_client.task("场景计划"):
+                    plan_text = limiter.call(ai_client, SCENE_PLAN_SYSTEM_PROMPT, plan_prompt, 0.5, 1500)
+                scenes = PromptBuilder.parse_scene_plan(plan_text)[:MAX_SCENES]
+            if len(scenes) < MIN_SCENES:
+                print("[警告] 场景计划生成或解析失败，改为整章生成")
+                return self._fallback(user_prompt, novel_type, writing_style, temperature, max_tokens), None
+            print(f"[信息] 分场景并行创作：共 {len(scenes)} 个场景")
+
+            # 2. 并行创作各场景
+            scene_words = max(500, word_count // len(scenes))
+            scene_max_tokens = min(max_tokens, max(2000, int(scene_words * 2)))
+            system_prompt = PromptBuilder.build_system_prompt(novel_type, writing_style, scene_words)
+
+            def draft_scene(index):
+                prompt = PromptBuilder.build_scene_prompt(user_prompt, scenes, index, scene_words)
+                prompt = PromptBuilder.append_word_count(prompt, scene_words)
+                with ai_client.task("场景创作"):
+                    return limiter.call(ai_client, system_prompt, prompt, temperature, scene_max_tokens)
+
+            with ThreadPoolExecutor(max_workers=limiter.max_concurrency) as pool:
+                drafts = list(pool.map(draft_scene, range(len(scenes))))
+            failed = [i + 1 for i, text in enumerate(drafts) if not text or text.startswith("❌")]
+            if failed:
+                print(f"[警告] 场景 {failed} 创作失败，改为整章生成")
+                return self._fallback(user_prompt, novel_type, writing_style, temperature, max_tokens), None
+            drafts = [text.strip() for text in drafts]
+
+            # 3. 衔接润色
+            with ThreadPoolExecutor(max_workers=limiter.max_concurrency) as pool:
+                drafts[1:] = list(pool.map(lambda i: self._stitch(limiter, drafts[i - 1], drafts[i]), range(1, len(drafts))))
+            return "\n\n".join(drafts), scenes
+        except Exception as e:
+            print(f"[错误] 分场景创作异常，改为整章生成: {type(e).__name__}: {str(e)}")
+            traceback.print_exc()
+            return self._fallback(user_prompt, novel_type, writing_style, temperature, max_tokens), None
+
+    def _fallback(self, user_prompt, novel_type, writing_style, temperature, max_tokens):
+        return self.app.generation_service.generate_novel(
+            prompt=user_prompt,
+            novel_type=novel_type,
+            writing_style=writing_style,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            task="正文创作"
+        )
+
+    def _stitch(self, limiter, prev_text, next_text):
+        """
+        改写下一场景的开头段落使其与上一场景衔接；失败时保持原文
+        Returns:
+            润色后的下一场景正文
+        """
+        paragraphs = next_text.split("\n", 1)
+        head, rest = paragraphs[0], (paragraphs[1] if len(paragraphs) > 1 else "")
+        if not head.strip() or len(head) > STITCH_MAX_HEAD_CHARS:
+            return next_text
+        prompt = PromptBuilder.build_scene_stitch_prompt(prev_text[-STITCH_CONTEXT_CHARS:], head)
+        with self.app.ai_client.task("场景衔接"):
+            new_head = limiter.call(self.app.ai_client, STITCH_SYSTEM_PROMPT, prompt, 0.3, 800)
+        new_head = (new_head or "").strip()
+        if not new_head or new_head.startswith("❌") or len(new_head) > len(head) * 2 + 100:
+            print(f"[警告] 场景衔接润色失败，保留原文: {new_head[:60]}")
+            return next_text
+        return f"{new_head}\n{rest}" if rest else new_head
@@ -0,0 +1,77 @@
+"""
+设定条目相关度排序服务
+设定条目多达数百条（功法体系、势力、地点……）时，全部勾选进提示词的代价最大。
+本服务以全部小说设定为语料维护一个 TF-IDF 索引（字二元组特征，见 services/text_similarity.py），
+按本章策划对已勾选的条目打分，只把得分最高、且能放进 Token 预算的条目交给 build_settings_content。
+设定条目增删改时索引只重算变化的条目。
+"""
+
+import threading
+from AI.prompt_builder import PromptBuilder
+from services.text_similarity import TfidfIndex
+
+
+# 小说设定部分的 Token 预算；已勾选条目总量不超过预算时全部保留
+SETTINGS_TOKEN_BUDGET = 3000
+
+
+class SettingRankService:
+    """设定条目相关度排序服务类"""
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._lock = threading.Lock()
+        self._index = TfidfIndex()
+        self._loaded_dir = None
+
+    def _sync(self):
+        """与当前小说的设定条目同步索引（调用方需持有锁）"""
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if novel_dir != self._loaded_dir:
+            self._index = TfidfIndex()
+            self._loaded_dir = novel_dir
+        documents = {name: f"{name}\n{text}" for name, text in (getattr(self.app, "novel_setting_details", {}) or {}).items()}
+        return self._index.sync(documents)
+
+    def rank(self, query_text, names=None):
+        """
+        按与 query_text 的相关度为设定条目排序
+        Args:
+            names: 只对这些条目排序；None 表示全部
+        Returns:
+            [(条目名, 得分), ...]，得分降序，同分保持原顺序
+        """
+        with self._lock:
+            self._sync()
+            scores = self._index.score(query_text or "", names)
+        order = list(names) if names is not None else list(scores)
+        position = {name: i for i, name in enumerate(order)}
+        return sorted(((name, scores.get(name, 0.0)) for name in order), key=lambda item: (-item[1], position[item[0]]))
+
+    def select(self, entries, query_text, budget_tokens=SETTINGS_TOKEN_BUDGET):
+        """
+        在 Token 预算内选出与本章最相关的设定条目
+        Args:
+            entries: {条目名: 将写入提示词的文本（可能是提示词卡片）}，相关度按设定原文计算
+            query_text: 本章策划等查询文本；为空时不做筛选
+        Returns:
+            按原顺序保留的 {条目名: 文本}
+        """
+        costs = {name: PromptBuilder.estimate_tokens(text) for name, text in entries.items()}
+        if not query_text or sum(costs.values()) <= budget_tokens:
+            return entries
+        ranked = self.rank(query_text, list(entries))
+        kept, used = set(), 0
+        for name, _ in ranked:
+            if used + costs[name] <= budget_tokens:
+                kept.add(name)
+                used += costs[name]
+        dropped = [name for name, _ in ranked if name not in kept]
+        print(f"[信息] 设定条目按相关度筛选：保留 {len(kept)}/{len(entries)} 条，约 {used}/{budget_tokens} Tokens"
+              + (f"；未放入：{'、'.join(dropped[:10])}{'等' if len(dropped) > 10 else ''}" if dropped else ""))
+        return {name: text for name, text in entries.items() if name in kept}
@@ -0,0 +1,234 @@
+"""
+小说快照服务
+在 novel.ini 旁维护一个紧凑的单文件快照（novel.snapshot），
+包含基础信息、设定、摘要及全部章节正文（按偏移量索引），
+打开大部头小说时只需一次顺序读取；快照失效时透明回退到原始文件。
+
+文件格式：
+    MAGIC(4) | 版本(uint16) | 头部长度(uint32) | 头部JSON(utf-8) | zlib压缩的正文区
+    头部JSON 记录 novel.ini 的哈希与各章节文件的 mtime/大小，用于打开时校验。
+保存时快照在后台线程中写出（需读取全部章节文件，耗时与全书篇幅成正比），
+写出期间再次保存的请求会合并为结束后的一次补写。
+"""
+
+import os
+import json
+import zlib
+import struct
+import hashlib
+import threading
+import configparser
+import traceback
+
+
+SNAPSHOT_FILENAME = "novel.snapshot"
+SNAPSHOT_MAGIC = b"ANSS"
+SNAPSHOT_VERSION = 1
+_HEADER_STRUCT = struct.Struct("<HI")
+# 退出程序时等待后台快照写完的最长秒数
+EXIT_WAIT_SECONDS = 10
+
+# 后台写快照的状态（各处临时创建的 SnapshotService 实例共享）
+_writer_lock = threading.Lock()
+_writer = {"thread": None, "pending": []}
+
+
+class SnapshotService:
+    """小说快照服务类"""
+
+    def __init__(self, app):
+        """
+        初始化快照服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+
+    @staticmethod
+    def extract_chapter_body(text):
+        """
+        从章节文件文本中提取正文（去掉首行“第X章 标题”及其后的空行）
+        与加载章节时的解析规则保持一致，保证快照内容与原始文件等价
+        """
+        lines = text.splitlines()
+        if not lines:
+            return ""
+        first = lines[0].strip()
+        if first.startswith("第") and "章" in first:
+            body_start = 1
+            if len(lines) > 1 and lines[1].strip() == "":
+                body_start = 2
+            return "\n".join(lines[body_start:]).strip()
+        return text.strip()
+
+    @staticmethod
+    def _file_sha1(path):
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    @staticmethod
+    def _stat_signature(path):
+        """返回文件的 [mtime_ns, size]，不存在时返回 None"""
+        try:
+            st = os.stat(path)
+            return [st.st_mtime_ns, st.st_size]
+        except OSError:
+            return None
+
+    def save_snapshot(self, novel_dir=None):
+        """
+        根据磁盘上最新的 novel.ini 和章节文件写出快照
+        应在 novel.ini 与章节文件写入完成后调用
+        Returns:
+            成功返回True，失败返回False
+        """
+        try:
+            if novel_dir is None:
+                novel_dir = getattr(self.app, "current_novel_dir", "")
+            if not novel_dir:
+                return False
+
+            novel_ini = os.path.join(novel_dir, "novel.ini")
+            if not os.path.exists(novel_ini):
+                return False
+
+            with open(novel_ini, "rb") as f:
+                ini_bytes = f.read()
+            cfg = configparser.ConfigParser(interpolation=None)
+            cfg.read_string(ini_bytes.decode("utf-8"))
+
+            chapters_path = "chapters"
+            if "META" in cfg:
+                chapters_path = cfg["META"].get("chapters_path", chapters_path) or "chapters"
+            chapters_dir = os.path.join(novel_dir, chapters_path)
+
+            # 章节正文按文件名拼接为一个正文区，头部只记录偏移
+            body_parts = []
+            chapter_index = {}
+            offset = 0
+            if "CHAPTERS" in cfg:
+                for fname in cfg["CHAPTERS"].values():
+                    path = os.path.join(chapters_dir, fname)
+                    signature = self._stat_signature(path)
+                    if signature is None:
+                        continue
+                    with open(path, "r", encoding="utf-8") as cf:
+                        content = self.extract_chapter_body(cf.read())
+                    data = content.encode("utf-8")
+                    chapter_index[fname] = {"offset": offset, "length": len(data), "stat": signature}
+                    body_parts.append(data)
+                    offset += len(data)
+
+            header = {
+                "ini_sha1": hashlib.sha1(ini_bytes).hexdigest(),
+                "ini_size": len(ini_bytes),
+                "chapters_path": chapters_path,
+                "sections": {name: dict(cfg[name]) for name in cfg.sections()},
+                "chapters": chapter_index,
+            }
+            header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+            body_bytes = zlib.compress(b"".join(body_parts), 6)
+
+            snapshot_path = os.path.join(novel_dir, SNAPSHOT_FILENAME)
+            tmp_path = snapshot_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(_HEADER_STRUCT.pack(SNAPSHOT_VERSION, len(header_bytes)))
+                f.write(header_bytes)
+                f.write(body_bytes)
+            os.replace(tmp_path, snapshot_path)
+
+            print(f"[信息] 已更新小说快照: {snapshot_path}（{len(chapter_index)} 章）")
+            return True
+        except Exception as e:
+            print(f"[警告] 写入小说快照失败: {e}")
+            traceback.print_exc()
+            return False
+
+    def save_snapshot_in_background(self, novel_dir=None):
+        """
+        在后台线程中写出快照（界面线程保存小说后调用，立即返回）
+        写出期间再次请求时，当前写出结束后按磁盘上的最新文件再写一次
+        """
+        if novel_dir is None:
+            novel_dir = getattr(self.app, "current_novel_dir", "")
+        if not novel_dir:
+            return False
+
+        def writer_thread():
+            while True:
+                with _writer_lock:
+                    if not _writer["pending"]:
+                        _writer["thread"] = None
+                        return
+                    target_dir = _writer["pending"].pop(0)
+                self.save_snapshot(target_dir)
+
+        with _writer_lock:
+            if novel_dir not in _writer["pending"]:
+                _writer["pending"].append(novel_dir)
+            if _writer["thread"] is None:
+                _writer["thread"] = threading.Thread(target=writer_thread, daemon=True)
+                _writer["thread"].start()
+        return True
+
+    @staticmethod
+    def wait_for_background_save(timeout=EXIT_WAIT_SECONDS):
+        """等待后台快照写完（退出程序前调用），超时则放弃，下次打开时回退到原始文件"""
+        thread = _writer["thread"]
+        if thread is not None:
+            thread.join(timeout)
+
+    def load_snapshot(self, novel_ini_path):
+        """
+        读取并校验快照
+        Args:
+            novel_ini_path: novel.ini 文件路径
+        Returns:
+            校验通过返回 {"sections": {...}, "chapters": {文件名: 正文}}，
+            快照不存在、损坏或已过期时返回 None（调用方应回退到原始文件）
+        """
+        snapshot_path = os.path.join(os.path.dirname(novel_ini_path), SNAPSHOT_FILENAME)
+        if not os.path.exists(snapshot_path):
+            return None
+        try:
+            with open(snapshot_path, "rb") as f:
+                raw = f.read()
+
+            if raw[:4] != SNAPSHOT_MAGIC:
+                print("[警告] 快照文件标识不符，回退到原始文件")
+                return None
+            version, header_len = _HEADER_STRUCT.unpack_from(raw, 4)
+            if version != SNAPSHOT_VERSION:
+                print(f"[信息] 快照版本 {version} 与当前版本不一致，回退到原始文件")
+                return None
+            header_start = 4 + _HEADER_STRUCT.size
+            header = json.loads(raw[header_start:header_start + header_len].decode("utf-8"))
+
+            # 校验 novel.ini：先比较大小，再比较哈希
+            if os.path.getsize(novel_ini_path) != header.get("ini_size"):
+                print("[信息] novel.ini 已变更，快照失效")
+                return None
+            if self._file_sha1(novel_ini_path) != header.get("ini_sha1"):
+                print("[信息] novel.ini 已变更，快照失效")
+                return None
+
+            # 校验章节文件：mtime 与大小
+            chapters_dir = os.path.join(os.path.dirname(novel_ini_path), header.get("chapters_path", "chapters"))
+            chapter_index = header.get("chapters", {})
+            for fname, entry in chapter_index.items():
+                if self._stat_signature(os.path.join(chapters_dir, fname)) != entry.get("stat"):
+                    print(f"[信息] 章节文件 {fname} 已变更，快照失效")
+                    return None
+
+            body = zlib.decompress(raw[header_start + header_len:])
+            chapters = {}
+            for fname, entry in chapter_index.items():
+                start = entry["offset"]
+                chapters[fname] = body[start:start + entry["length"]].decode("utf-8")
+
+            print(f"[信息] 已从快照加载小说（{len(chapters)} 章）")
+            return {"sections": header.get("sections", {}), "chapters": chapters}
+        except Exception as e:
+            print(f"[警告] 读取小说快照失败，回退到原始文件: {e}")
+            return None
@@ -0,0 +1,331 @@
+"""
+摘要链过期跟踪服务
+每章的 global_summary / char_status / char_relations 依赖“本章摘要 + 上一章的三项结果”，
+本章摘要又依赖本章正文，构成一条从前往后的依赖链。
+
+每章记录两项依据哈希：
+    summary_basis  生成本章摘要时的正文哈希
+    chain_basis    生成三项结果时的（本章摘要 + 上一章三项结果）哈希
+当前值与依据不一致的章节即为过期，其后所有已定稿章节也随之过期。
+后台刷新按章节顺序逐章重算，若重算结果与原结果相同则下游依据不变，传播自然终止。
+摘要与三项结果保存在 novel.ini 中，读回时每行首尾的空白会被 configparser 去掉，
+因此计算依据前先按同样方式规整文本，保证保存前后的依据一致。
+"""
+
+import json
+import hashlib
+import threading
+import traceback
+import tkinter as tk
+from AI.prompt_builder import PromptBuilder
+from AI.rate_limiter import RateLimiter
+from AI.summary_segments import update_global_summary
+
+
+CHAIN_KEYS = ("global_summary", "char_status", "char_relations")
+# 保存或切换章节后，延迟多久启动后台刷新（毫秒）
+LAZY_REFRESH_DELAY_MS = 3000
+# 后台刷新的限流参数
+REFRESH_CONCURRENCY = 3
+REFRESH_REQUESTS_PER_MINUTE = 30
+# 每刷新多少章写一次 novel.ini
+REFRESH_PERSIST_EVERY = 5
+
+STALE_LABELS = {
+    "summary": "正文已修改",
+    "chain": "摘要已修改",
+    "upstream": "前文已变化",
+}
+
+
+class StalenessService:
+    """摘要链过期跟踪服务类"""
+
+    def __init__(self, app):
+        """
+        初始化服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._refresh_thread = None
+        self._cancel_event = threading.Event()
+        self._pending_job = None
+
+    # ==================== 依据哈希 ====================
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize(text):
+        """按 novel.ini 读回后的形式规整文本：去掉每行首尾空白与空行"""
+        return "\n".join(line.strip() for line in str(text or "").splitlines() if line.strip())
+
+    @staticmethod
+    def _has_chain(chapter):
+        return any((chapter.get(key, "") or "").strip() for key in CHAIN_KEYS)
+
+    def summary_basis_of(self, content):
+        return self._hash(content)
+
+    def chain_basis(self, idx):
+        """计算第 idx 章当前的三项结果依据（本章摘要 + 上一章三项结果）"""
+        chapter_list = self.app.chapter_list
+        prev = chapter_list[idx - 1] if idx > 0 else {}
+        raw = json.dumps([self._normalize(chapter_list[idx].get("summary", ""))]
+                         + [self._normalize(prev.get(key, "")) for key in CHAIN_KEYS], ensure_ascii=False)
+        return self._hash(raw)
+
+    def mark_summary_fresh(self, idx, content_hash=None):
+        """记录本章摘要的依据（content_hash 为生成摘要时所用正文的哈希）"""
+        if 0 <= idx < len(self.app.chapter_list):
+            chapter = self.app.chapter_list[idx]
+            chapter["summary_basis"] = content_hash or self.summary_basis_of(chapter.get("content", ""))
+
+    def mark_chain_fresh(self, idx):
+        """记录三项结果的依据（应在写入本章三项结果后调用）"""
+        if 0 <= idx < len(self.app.chapter_list):
+            self.app.chapter_list[idx]["chain_basis"] = self.chain_basis(idx)
+
+    def ensure_basis(self):
+        """
+        为旧数据补齐依据：已有摘要/三项结果但没有依据的章节视为最新
+        Returns:
+            补齐的章节数
+        """
+        filled = 0
+        for idx, chapter in enumerate(self.app.chapter_list):
+            if (chapter.get("summary", "") or "").strip() and not chapter.get("summary_basis"):
+                self.mark_summary_fresh(idx)
+                filled += 1
+            if self._has_chain(chapter) and not chapter.get("chain_basis"):
+                self.mark_chain_fresh(idx)
+                filled += 1
+        return filled
+
+    def compute_stale(self):
+        """
+        单次顺序遍历计算过期章节
+        Returns:
+            {章节索引: 原因}，原因为 summary / chain / upstream
+        """
+        stale = {}
+        upstream = False
+        for idx, chapter in enumerate(self.app.chapter_list):
+            reason = None
+            summary_basis = chapter.get("summary_basis")
+            if (chapter.get("summary", "") or "").strip() and summary_basis \
+                    and summary_basis != self.summary_basis_of(chapter.get("content", "")):
+                reason = "summary"
+            elif self._has_chain(chapter):
+                chain_basis = chapter.get("chain_basis")
+                if chain_basis and chain_basis != self.chain_basis(idx):
+                    reason = "chain"
+                elif upstream:
+                    reason = "upstream"
+            if reason:
+                stale[idx] = reason
+                upstream = True
+        return stale
+
+    def stale_label(self, idx, stale=None):
+        """返回章节列表中显示的过期标记，未过期返回空字符串"""
+        stale = self.compute_stale() if stale is None else stale
+        reason = stale.get(idx)
+        return f" ⚠{STALE_LABELS[reason]}" if reason else ""
+
+    # ==================== 后台增量刷新 ====================
+
+    def is_refreshing(self):
+        return bool(self._refresh_thread and self._refresh_thread.is_alive())
+
+    def schedule_lazy_refresh(self):
+        """
+        延迟启动后台刷新：只重算当前章节之前的过期章节（即当前创作实际依赖的前文）
+        重复调用会重新计时
+        """
+        if self._pending_job is not None:
+            try:
+                self.app.root.after_cancel(self._pending_job)
+            except Exception:
+                pass
+
+        def run():
+            self._pending_job = None
+            current = getattr(self.app, "current_chapter_index", None)
+            if current:
+                self.refresh_stale(up_to=current - 1)
+
+        self._pending_job = self.app.root.after(LAZY_REFRESH_DELAY_MS, run)
+
+    def cancel_refresh(self):
+        self._cancel_event.set()
+
+    def refresh_stale(self, up_to=None, on_done=None):
+        """
+        在后台按章节顺序重算过期章节（界面线程调用）
+        Args:
+            up_to: 只处理索引不大于该值的章节，None 表示全部
+            on_done: 完成后在界面线程调用 on_done(已刷新章数, 错误信息或None)
+        Returns:
+            是否启动了刷新任务
+        """
+        if self.is_refreshing():
+            return False
+        stale = self.compute_stale()
+        if not any(up_to is None or idx <= up_to for idx in stale):
+            return False
+
+        self.app.generation_service._update_ai_config()
+        limiter = RateLimiter(REFRESH_REQUESTS_PER_MINUTE, REFRESH_CONCURRENCY)
+        self._cancel_event = threading.Event()
+        cancel_event = self._cancel_event
+        outline = self.app.novel_outline_text.get("1.0", tk.END).strip() if hasattr(self.app, "novel_outline_text") else ""
+
+        def limited_generate(system_prompt, user_prompt, temperature, max_tokens):
+            return limiter.call(self.app.ai_client, system_prompt, user_prompt, temperature, max_tokens, cancel_event=cancel_event)
+
+        def run_on_ui(func):
+            """在界面线程执行 func 并等待其完成，保证下一轮读取到最新数据"""
+            done = threading.Event()
+            result = {}
+
+            def wrapper():
+                try:
+                    result["value"] = func()
+                finally:
+                    done.set()
+            self.app.root.after(0, wrapper)
+            while not done.wait(0.5):
+                if cancel_event.is_set():
+                    return None
+            return result.get("value")
+
+        def next_target():
+            current = self.compute_stale()
+            targets = sorted(idx for idx in current if up_to is None or idx <= up_to)
+            if not targets:
+                return None
+            idx = targets[0]
+            chapter = self.app.chapter_list[idx]
+            prev = self.app.chapter_list[idx - 1] if idx > 0 else {}
+            return {
+                "idx": idx,
+                "reason": current[idx],
+                "content": chapter.get("content", "") or "",
+                "summary": chapter.get("summary", "") or "",
+                "chain": {key: chapter.get(key, "") or "" for key in CHAIN_KEYS},
+                "prev": {key: (prev.get(key, "") or "").strip() for key in CHAIN_KEYS},
+            }
+
+        def apply_summary(target, summary):
+            idx = target["idx"]
+            chapter = self.app.chapter_list[idx] if idx < len(self.app.chapter_list) else None
+            # 刷新期间正文又被修改时放弃本次结果
+            if chapter is None or (chapter.get("content", "") or "") != target["content"]:
+                return False
+            if summary != target["summary"]:
+                chapter["summary"] = summary
+            self.mark_summary_fresh(idx, self.summary_basis_of(target["content"]))
+            return True
+
+        def apply_chain(target, results):
+            idx = target["idx"]
+            chapter = self.app.chapter_list[idx] if idx < len(self.app.chapter_list) else None
+            if chapter is None or (chapter.get("summary", "") or "") != target["summary"]:
+                return False
+            changed = any(results[key] != (chapter.get(key, "") or "").strip() for key in CHAIN_KEYS)
+            if changed:
+                for key in CHAIN_KEYS:
+                    chapter[key] = results[key]
+                self.app.novel_service.update_character_profile_status(
+                    results["char_status"], chapter_num=idx + 1, silent=True, persist=False
+                )
+                self.app.relation_graph_service.apply_chapter(idx + 1, results["char_relations"])
+            self.mark_chain_fresh(idx)
+            return True
+
+        def finish(count, error):
+            self.app.novel_service._persist_chapters_to_novel()
+            self.app.character_event_service.flush()
+            self.app.novel_service.refresh_stale_marks()
+            if on_done:
+                on_done(count, error)
+
+        def refresh_thread():
+            count, error = 0, None
+            pending_persist = 0
+            try:
+                while not cancel_event.is_set():
+                    target = run_on_ui(next_target)
+                    if target is None:
+                        break
+                    idx = target["idx"]
+
+                    if target["reason"] == "summary":
+                        summary = self.app.step_cache_service.cached_generate(
+                            "summary", "你是一位专业的小说编辑，请精准提炼章节核心剧情。",
+                            PromptBuilder.build_chapter_summary_prompt(target["content"]), 0.3, 1000, limited_generate)
+                        if summary.startswith("❌"):
+                            error = f"第{idx+1}章摘要重算失败：{summary}"
+                            break
+                        summary = summary.strip()
+                        if summary == target["summary"].strip():
+                            print(f"[信息] 第{idx+1}章摘要重算结果未变化，下游无需更新")
+                        run_on_ui(lambda: apply_summary(target, summary))
+                        continue
+
+                    prev = dict(target["prev"])
+                    if idx == 0 and not prev["global_summary"]:
+                        prev["global_summary"] = outline
+                    summary = target["summary"].strip()
+                    def generate(step, system_prompt, user_prompt, temperature, max_tokens):
+                        return self.app.step_cache_service.cached_generate(
+                            step, system_prompt, user_prompt, temperature, max_tokens, limited_generate)
+
+                    tasks = {
+                        "global_summary": lambda: update_global_summary(generate, prev["global_summary"], summary, idx + 1),
+                        "char_status": lambda: generate(
+                            "char_status", "你是一个严谨的档案员，负责记录角色状态变迁。",
+                            PromptBuilder.build_char_status_update_prompt(prev["char_status"], summary, idx + 1), 0.3, 1500),
+                        "char_relations": lambda: generate(
+                            "char_relations", "你是一个关系分析师，负责梳理人物情感纠葛。",
+                            PromptBuilder.build_char_relations_update_prompt(
+                                self.app.relation_graph_service.context_for(summary, idx + 1, prev["char_relations"]),
+                                summary, idx + 1), 0.3, 1500),
+                    }
+                    results = {}
+                    workers = []
+                    for key, task in tasks.items():
+                        def work(key=key, task=task):
+                            results[key] = task()
+                        worker = threading.Thread(target=work, daemon=True)
+                        worker.start()
+                        workers.append(worker)
+                    for worker in workers:
+                        worker.join()
+                    failed = [res for res in results.values() if res.startswith("❌")]
+                    if failed:
+                        error = f"第{idx+1}章摘要链重算失败：{failed[0]}"
+                        break
+                    results = {key: value.strip() for key, value in results.items()}
+                    if all(results[key] == target["chain"][key].strip() for key in CHAIN_KEYS):
+                        print(f"[信息] 第{idx+1}章重算结果未变化，提前停止向下游传播")
+                    if run_on_ui(lambda: apply_chain(target, results)):
+                        count += 1
+                        pending_persist += 1
+                        if pending_persist >= REFRESH_PERSIST_EVERY:
+                            pending_persist = 0
+                            run_on_ui(self.app.novel_service._persist_chapters_to_novel)
+                        run_on_ui(self.app.novel_service.refresh_stale_marks)
+            except Exception as e:
+                traceback.print_exc()
+                error = str(e)
+            print(f"[信息] 过期摘要刷新结束，已更新 {count} 章" + (f"（{error}）" if error else ""))
+            self.app.root.after(0, lambda: finish(count, error))
+
+        self._refresh_thread = threading.Thread(target=refresh_thread, daemon=True)
+        self._refresh_thread.start()
+        return True
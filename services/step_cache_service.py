@@ -0,0 +1,130 @@
+"""
+定稿步骤缓存服务
+以“步骤名 + 模型 + 完整提示词”的哈希为键缓存每个定稿步骤（本章摘要、全局摘要、人物动态、人物关系）的结果。
+提示词由该步骤的全部输入（本章正文、上一章全局摘要/人物动态/人物关系等）确定，
+因此输入不变的步骤重跑时直接命中缓存，只有输入发生变化的步骤才会重新请求 AI。
+
+缓存文件：<小说目录>/step_cache.jsonl，每行一条 {"key", "step", "value", "time"}（只追加，加载时按需压缩）
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import traceback
+
+
+STEP_CACHE_FILENAME = "step_cache.jsonl"
+# 最多保留的缓存条数（按写入时间保留最新的）
+MAX_CACHE_ENTRIES = 5000
+
+
+class StepCacheService:
+    """定稿步骤缓存服务类"""
+
+    def __init__(self, app):
+        """
+        初始化缓存服务
+        Args:
+            app: NovelGeneratorApp实例
+        """
+        self.app = app
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._loaded_dir = None
+
+    def _cache_path(self):
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        return os.path.join(novel_dir, STEP_CACHE_FILENAME) if novel_dir else ""
+
+    @staticmethod
+    def make_key(step, model, system_prompt, user_prompt):
+        """根据步骤名、模型与完整提示词计算缓存键"""
+        raw = json.dumps([step, model or "", system_prompt, user_prompt], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _ensure_loaded(self):
+        """切换小说后重新加载缓存文件（调用方需持有锁）"""
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if novel_dir == self._loaded_dir:
+            return
+        self._entries = {}
+        self._loaded_dir = novel_dir
+        path = self._cache_path()
+        if not path or not os.path.exists(path):
+            return
+        line_count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                line_count += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                # 同键后写入者覆盖，保持插入顺序为最近写入顺序
+                self._entries.pop(record.get("key"), None)
+                self._entries[record.get("key")] = record
+        if line_count > len(self._entries) * 2 or len(self._entries) > MAX_CACHE_ENTRIES:
+            self._compact()
+
+    def _compact(self):
+        """只保留最新的 MAX_CACHE_ENTRIES 条并重写缓存文件（调用方需持有锁）"""
+        path = self._cache_path()
+        keep = list(self._entries.values())[-MAX_CACHE_ENTRIES:]
+        self._entries = {record["key"]: record for record in keep}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in keep:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        """读取缓存值，未命中返回 None"""
+        with self._lock:
+            self._ensure_loaded()
+            record = self._entries.get(key)
+            return record.get("value") if record else None
+
+    def put(self, key, step, value):
+        """写入缓存值"""
+        path = self._cache_path()
+        if not path:
+            return
+        try:
+            with self._lock:
+                self._ensure_loaded()
+                record = {"key": key, "step": step, "value": value, "time": time.time()}
+                self._entries.pop(key, None)
+                self._entries[key] = record
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"[警告] 写入步骤缓存失败: {e}")
+            traceback.print_exc()
+
+    def cached_generate(self, step, system_prompt, user_prompt, temperature, max_tokens, generate=None):
+        """
+        带缓存地执行一个定稿步骤
+        Args:
+            step: 步骤名（summary/global_summary/char_status/char_relations）
+            generate: 实际调用函数 f(system_prompt, user_prompt, temperature, max_tokens)，
+                      默认为 app.ai_client.generate_content
+        Returns:
+            步骤结果；失败时返回以 ❌ 开头的错误信息（失败结果不缓存）
+        """
+        model = getattr(self.app.ai_client, "model", "")
+        key = self.make_key(step, model, system_prompt, user_prompt)
+        cached = self.get(key)
+        if cached is not None:
+            print(f"[信息] 定稿步骤 {step} 输入未变化，使用缓存结果")
+            return cached
+        generate = generate or self.app.ai_client.generate_content
+        with self.app.ai_client.task(step):
+            result = generate(system_prompt, user_prompt, temperature, max_tokens)
+        if result and not result.startswith("❌"):
+            self.put(key, step, result)
+        return result
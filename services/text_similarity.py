@@ -0,0 +1,132 @@
+"""
+文本相似度工具
+中文没有天然的词边界，这里以“字二元组”（相邻两个汉字/字母数字）作为特征，
+用于伏笔回收检测、设定条目相关度排序等无需调用 AI 的轻量文本匹配。
+"""
+
+import re
+import math
+
+
+# 只保留汉字与字母数字，标点和空白作为断点
+_SEGMENT_PATTERN = re.compile(r"[一-鿿A-Za-z0-9]+")
+
+
+def char_bigrams(text):
+    """
+    提取文本的字二元组（按标点断开，英文与数字统一小写）
+    Returns:
+        [二元组, ...]，保留重复与顺序
+    """
+    grams = []
+    for segment in _SEGMENT_PATTERN.findall((text or "").lower()):
+        if len(segment) == 1:
+            grams.append(segment)
+            continue
+        grams.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return grams
+
+
+def idf(doc_count, doc_freq):
+    """平滑的逆文档频率"""
+    return math.log((doc_count + 1) / (doc_freq + 1)) + 1.0
+
+
+class TfidfIndex:
+    """
+    以字二元组为特征的稀疏 TF-IDF 索引
+    文档以 {文档键: 文本} 增量维护：只对新增或修改的文档重新分词，文档频率随之增减；
+    查询时沿倒排表一次累加所有文档的点积，再除以文档向量长度得到余弦相似度。
+    """
+
+    def __init__(self):
+        self._hashes = {}
+        # {文档键: {二元组: 词频}} 与倒排表 {二元组: {文档键: 词频}}（文档频率即倒排表长度）
+        self._tf = {}
+        self._postings = {}
+        self._norms = None
+
+    def __len__(self):
+        return len(self._tf)
+
+    def sync(self, documents):
+        """
+        与 {文档键: 文本} 同步，只处理变化的文档
+        Returns:
+            变化的文档数
+        """
+        changed = 0
+        for key in [k for k in self._tf if k not in documents]:
+            self._remove(key)
+            changed += 1
+        for key, text in documents.items():
+            text = text or ""
+            text_hash = hash(text)
+            if self._hashes.get(key) == text_hash:
+                continue
+            self._remove(key)
+            self._add(key, text, text_hash)
+            changed += 1
+        if changed:
+            self._norms = None
+        return changed
+
+    def _add(self, key, text, text_hash):
+        tf = {}
+        for gram in char_bigrams(text):
+            tf[gram] = tf.get(gram, 0) + 1
+        self._tf[key] = tf
+        self._hashes[key] = text_hash
+        for gram, count in tf.items():
+            self._postings.setdefault(gram, {})[key] = count
+
+    def _remove(self, key):
+        for gram in self._tf.pop(key, {}):
+            docs = self._postings.get(gram)
+            if docs is not None:
+                docs.pop(key, None)
+                if not docs:
+                    del self._postings[gram]
+        self._hashes.pop(key, None)
+
+    def _weight(self, gram):
+        return idf(len(self._tf), len(self._postings.get(gram, ())))
+
+    def _ensure_norms(self):
+        """文档频率变化后重算各文档向量长度"""
+        if self._norms is not None:
+            return
+        weights = {gram: self._weight(gram) for gram in self._postings}
+        self._norms = {
+            key: math.sqrt(sum((count * weights[gram]) ** 2 for gram, count in tf.items())) or 1.0
+            for key, tf in self._tf.items()
+        }
+
+    def score(self, query, keys=None):
+        """
+        计算查询文本与各文档的余弦相似度
+        Args:
+            keys: 只返回这些文档的得分；None 表示全部
+        Returns:
+            {文档键: 得分}（未出现共同特征的文档得分为 0）
+        """
+        self._ensure_norms()
+        query_tf = {}
+        for gram in char_bigrams(query):
+            if gram in self._postings:
+                query_tf[gram] = query_tf.get(gram, 0) + 1
+        wanted = set(self._tf) if keys is None else {k for k in keys if k in self._tf}
+        scores = dict.fromkeys(wanted, 0.0)
+        query_norm = 0.0
+        for gram, q_count in query_tf.items():
+            weight = self._weight(gram)
+            q_weight = q_count * weight
+            query_norm += q_weight * q_weight
+            for key, count in self._postings[gram].items():
+                if key in scores:
+                    scores[key] += q_weight * count * weight
+        if query_norm:
+            query_norm = math.sqrt(query_norm)
+            for key in scores:
+                scores[key] /= self._norms[key] * query_norm
+        return scores
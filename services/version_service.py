@@ -0,0 +1,333 @@
+"""
+章节版本历史服务
+为每个章节维护一个只追加的版本记录，正文按内容哈希去重，
+并以“相对上一版本的行级差量”方式压缩存储。
+
+目录结构（位于小说目录下）：
+    versions/
+        objects/<sha1>           版本对象（zlib 压缩的 JSON：完整正文或差量）
+        chapter_001.log          章节版本日志，每行一条 JSON 记录（只追加）
+"""
+
+import os
+import json
+import zlib
+import time
+import difflib
+import hashlib
+import threading
+import traceback
+
+
+VERSIONS_DIRNAME = "versions"
+# 差量链的最大长度，超过后强制保存完整正文，保证还原耗时有上界
+MAX_DELTA_CHAIN = 20
+# 默认保留策略
+DEFAULT_MAX_VERSIONS = 50
+DEFAULT_MAX_AGE_DAYS = 90
+# 已还原正文的缓存条数上限
+TEXT_CACHE_SIZE = 64
+
+
+class VersionService:
+    """章节版本历史服务类"""
+
+    def __init__(self, app, max_versions=DEFAULT_MAX_VERSIONS, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        """
+        初始化版本服务
+        Args:
+            app: NovelGeneratorApp实例
+            max_versions: 每章最多保留的版本数
+            max_age_days: 超过该天数的旧版本会被清理（最新版本始终保留）
+        """
+        self.app = app
+        self.max_versions = max_versions
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        # 已还原正文缓存 {sha1: text}，避免反复沿差量链回放
+        self._text_cache = {}
+        self._compaction_thread = None
+
+    # ==================== 路径与对象存储 ====================
+
+    def _versions_dir(self):
+        novel_dir = getattr(self.app, "current_novel_dir", "")
+        if not novel_dir:
+            return ""
+        return os.path.join(novel_dir, VERSIONS_DIRNAME)
+
+    def _objects_dir(self):
+        return os.path.join(self._versions_dir(), "objects")
+
+    def _log_path(self, chapter_index):
+        return os.path.join(self._versions_dir(), f"chapter_{chapter_index+1:03d}.log")
+
+    @staticmethod
+    def content_hash(text):
+        """计算正文内容哈希（内容寻址的键）"""
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _read_object(self, digest):
+        with open(os.path.join(self._objects_dir(), digest), "rb") as f:
+            return json.loads(zlib.decompress(f.read()).decode("utf-8"))
+
+    def _write_object(self, digest, obj):
+        path = os.path.join(self._objects_dir(), digest)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(zlib.compress(json.dumps(obj, ensure_ascii=False).encode("utf-8"), 6))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _make_delta(base_text, new_text):
+        """
+        生成行级差量：
+            ["=", i1, i2] 复制基准版本的第 i1~i2 行
+            ["+", [行, ...]] 插入新行
+        """
+        base_lines = base_text.split("\n")
+        new_lines = new_text.split("\n")
+        ops = []
+        matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                ops.append(["=", i1, i2])
+            elif j2 > j1:
+                ops.append(["+", new_lines[j1:j2]])
+        return ops
+
+    @staticmethod
+    def _apply_delta(base_text, ops):
+        base_lines = base_text.split("\n")
+        out = []
+        for op in ops:
+            if op[0] == "=":
+                out.extend(base_lines[op[1]:op[2]])
+            else:
+                out.extend(op[1])
+        return "\n".join(out)
+
+    def _load_text(self, digest):
+        """沿差量链还原指定哈希的正文"""
+        chain = []
+        current = digest
+        while current not in self._text_cache:
+            obj = self._read_object(current)
+            if obj.get("type") == "full":
+                self._cache_text(current, obj["text"])
+                break
+            chain.append(obj)
+            current = obj["base"]
+        # 从完整正文（或已缓存版本）开始依次回放差量
+        text = self._text_cache[current]
+        for obj in reversed(chain):
+            text = self._apply_delta(text, obj["ops"])
+        self._cache_text(digest, text)
+        return text
+
+    def _cache_text(self, digest, text):
+        if len(self._text_cache) >= TEXT_CACHE_SIZE:
+            self._text_cache.clear()
+        self._text_cache[digest] = text
+
+    # ==================== 日志读写 ====================
+
+    def list_versions(self, chapter_index):
+        """
+        列出章节的所有版本（按时间顺序）
+        Returns:
+            [{"hash", "time", "source", "size"}, ...]
+        """
+        path = self._log_path(chapter_index)
+        if not self._versions_dir() or not os.path.exists(path):
+            return []
+        entries = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # 崩溃时可能留下半行记录，忽略即可
+                    continue
+        return entries
+
+    def record_version(self, chapter_index, content, source="save"):
+        """
+        记录一个章节版本；内容与最新版本相同时不重复记录
+        Args:
+            chapter_index: 章节索引
+            content: 正文内容
+            source: 版本来源（save/before_ai/restore 等）
+        Returns:
+            新版本的哈希，未记录时返回 None
+        """
+        try:
+            if not self._versions_dir() or not content or not content.strip():
+                return None
+            with self._lock:
+                os.makedirs(self._objects_dir(), exist_ok=True)
+                digest = self.content_hash(content)
+                entries = self.list_versions(chapter_index)
+                if entries and entries[-1]["hash"] == digest:
+                    return None
+
+                # 内容寻址去重：对象已存在时只追加日志
+                if not os.path.exists(os.path.join(self._objects_dir(), digest)):
+                    base = entries[-1]["hash"] if entries else None
+                    base_depth = None
+                    if base and os.path.exists(os.path.join(self._objects_dir(), base)):
+                        base_depth = self._read_object(base).get("depth", 0)
+                    if base_depth is not None and base_depth < MAX_DELTA_CHAIN:
+                        obj = {"type": "delta", "base": base, "depth": base_depth + 1,
+                               "ops": self._make_delta(self._load_text(base), content)}
+                    else:
+                        obj = {"type": "full", "depth": 0, "text": content}
+                    self._write_object(digest, obj)
+                self._cache_text(digest, content)
+
+                entry = {"hash": digest, "time": time.time(), "source": source, "size": len(content)}
+                with open(self._log_path(chapter_index), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            print(f"[调试] 已记录第{chapter_index+1}章版本 {digest[:8]}（{source}）")
+            return digest
+        except Exception as e:
+            print(f"[警告] 记录章节版本失败: {e}")
+            traceback.print_exc()
+            return None
+
+    def get_version_text(self, digest):
+        """获取指定版本的正文"""
+        with self._lock:
+            return self._load_text(digest)
+
+    def diff_versions(self, old_digest, new_digest):
+        """生成两个版本之间的统一格式差异文本"""
+        old_text = self.get_version_text(old_digest) if old_digest else ""
+        new_text = self.get_version_text(new_digest)
+        diff = difflib.unified_diff(
+            old_text.split("\n"), new_text.split("\n"),
+            fromfile=old_digest[:8] if old_digest else "(空)",
+            tofile=new_digest[:8],
+            lineterm=""
+        )
+        return "\n".join(diff)
+
+    def restore_version(self, chapter_index, digest):
+        """
+        将章节正文恢复为指定版本（恢复前会先记录当前正文）
+        Returns:
+            恢复后的正文，失败返回 None
+        """
+        try:
+            if not (0 <= chapter_index < len(self.app.chapter_list)):
+                return None
+            current = self.app.chapter_list[chapter_index].get("content", "")
+            self.record_version(chapter_index, current, source="before_restore")
+            text = self.get_version_text(digest)
+            self.app.chapter_list[chapter_index]["content"] = text
+            self.record_version(chapter_index, text, source="restore")
+            return text
+        except Exception as e:
+            print(f"[错误] 恢复章节版本失败: {e}")
+            traceback.print_exc()
+            return None
+
+    def shift_chapters(self, index, delta):
+        """
+        章节插入或删除后移动版本日志，使历史仍对应原来的章节
+        Args:
+            index: 插入或删除的位置（章节索引）
+            delta: 1 表示在 index 处插入了一章，-1 表示删除了第 index 章（其版本日志一并删除）
+        """
+        versions_dir = self._versions_dir()
+        if not versions_dir or not os.path.isdir(versions_dir):
+            return
+        try:
+            with self._lock:
+                indices = []
+                for fname in os.listdir(versions_dir):
+                    if fname.startswith("chapter_") and fname.endswith(".log"):
+                        chapter_index = int(fname[len("chapter_"):-len(".log")]) - 1
+                        if chapter_index >= index:
+                            indices.append(chapter_index)
+                if delta < 0 and index in indices:
+                    os.remove(self._log_path(index))
+                    indices.remove(index)
+                # 插入时从后往前、删除时从前往后重命名，避免覆盖
+                for chapter_index in sorted(indices, reverse=delta > 0):
+                    os.replace(self._log_path(chapter_index), self._log_path(chapter_index + delta))
+        except Exception as e:
+            print(f"[警告] 移动章节版本日志失败: {e}")
+            traceback.print_exc()
+
+    # ==================== 保留策略与后台压缩 ====================
+
+    def _apply_retention(self, entries):
+        """按保留策略筛选日志记录（最新版本始终保留）"""
+        if not entries:
+            return entries
+        kept = entries
+        if self.max_age_days:
+            cutoff = time.time() - self.max_age_days * 86400
+            kept = [e for e in kept[:-1] if e.get("time", 0) >= cutoff] + [kept[-1]]
+        if self.max_versions and len(kept) > self.max_versions:
+            kept = kept[-self.max_versions:]
+        return kept
+
+    def compact(self):
+        """
+        压缩版本库：
+            1. 按保留策略裁剪各章节日志
+            2. 将基准已被裁剪的差量对象改写为完整正文
+            3. 删除不再被任何日志引用的对象
+        """
+        versions_dir = self._versions_dir()
+        if not versions_dir or not os.path.isdir(versions_dir):
+            return
+        with self._lock:
+            referenced = set()
+            for fname in sorted(os.listdir(versions_dir)):
+                if not (fname.startswith("chapter_") and fname.endswith(".log")):
+                    continue
+                chapter_index = int(fname[len("chapter_"):-len(".log")]) - 1
+                entries = self.list_versions(chapter_index)
+                kept = self._apply_retention(entries)
+                if len(kept) != len(entries):
+                    tmp_path = self._log_path(chapter_index) + ".tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        for e in kept:
+                            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+                    os.replace(tmp_path, self._log_path(chapter_index))
+                referenced.update(e["hash"] for e in kept)
+
+            # 保证所有被引用对象的差量基准仍然存在
+            for digest in referenced:
+                obj = self._read_object(digest)
+                if obj.get("type") == "delta" and obj["base"] not in referenced:
+                    self._write_object(digest, {"type": "full", "depth": 0, "text": self._load_text(digest)})
+
+            removed = 0
+            for digest in os.listdir(self._objects_dir()):
+                if digest not in referenced and not digest.endswith(".tmp"):
+                    os.remove(os.path.join(self._objects_dir(), digest))
+                    self._text_cache.pop(digest, None)
+                    removed += 1
+        print(f"[信息] 版本库压缩完成，清理 {removed} 个对象")
+
+    def start_background_compaction(self):
+        """在后台线程中执行版本库压缩（已有压缩任务运行时忽略）"""
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+
+        def compaction_thread():
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"[警告] 版本库压缩失败: {e}")
+                traceback.print_exc()
+
+        self._compaction_thread = threading.Thread(target=compaction_thread, daemon=True)
+        self._compaction_thread.start()
@@ -0,0 +1,35 @@
+import unittest
+
+from services.name_matcher import NameMatcher, parse_aliases
+
+
+class NameMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = NameMatcher({
+            "宁": [],
+            "宁采臣": ["宁生"],
+            "李四": [],
+            "李四娘": ["四娘"],
+        })
+
+    def test_single_char_name_only_matches_exactly(self):
+        self.assertEqual(self.matcher.resolve("宁"), "宁")
+        self.assertEqual(self.matcher.resolve("宁采臣"), "宁采臣")
+        self.assertIsNone(self.matcher.resolve("安宁"))
+
+    def test_single_char_name_not_found_in_text(self):
+        names = [name for _, _, name in self.matcher.find_all("宁静的夜里，宁生回到安宁村")]
+        self.assertEqual(names, ["宁采臣"])
+        self.assertEqual(self.matcher.count("宁静的安宁村"), {})
+
+    def test_longest_match_wins(self):
+        self.assertEqual(self.matcher.find_all("李四娘笑了"), [(0, 3, "李四娘")])
+        self.assertEqual(self.matcher.resolve("李四娘子"), "李四娘")
+
+    def test_parse_aliases_skips_single_char(self):
+        self.assertEqual(parse_aliases("别名：宁、宁生、小宁"), ["宁生", "小宁"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import configparser
+import io
+import types
+import unittest
+
+from services import chain_store
+from services.staleness_service import StalenessService
+
+
+def save_and_reload(chapter_list):
+    """按 novel.ini 的方式保存摘要与摘要链后读回"""
+    config = configparser.ConfigParser(interpolation=None)
+    config.add_section("CHAPTER_SUMMARIES")
+    for idx, chapter in enumerate(chapter_list):
+        config.set("CHAPTER_SUMMARIES", str(idx), chapter["summary"])
+    chain_store.write_chain(config, chapter_list)
+    buffer = io.StringIO()
+    config.write(buffer)
+
+    loaded = configparser.ConfigParser(interpolation=None)
+    loaded.read_string(buffer.getvalue())
+    chains = chain_store.read_chain(loaded, list(range(len(chapter_list))))
+    reloaded = []
+    for idx, chapter in enumerate(chapter_list):
+        reloaded.append(dict(chapter, summary=loaded["CHAPTER_SUMMARIES"].get(str(idx), ""), **chains[idx]))
+    return reloaded
+
+
+class StalenessServiceTest(unittest.TestCase):
+
+    def make_service(self, chapter_list):
+        return StalenessService(types.SimpleNamespace(chapter_list=chapter_list))
+
+    def test_indented_text_not_stale_after_reload(self):
+        chapters = []
+        for i in range(3):
+            chapters.append({
+                "content": f"第{i + 1}章正文",
+                "summary": f"  本章摘要{i}\n    - 缩进的要点\n",
+                "global_summary": f"全局摘要\n  第{i + 1}章：进展",
+                "char_status": "杨帆：\n    修为突破",
+                "char_relations": "  杨帆—李媛媛：同学",
+            })
+        service = self.make_service(chapters)
+        for idx in range(len(chapters)):
+            service.mark_summary_fresh(idx)
+            service.mark_chain_fresh(idx)
+        self.assertEqual(service.compute_stale(), {})
+
+        reloaded = save_and_reload(chapters)
+        self.assertNotEqual(reloaded[1]["char_status"], chapters[1]["char_status"])
+        self.assertEqual(self.make_service(reloaded).compute_stale(), {})
+
+    def test_edited_summary_is_stale(self):
+        chapters = [{"content": "正文", "summary": "摘要", "global_summary": "全局", "char_status": "", "char_relations": ""}
+                    for _ in range(2)]
+        service = self.make_service(chapters)
+        for idx in range(2):
+            service.mark_summary_fresh(idx)
+            service.mark_chain_fresh(idx)
+        chapters[0]["summary"] = "改写后的摘要"
+        self.assertEqual(service.compute_stale(), {0: "chain", 1: "upstream"})
+
+
+if __name__ == "__main__":
+    unittest.main()